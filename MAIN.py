@@ -3,13 +3,20 @@ import sys
 import math
 import time
 import random
+import uuid
+
+from spatial_hash import SpatialHash
+from dirty_rect_renderer import DirtyRectRenderer
+from text_cache import get_font, CachedLabel
+from persistence_queue import PersistenceWorker
+from local_store import LocalStore, SyncEngine
+from pixel_art_system import PixelArtSprite, ParticleEffect, AnimatedBackground, particle_pool
 
 # Импорты для работы с базой данных
 try:
     from database_manager import DatabaseManager
     from auth_screen import AuthScreen
     from achievement_notification import NotificationManager
-    from pixel_art_system import PixelArtSprite, ParticleEffect, AnimatedBackground
 
     DB_AVAILABLE = True
 except ImportError:
@@ -27,9 +34,6 @@ except ImportError:
 
         def draw(self, *args, **kwargs): pass
 
-# Инициализация Pygame
-pygame.init()
-
 # Константы
 SCREEN_WIDTH = 835
 SCREEN_HEIGHT = 700
@@ -53,6 +57,16 @@ GRAVITY = 0.8
 JUMP_POWER = -15
 PLAYER_SPEED = 5
 
+# Масштаб спрайтов по слоям глубины
+LAYER_SCALES = {"front": 1.0, "back": 0.6}
+
+
+def nearby(spatial, sprites, rect, depth_layer, kind):
+    """Кандидаты на столкновение: из пространственного индекса или перебором группы"""
+    if spatial is not None:
+        return spatial.query(rect, depth_layer, kind)
+    return [sprite for sprite in sprites if sprite.depth_layer == depth_layer]
+
 
 class Player(pygame.sprite.Sprite):
     # Загрузка спрайтов один раз для всех игроков
@@ -61,6 +75,7 @@ class Player(pygame.sprite.Sprite):
     _static_left = None  # 37x59
     _jump_right = None  # 41x62
     _jump_left = None  # 41x62
+    _variants = {}  # (поза, смотрит вправо, слой) -> готовый масштабированный спрайт
 
     @classmethod
     def load_sprites(cls):
@@ -71,6 +86,7 @@ class Player(pygame.sprite.Sprite):
                 cls._static_left = pygame.image.load('Images/static_left.png').convert_alpha()
                 cls._jump_right = pygame.image.load('Images/jump_right.png').convert_alpha()
                 cls._jump_left = pygame.image.load('Images/jump_left.png').convert_alpha()
+                cls.build_variants()
                 print("Mario sprites loaded successfully")
                 cls._sprites_loaded = True
             except Exception as e:
@@ -78,6 +94,21 @@ class Player(pygame.sprite.Sprite):
                 print("  Using fallback sprite")
                 cls._sprites_loaded = False
 
+    @classmethod
+    def build_variants(cls):
+        """Заранее отмасштабировать все позы x направления x слои"""
+        poses = {
+            'static': (cls._static_right, cls._static_left, 37, 59),  # Оригинальный размер
+            'jump': (cls._jump_right, cls._jump_left, 41, 62)
+        }
+        cls._variants = {}
+        for pose, (right, left, sprite_width, sprite_height) in poses.items():
+            for facing_right, sprite in ((True, right), (False, left)):
+                for layer, scale in LAYER_SCALES.items():
+                    size = (int(sprite_width * scale), int(sprite_height * scale))
+                    cls._variants[(pose, facing_right, layer)] = \
+                        pygame.transform.scale(sprite, size).convert_alpha()
+
     def __init__(self, x, y):
         super().__init__()
 
@@ -108,6 +139,7 @@ class Player(pygame.sprite.Sprite):
         self.holding_shell = None
         self.teleport_cooldown = 0
         self.facing_right = True  # Направление взгляда
+        self.sprite_key = None  # Текущий вариант спрайта
 
         # Обновляем спрайт
         self.update_sprite()
@@ -126,42 +158,26 @@ class Player(pygame.sprite.Sprite):
             self.image = self.pixel_sprite
             return
 
-        # Выбираем спрайт (размеры увеличены в 1.5 раза)
-        if self.on_ground:
-            # Стоит на земле
-            sprite = Player._static_right if self.facing_right else Player._static_left
-            sprite_width = 37  # Оригинальный размер
-            sprite_height = 59  # Оригинальный размер
-        else:
-            # В прыжке
-            sprite = Player._jump_right if self.facing_right else Player._jump_left
-            sprite_width = 41  # Оригинальный размер
-            sprite_height = 62  # Оригинальный размер
-
-        # Масштабируем для заднего плана
-        if self.depth_layer == "back":
-            scaled_width = int(sprite_width * 0.6)
-            scaled_height = int(sprite_height * 0.6)
-        else:
-            scaled_width = sprite_width
-            scaled_height = sprite_height
+        # Выбираем готовый вариант: поза (на земле / в прыжке), направление, слой
+        key = ('static' if self.on_ground else 'jump', self.facing_right, self.depth_layer)
+        if key == self.sprite_key:
+            return  # Ничего не изменилось
+        self.sprite_key = key
 
         # Сохраняем старый центр
         old_centerx = self.rect.centerx
         old_bottom = self.rect.bottom
 
-        # Создаём спрайт
-        self.pixel_sprite = pygame.transform.scale(sprite, (scaled_width, scaled_height))
+        self.pixel_sprite = Player._variants[key]
         self.image = self.pixel_sprite  # ВАЖНО!
-        self.width = scaled_width
-        self.height = scaled_height
+        self.width, self.height = self.pixel_sprite.get_size()
 
         # Обновляем rect с сохранением позиции
         self.rect = self.pixel_sprite.get_rect()
         self.rect.centerx = old_centerx
         self.rect.bottom = old_bottom
 
-    def update(self, platforms, pipes):
+    def update(self, platforms, pipes, spatial=None):
         keys = pygame.key.get_pressed()
 
         # Уменьшаем cooldown телепортации
@@ -206,31 +222,29 @@ class Player(pygame.sprite.Sprite):
 
         # Коллизия с платформами
         self.on_ground = False
-        for platform in platforms:
-            if platform.depth_layer == self.depth_layer:
-                if self.rect.colliderect(platform.rect):
-                    # Столкновение сверху
-                    if self.vel_y > 0 and self.rect.bottom <= platform.rect.top + 20:
-                        self.rect.bottom = platform.rect.top
-                        self.vel_y = 0
-                        self.on_ground = True
-                    # Столкновение снизу
-                    elif self.vel_y < 0 and self.rect.top >= platform.rect.bottom - 20:
-                        self.rect.top = platform.rect.bottom
-                        self.vel_y = 0
+        for platform in nearby(spatial, platforms, self.rect, self.depth_layer, "platform"):
+            if self.rect.colliderect(platform.rect):
+                # Столкновение сверху
+                if self.vel_y > 0 and self.rect.bottom <= platform.rect.top + 20:
+                    self.rect.bottom = platform.rect.top
+                    self.vel_y = 0
+                    self.on_ground = True
+                # Столкновение снизу
+                elif self.vel_y < 0 and self.rect.top >= platform.rect.bottom - 20:
+                    self.rect.top = platform.rect.bottom
+                    self.vel_y = 0
 
         # Проверка труб (порталов)
-        for pipe in pipes:
-            if pipe.depth_layer == self.depth_layer:
-                if self.rect.colliderect(pipe.rect) and self.teleport_cooldown == 0:
-                    # Автоматическая телепортация при касании трубы
-                    if pipe.target:
-                        # Телепортируем на ФИКСИРОВАННЫЕ координаты
-                        self.rect.centerx = pipe.target.teleport_x
-                        self.rect.bottom = pipe.target.teleport_y
+        for pipe in nearby(spatial, pipes, self.rect, self.depth_layer, "pipe"):
+            if self.rect.colliderect(pipe.rect) and self.teleport_cooldown == 0:
+                # Автоматическая телепортация при касании трубы
+                if pipe.target:
+                    # Телепортируем на ФИКСИРОВАННЫЕ координаты
+                    self.rect.centerx = pipe.target.teleport_x
+                    self.rect.bottom = pipe.target.teleport_y
 
-                        self.change_layer(pipe.target.depth_layer)
-                        self.teleport_cooldown = 30  # Защита от повторной телепортации (0.5 секунды)
+                    self.change_layer(pipe.target.depth_layer)
+                    self.teleport_cooldown = 30  # Защита от повторной телепортации (0.5 секунды)
 
         # Падение за пределы экрана
         if self.rect.top > SCREEN_HEIGHT:
@@ -251,6 +265,7 @@ class Player(pygame.sprite.Sprite):
         self.image = pygame.Surface((self.size, self.size))
         self.image.fill(YELLOW)
         self.rect = self.image.get_rect()
+        self.sprite_key = None  # rect пересоздан - спрайт нужно применить заново
         self.update_sprite()  # Обновляем спрайт после смены слоя
         self.rect.center = old_center
 
@@ -391,6 +406,7 @@ class Enemy(pygame.sprite.Sprite):
     _thorn_left = None  # 26x23
     _thorn_shell = None  # 18x12
     _ghost = None  # 16x18
+    _variants = {}  # (тип, смотрит вправо, слой) -> готовый масштабированный спрайт
 
     @classmethod
     def load_sprites(cls):
@@ -404,6 +420,7 @@ class Enemy(pygame.sprite.Sprite):
                 cls._thorn_left = pygame.image.load('Images/thorn_left.png').convert_alpha()
                 cls._thorn_shell = pygame.image.load('Images/thorn_shell.png').convert_alpha()
                 cls._ghost = pygame.image.load('Images/ghost.png').convert_alpha()
+                cls.build_variants()
                 print("Enemy sprites loaded successfully")
                 cls._sprites_loaded = True
             except Exception as e:
@@ -411,6 +428,26 @@ class Enemy(pygame.sprite.Sprite):
                 print("  Using fallback sprites")
                 cls._sprites_loaded = False
 
+    @classmethod
+    def build_variants(cls):
+        """Заранее отмасштабировать все типы x направления x слои"""
+        # Размеры увеличены в 1.7 раза
+        enemy_types = {
+            'turtle': (cls._turtle_right, cls._turtle_left, int(26 * 1.7), int(15 * 1.7)),  # 44x25
+            'spike_turtle': (cls._thorn_right, cls._thorn_left, int(26 * 1.7), int(23 * 1.7)),  # 44x39
+            'ghost': (cls._ghost, cls._ghost, int(16 * 1.7), int(18 * 1.7)),  # 27x30
+            'default': (cls._turtle_right, cls._turtle_right, 26, 15)  # Неизвестный тип
+        }
+        cls._variants = {}
+        for enemy_type, (right, left, sprite_width, sprite_height) in enemy_types.items():
+            for layer, scale in LAYER_SCALES.items():
+                size = (int(sprite_width * scale), int(sprite_height * scale))
+                right_sprite = pygame.transform.scale(right, size).convert_alpha()
+                # У призрака одна картинка на оба направления
+                left_sprite = right_sprite if left is right else pygame.transform.scale(left, size).convert_alpha()
+                cls._variants[(enemy_type, True, layer)] = right_sprite
+                cls._variants[(enemy_type, False, layer)] = left_sprite
+
     def __init__(self, x, y, depth_layer, enemy_type="turtle", stay_on_platform=False):
         super().__init__()
 
@@ -461,6 +498,7 @@ class Enemy(pygame.sprite.Sprite):
         self.teleport_cooldown = 0
         self.platform_switches = 0
         self.want_teleport = False
+        self.sprite_key = None  # Текущий вариант спрайта
 
         # Обновляем спрайт
         self.update_sprite()
@@ -494,48 +532,30 @@ class Enemy(pygame.sprite.Sprite):
             self._debug_printed = True
 
         if not Enemy._sprites_loaded:
-            # Fallback
-            # Обновляем спрайт
-            self.update_sprite()
+            # Fallback - draw() рисует квадрат с глазами
+            self.pixel_sprite = None
             return
 
-        # Выбираем спрайт (размеры увеличены в 1.7 раза)
-        if self.enemy_type == "turtle":
-            sprite = Enemy._turtle_right if self.direction > 0 else Enemy._turtle_left
-            sprite_width, sprite_height = int(26 * 1.7), int(15 * 1.7)  # 44x25
-        elif self.enemy_type == "spike_turtle":
-            sprite = Enemy._thorn_right if self.direction > 0 else Enemy._thorn_left
-            sprite_width, sprite_height = int(26 * 1.7), int(23 * 1.7)  # 44x39
-        elif self.enemy_type == "ghost":
-            sprite = Enemy._ghost
-            sprite_width, sprite_height = int(16 * 1.7), int(18 * 1.7)  # 27x30
-        else:
-            sprite = Enemy._turtle_right
-            sprite_width, sprite_height = 26, 15
-
-        # Масштабируем для заднего плана
-        if self.depth_layer == "back":
-            scaled_width = int(sprite_width * 0.6)
-            scaled_height = int(sprite_height * 0.6)
-        else:
-            scaled_width = sprite_width
-            scaled_height = sprite_height
+        # Выбираем готовый вариант: тип, направление, слой
+        enemy_type = self.enemy_type if self.enemy_type in ("turtle", "spike_turtle", "ghost") else "default"
+        key = (enemy_type, self.direction > 0, self.depth_layer)
+        if key == self.sprite_key:
+            return  # Ничего не изменилось
+        self.sprite_key = key
 
         # Сохраняем позицию
         old_centerx = self.rect.centerx
         old_centery = self.rect.centery
 
-        # Создаём спрайт
-        self.pixel_sprite = pygame.transform.scale(sprite, (scaled_width, scaled_height))
-        self.width = scaled_width
-        self.height = scaled_height
+        self.pixel_sprite = Enemy._variants[key]
+        self.width, self.height = self.pixel_sprite.get_size()
 
         # Обновляем rect
         self.rect = self.pixel_sprite.get_rect()
         self.rect.centerx = old_centerx
         self.rect.centery = old_centery
 
-    def update(self, platforms, pipes, projectiles_group, player=None):
+    def update(self, platforms, pipes, projectiles_group, player=None, spatial=None):
         # Уменьшаем cooldown телепортации
         if self.teleport_cooldown > 0:
             self.teleport_cooldown -= 1
@@ -549,9 +569,11 @@ class Enemy(pygame.sprite.Sprite):
             self.time_since_portal_check += 1
             if self.time_since_portal_check >= self.portal_check_interval:
                 self.time_since_portal_check = 0
-                # Ищем ближайший портал на нашем плане
-                for pipe in pipes:
-                    if pipe.depth_layer == self.depth_layer and pipe.target:
+                # Ищем ближайший портал на нашем плане (центр в пределах 80 пикселей)
+                search_rect = pygame.Rect(0, 0, 160, 160)
+                search_rect.center = self.rect.center
+                for pipe in nearby(spatial, pipes, search_rect, self.depth_layer, "pipe"):
+                    if pipe.target:
                         dx = abs(pipe.rect.centerx - self.rect.centerx)
                         dy = abs(pipe.rect.centery - self.rect.centery)
                         # Если портал рядом (в пределах 80 пикселей)
@@ -610,15 +632,14 @@ class Enemy(pygame.sprite.Sprite):
             # Коллизия с платформами
             on_platform = False
             current_platform = None
-            for platform in platforms:
-                if platform.depth_layer == self.depth_layer:
-                    if self.rect.colliderect(platform.rect):
-                        if self.vel_y > 0:
-                            self.rect.bottom = platform.rect.top
-                            self.vel_y = 0
-                            on_platform = True
-                            current_platform = platform
-                            break
+            for platform in nearby(spatial, platforms, self.rect, self.depth_layer, "platform"):
+                if self.rect.colliderect(platform.rect):
+                    if self.vel_y > 0:
+                        self.rect.bottom = platform.rect.top
+                        self.vel_y = 0
+                        on_platform = True
+                        current_platform = platform
+                        break
 
             # ПРОСТАЯ ЛОГИКА: дошел до края - развернулся
             if on_platform and current_platform:
@@ -632,39 +653,38 @@ class Enemy(pygame.sprite.Sprite):
 
             # Телепортация через порталы (только если враг не привязан к платформе)
             if self.teleport_cooldown == 0 and not self.stay_on_platform:
-                for pipe in pipes:
-                    if pipe.depth_layer == self.depth_layer:
-                        if self.rect.colliderect(pipe.rect) and pipe.target:
-                            # DEBUG: Отслеживание телепортации
-                            old_pos = (self.rect.centerx, self.rect.bottom)
-                            old_layer = self.depth_layer
+                for pipe in nearby(spatial, pipes, self.rect, self.depth_layer, "pipe"):
+                    if self.rect.colliderect(pipe.rect) and pipe.target:
+                        # DEBUG: Отслеживание телепортации
+                        old_pos = (self.rect.centerx, self.rect.bottom)
+                        old_layer = self.depth_layer
 
-                            print(f"[TELEPORT] Enemy {self.enemy_type} entering pipe at {old_pos}, layer={old_layer}")
+                        print(f"[TELEPORT] Enemy {self.enemy_type} entering pipe at {old_pos}, layer={old_layer}")
 
-                            # Телепортируем на ФИКСИРОВАННЫЕ координаты
-                            self.rect.centerx = pipe.target.teleport_x
-                            self.rect.bottom = pipe.target.teleport_y
+                        # Телепортируем на ФИКСИРОВАННЫЕ координаты
+                        self.rect.centerx = pipe.target.teleport_x
+                        self.rect.bottom = pipe.target.teleport_y
 
-                            print(f"[TELEPORT] Teleported to FIXED coords: x={self.rect.centerx}, y={self.rect.bottom}")
+                        print(f"[TELEPORT] Teleported to FIXED coords: x={self.rect.centerx}, y={self.rect.bottom}")
 
-                            self.vel_y = 0
+                        self.vel_y = 0
 
-                            new_pos = (self.rect.centerx, self.rect.bottom)
-                            new_layer = pipe.target.depth_layer
+                        new_pos = (self.rect.centerx, self.rect.bottom)
+                        new_layer = pipe.target.depth_layer
 
-                            print(f"[TELEPORT] Enemy teleported to {new_pos}, new_layer={new_layer}")
-                            print(f"[TELEPORT] Target pipe at ({pipe.target.rect.centerx}, {pipe.target.rect.top})")
+                        print(f"[TELEPORT] Enemy teleported to {new_pos}, new_layer={new_layer}")
+                        print(f"[TELEPORT] Target pipe at ({pipe.target.rect.centerx}, {pipe.target.rect.top})")
 
-                            # МЕНЯЕМ НАПРАВЛЕНИЕ ПЕРЕД сменой слоя
-                            self.direction *= -1
-                            print(f"[TELEPORT] Direction changed to {self.direction}")
+                        # МЕНЯЕМ НАПРАВЛЕНИЕ ПЕРЕД сменой слоя
+                        self.direction *= -1
+                        print(f"[TELEPORT] Direction changed to {self.direction}")
 
-                            self.change_layer(pipe.target.depth_layer)
-                            self.update_sprite()  # Обновляем спрайт после смены направления
-                            self.teleport_cooldown = 30
+                        self.change_layer(pipe.target.depth_layer)
+                        self.update_sprite()  # Обновляем спрайт после смены направления
+                        self.teleport_cooldown = 30
 
-                            print(f"[TELEPORT] Enemy alive={self.alive}, in groups={self.groups()}")
-                            break
+                        print(f"[TELEPORT] Enemy alive={self.alive}, in groups={self.groups()}")
+                        break
 
             # Стрельба для черепах с шипами
             if self.enemy_type == "spike_turtle" and player:
@@ -759,7 +779,7 @@ class Projectile(pygame.sprite.Sprite):
 
         self.teleport_cooldown = 0
 
-    def update(self, platforms, pipes):
+    def update(self, platforms, pipes, spatial=None):
         """Обновление снаряда"""
         # Уменьшаем cooldown телепортации
         if self.teleport_cooldown > 0:
@@ -771,26 +791,25 @@ class Projectile(pygame.sprite.Sprite):
 
         # Телепортация через порталы (только для НЕ-призрачных пуль)
         if self.teleport_cooldown == 0 and not self.from_ghost:
-            for pipe in pipes:
-                if pipe.depth_layer == self.depth_layer:
-                    if self.rect.colliderect(pipe.rect) and pipe.target:
-                        # Телепортируем снаряд на фиксированные координаты
-                        self.rect.centerx = pipe.target.teleport_x
-                        self.rect.centery = pipe.target.teleport_y - 50
-
-                        # Меняем слой
-                        self.depth_layer = pipe.target.depth_layer
-                        self.vel_x = -self.vel_x
-                        # Обновляем размер для нового слоя
-                        if self.depth_layer == "back":
-                            self.size = 8
-                            self.vel_x *= 0.6 if self.vel_x != 0 else 1
-                        else:
-                            self.size = 12
-                            self.vel_x /= 0.6 if self.vel_x != 0 else 1
+            for pipe in nearby(spatial, pipes, self.rect, self.depth_layer, "pipe"):
+                if self.rect.colliderect(pipe.rect) and pipe.target:
+                    # Телепортируем снаряд на фиксированные координаты
+                    self.rect.centerx = pipe.target.teleport_x
+                    self.rect.centery = pipe.target.teleport_y - 50
+
+                    # Меняем слой
+                    self.depth_layer = pipe.target.depth_layer
+                    self.vel_x = -self.vel_x
+                    # Обновляем размер для нового слоя
+                    if self.depth_layer == "back":
+                        self.size = 8
+                        self.vel_x *= 0.6 if self.vel_x != 0 else 1
+                    else:
+                        self.size = 12
+                        self.vel_x /= 0.6 if self.vel_x != 0 else 1
 
-                        self.teleport_cooldown = 30
-                        break
+                    self.teleport_cooldown = 30
+                    break
 
         # Удаление за границами экрана
         if (self.rect.right < -50 or self.rect.left > SCREEN_WIDTH + 50 or
@@ -801,6 +820,26 @@ class Projectile(pygame.sprite.Sprite):
 class Shell(pygame.sprite.Sprite):
     # Спрайты панцирей (используются из Enemy)
     _sprites_loaded = False
+    _load_attempted = False  # Картинки Enemy не загрузились - больше не пробуем
+    _variants = {}  # (тип панциря, слой) -> готовый масштабированный спрайт
+
+    @classmethod
+    def load_sprites(cls):
+        """Подготовить спрайты панцирей один раз (из картинок Enemy)"""
+        if not cls._sprites_loaded and not cls._load_attempted:
+            cls._load_attempted = True
+            Enemy.load_sprites()
+            if not Enemy._sprites_loaded or Enemy._shell is None:
+                return
+
+            # Увеличиваем размер в 1.7 раза
+            base_width, base_height = int(18 * 1.7), int(12 * 1.7)  # 30x20
+            cls._variants = {}
+            for shell_type, sprite in (("normal", Enemy._shell), ("spike", Enemy._thorn_shell)):
+                for layer, scale in LAYER_SCALES.items():
+                    size = (int(base_width * scale), int(base_height * scale))
+                    cls._variants[(shell_type, layer)] = pygame.transform.scale(sprite, size).convert_alpha()
+            cls._sprites_loaded = True
 
     def __init__(self, x, y, depth_layer, shell_type="normal"):
         super().__init__()
@@ -839,35 +878,20 @@ class Shell(pygame.sprite.Sprite):
 
     def update_sprite(self):
         """Обновить спрайт панциря"""
-        # Сначала загружаем спрайты врагов если не загружены
-        if not hasattr(Enemy, '_sprites_loaded'):
-            Enemy.load_sprites()
+        # Сначала готовим спрайты панцирей если ещё не готовы
+        Shell.load_sprites()
 
         # Проверяем что спрайты загружены
-        if not Enemy._sprites_loaded or Enemy._shell is None:
+        if not Shell._sprites_loaded:
             # Fallback - коричневый прямоугольник
             self.pixel_sprite = pygame.Surface((self.width, self.height))
             self.pixel_sprite.fill(BROWN if self.shell_type == "normal" else DARK_RED)
             self.image = self.pixel_sprite
             return
 
-        # Выбираем спрайт панциря
-        if self.shell_type == "spike":
-            sprite = Enemy._thorn_shell
-        else:
-            sprite = Enemy._shell
-
-        # Увеличиваем размер в 1.7 раза
-        scaled_width = int(18 * 1.7)  # 30
-        scaled_height = int(12 * 1.7)  # 20
-
-        # Учитываем depth_layer
-        if self.depth_layer == "back":
-            scaled_width = int(scaled_width * 0.6)
-            scaled_height = int(scaled_height * 0.6)
-
-        # Масштабируем
-        self.pixel_sprite = pygame.transform.scale(sprite, (scaled_width, scaled_height))
+        # Выбираем готовый спрайт панциря под слой
+        shell_type = "spike" if self.shell_type == "spike" else "normal"
+        self.pixel_sprite = Shell._variants[(shell_type, self.depth_layer)]
         self.image = self.pixel_sprite  # ВАЖНО!
 
     def update(self, platforms, pipes=None):
@@ -971,7 +995,7 @@ class Shell(pygame.sprite.Sprite):
         # Обновляем спрайт
         self.update_sprite()
 
-    def update(self, platforms, pipes):
+    def update(self, platforms, pipes, spatial=None):
         self.lifetime -= 1
         if self.lifetime <= 0:
             self.kill()
@@ -987,21 +1011,21 @@ class Shell(pygame.sprite.Sprite):
             self.rect.y += self.vel_y
 
             # Коллизия с платформами (только для пуль черепах)
-            for platform in platforms:
-                if platform.depth_layer == self.depth_layer:
-                    if self.rect.colliderect(platform.rect):
-                        if self.vel_y > 0:
-                            self.rect.bottom = platform.rect.top
-                            self.vel_y = 0
+            for platform in nearby(spatial, platforms, self.rect, self.depth_layer, "platform"):
+                if self.rect.colliderect(platform.rect):
+                    if self.vel_y > 0:
+                        self.rect.bottom = platform.rect.top
+                        self.vel_y = 0
 
             # Проход через трубы (только для пуль черепах)
-            for pipe in pipes:
-                if pipe.depth_layer == self.depth_layer:
-                    if self.rect.colliderect(pipe.rect) and pipe.target:
-                        # Телепортация на фиксированные координаты
-                        self.rect.centerx = pipe.target.teleport_x
-                        self.rect.centery = pipe.target.teleport_y - 50  # Чуть выше точки телепортации
-                        self.change_layer(pipe.target.depth_layer)
+            for pipe in nearby(spatial, pipes, self.rect, self.depth_layer, "pipe"):
+                if self.rect.colliderect(pipe.rect) and pipe.target:
+                    # Телепортация на фиксированные координаты
+                    self.rect.centerx = pipe.target.teleport_x
+                    self.rect.centery = pipe.target.teleport_y - 50  # Чуть выше точки телепортации
+                    self.change_layer(pipe.target.depth_layer)
+                    # Кандидаты выбраны для старого слоя - дальше не проверяем
+                    break
 
         if self.rect.top > SCREEN_HEIGHT or self.rect.left < 0 or self.rect.right > SCREEN_WIDTH:
             self.kill()
@@ -1038,19 +1062,133 @@ class ExitPortal(pygame.sprite.Sprite):
             pygame.draw.circle(screen, (color_val, color_val, 0), self.rect.center, radius, 3)
 
 
+class DrawTimer:
+    """Замер времени отрисовки по меткам (для сравнения режимов рендера)"""
+
+    def __init__(self):
+        self.totals = {}  # label -> [суммарное время, количество кадров]
+
+    def add(self, label, seconds):
+        entry = self.totals.setdefault(label, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def average_ms(self, label):
+        total, frames = self.totals.get(label, (0.0, 0))
+        return total / frames * 1000 if frames else 0.0
+
+    def report(self):
+        """Вывести среднее время по всем меткам"""
+        for label, (total, frames) in self.totals.items():
+            print(f"  {label}: {self.average_ms(label):.3f} ms/frame ({frames} frames)")
+
+
+class StaticLayers:
+    """
+    Запечённая статичная геометрия уровня: платформы и трубы каждого плана
+    рисуются один раз в отдельную поверхность размером с экран
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.layers = {}  # depth_layer -> Surface
+        self.signature = None
+        self.bake_count = 0
+
+    @staticmethod
+    def geometry_signature(platforms, pipes):
+        """Отпечаток геометрии: меняется при добавлении/перемещении платформ и труб"""
+        return (tuple((p.depth_layer, tuple(p.rect)) for p in platforms),
+                tuple((p.depth_layer, tuple(p.rect), id(p.image)) for p in pipes))
+
+    @staticmethod
+    def draw_geometry(surface, platforms, pipes, depth_layer):
+        """Отрисовать платформы и трубы одного плана (без запекания)"""
+        is_front = depth_layer == "front"
+        outline_color = (30, 60, 150) if is_front else (150, 30, 30)
+        outline_width = 3 if is_front else 2
+
+        for platform in platforms:
+            if platform.depth_layer == depth_layer:
+                sprite = PixelArtSprite.create_platform_sprite(platform.rect.width, platform.rect.height, is_front)
+                surface.blit(sprite, platform.rect)
+                pygame.draw.rect(surface, outline_color, platform.rect, outline_width)
+
+        for pipe in pipes:
+            if pipe.depth_layer == depth_layer:
+                surface.blit(pipe.image, pipe.rect)
+
+    def invalidate(self):
+        """Сбросить запечённые слои (пересоберутся при следующей отрисовке)"""
+        self.layers = {}
+        self.signature = None
+
+    def bake(self, platforms, pipes):
+        """Запечь оба плана"""
+        self.layers = {}
+        for depth_layer in ("back", "front"):
+            layer = pygame.Surface((self.width, self.height), pygame.SRCALPHA).convert_alpha()
+            self.draw_geometry(layer, platforms, pipes, depth_layer)
+            self.layers[depth_layer] = layer
+        self.signature = self.geometry_signature(platforms, pipes)
+        self.bake_count += 1
+
+    def draw(self, screen, platforms, pipes, depth_layer, rects=None):
+        """
+        Отрисовать запечённый план, пересобрав его при изменении геометрии.
+        rects - восстановить только эти области (режим dirty rects)
+        """
+        if self.geometry_signature(platforms, pipes) != self.signature:
+            self.bake(platforms, pipes)
+        layer = self.layers[depth_layer]
+        if rects is None:
+            screen.blit(layer, (0, 0))
+        else:
+            for rect in rects:
+                screen.blit(layer, rect, rect)
+
+
 class Game:
-    def __init__(self, user_data=None, db_manager=None):
+    def __init__(self, user_data=None, db_manager=None, dirty_rects=False, local_store=None):
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         pygame.display.set_caption("Mario Clash - Прототип")
         self.clock = pygame.time.Clock()
-        self.font = pygame.font.Font(None, 36)
-        self.small_font = pygame.font.Font(None, 24)
+        self.font = get_font(36)
+        self.small_font = get_font(24)
+
+        # Надписи HUD перерисовываются только при изменении значения
+        self.hud_labels = {
+            'lives': CachedLabel(self.font, BLACK),
+            'level': CachedLabel(self.font, BLACK),
+            'enemies': CachedLabel(self.small_font, BLACK),
+            'username': CachedLabel(self.small_font, BLUE),
+            'time': CachedLabel(self.small_font, BLACK),
+            'kills': CachedLabel(self.small_font, BLACK),
+            'score': CachedLabel(self.small_font, GREEN),
+            'controls': CachedLabel(self.small_font, BLACK)
+        }
 
         # Данные пользователя и БД
         self.user_data = user_data
         self.db = db_manager
         self.user_id = user_data['user_id'] if user_data else None
 
+        # Запись в БД в фоновом потоке: игровой цикл только ставит события в очередь.
+        # С локальным журналом события сначала пишутся в SQLite и доживают до появления сети
+        if local_store and self.user_id:
+            self.persistence = SyncEngine(local_store, db=self.db,
+                                          db_factory=None if self.db else DatabaseManager)
+        elif self.db:
+            self.persistence = PersistenceWorker(self.db)
+        else:
+            self.persistence = None
+
+        # Игровая сессия (записывается при выходе)
+        self.session_id = uuid.uuid4().hex
+        self.session_started = time.time()
+        self.session_levels_completed = 0
+
         # Статистика текущего уровня
         self.level_start_time = 0
         self.enemies_killed = {'turtle': 0, 'spike_turtle': 0}
@@ -1061,6 +1199,18 @@ class Game:
         # Анимированный фон и частицы
         self.background = AnimatedBackground(SCREEN_WIDTH, SCREEN_HEIGHT)
         self.particle_effects = []
+        particle_pool.clear()
+
+        # Запечённая статичная геометрия (F3 - переключить режим для замеров)
+        self.static_layers = StaticLayers(SCREEN_WIDTH, SCREEN_HEIGHT)
+        self.bake_static_geometry = True
+        self.draw_timer = DrawTimer()
+
+        # Пространственный индекс для коллизий (по слоям глубины)
+        self.spatial = SpatialHash(cell_size=64)
+
+        # Режим dirty rects: на экран выводятся только изменившиеся области
+        self.dirty_renderer = DirtyRectRenderer(self.screen) if dirty_rects else None
 
         # Счётчики для достижений
         self.total_enemies_killed = 0
@@ -1101,6 +1251,7 @@ class Game:
         # Анимированный фон и частицы
         self.background = AnimatedBackground(SCREEN_WIDTH, SCREEN_HEIGHT)
         self.particle_effects = []
+        particle_pool.clear()
 
         # Счётчики для достижений
         self.total_enemies_killed = 0
@@ -1211,6 +1362,18 @@ class Game:
             pipe_4a, pipe_4b
         )
 
+        # Геометрия уровня поменялась - слои нужно запечь заново
+        self.static_layers.invalidate()
+        if self.dirty_renderer:
+            self.dirty_renderer.invalidate()
+
+        # Пространственный индекс: статичная геометрия добавляется один раз на уровень
+        self.spatial.clear_static()
+        for platform in self.platforms:
+            self.spatial.insert_static(platform, "platform")
+        for pipe in self.pipes:
+            self.spatial.insert_static(pipe, "pipe")
+
         # Создание врагов в зависимости от уровня
         if level == 1:
             # Уровень 1: только обычные черепахи
@@ -1254,69 +1417,77 @@ class Game:
             self.enemies.add(Enemy(415, 290, "back", "spike_turtle", stay_on_platform=True))  # Центр
 
     def check_collisions(self):
+        # Перераскладываем движущиеся объекты по клеткам индекса
+        self.spatial.rebuild_dynamic({
+            "enemy": self.enemies,
+            "shell": self.shells,
+            "projectile": self.projectiles
+        })
+
         # Столкновение игрока с врагами
-        for enemy in self.enemies:
-            if enemy.depth_layer == self.player.depth_layer:
-                if self.player.rect.colliderect(enemy.rect):
-                    # Проверка прыжка на врага
-                    # Игрок должен падать сверху и его центр должен быть выше врага
-                    if self.player.vel_y > 0 and self.player.rect.centery < enemy.rect.centery:
-                        if enemy.enemy_type == "turtle":
-                            # Убиваем черепаху, создаем панцирь
-                            shell = Shell(enemy.rect.x, enemy.rect.y, enemy.depth_layer)
-                            self.shells.add(shell)
-                            enemy.kill()
-                            self.player.vel_y = -8
-                            # Частицы
-                            self.particle_effects.append(
-                                ParticleEffect(enemy.rect.centerx, enemy.rect.centery, (50, 200, 50), 15))  # Отскок
-                            # Подсчет убитых врагов
-                            self.enemies_killed['turtle'] += 1
-                            self.total_enemies_killed += 1
-                            self.score += 100  # +100 за убийство
-                        elif enemy.enemy_type == "spike_turtle":
-                            # Нельзя прыгнуть на черепаху с шипами
-                            self.player.take_damage()
+        for enemy in self.spatial.query(self.player.rect, self.player.depth_layer, "enemy"):
+            if self.player.rect.colliderect(enemy.rect):
+                # Проверка прыжка на врага
+                # Игрок должен падать сверху и его центр должен быть выше врага
+                if self.player.vel_y > 0 and self.player.rect.centery < enemy.rect.centery:
+                    if enemy.enemy_type == "turtle":
+                        # Убиваем черепаху, создаем панцирь
+                        shell = Shell(enemy.rect.x, enemy.rect.y, enemy.depth_layer)
+                        self.shells.add(shell)
+                        enemy.kill()
+                        self.player.vel_y = -8
+                        # Частицы
+                        self.particle_effects.append(
+                            ParticleEffect(enemy.rect.centerx, enemy.rect.centery, (50, 200, 50), 15))  # Отскок
+                        # Подсчет убитых врагов
+                        self.enemies_killed['turtle'] += 1
+                        self.total_enemies_killed += 1
+                        self.score += 100  # +100 за убийство
+                    elif enemy.enemy_type == "spike_turtle":
+                        # Нельзя прыгнуть на черепаху с шипами
+                        self.player.take_damage()
+                else:
+                    # Обычное столкновение - урон игроку
+                    if enemy.enemy_type != "ghost":
+                        self.player.take_damage()
                     else:
-                        # Обычное столкновение - урон игроку
-                        if enemy.enemy_type != "ghost":
-                            self.player.take_damage()
-                        else:
-                            self.player.take_damage()
+                        self.player.take_damage()
 
         # Подбор панциря
-        for shell in self.shells:
-            if shell.depth_layer == self.player.depth_layer:
-                if self.player.rect.colliderect(shell.rect) and not shell.thrown:
-                    self.player.holding_shell = shell
-                    shell.rect.center = self.player.rect.center
+        for shell in self.spatial.query(self.player.rect, self.player.depth_layer, "shell"):
+            if self.player.rect.colliderect(shell.rect) and not shell.thrown:
+                self.player.holding_shell = shell
+                shell.rect.center = self.player.rect.center
 
         # Панцирь убивает врагов
         for shell in self.shells:
             if shell.thrown:
-                for enemy in self.enemies:
-                    if enemy.depth_layer == shell.depth_layer:
-                        if shell.rect.colliderect(enemy.rect):
-                            # Подсчет убитых врагов
-                            if enemy.enemy_type == "turtle":
-                                self.enemies_killed['turtle'] += 1
-                                self.total_enemies_killed += 1
-                            elif enemy.enemy_type == "spike_turtle":
-                                self.enemies_killed['spike_turtle'] += 1
-                                self.total_enemies_killed += 1
-                                # Создаем обычный панцирь
-                                new_shell = Shell(enemy.rect.x, enemy.rect.y, enemy.depth_layer)
-                                self.shells.add(new_shell)
-                            enemy.kill()
-                            shell.kill()
+                for enemy in self.spatial.query(shell.rect, shell.depth_layer, "enemy"):
+                    # Враг мог быть убит другим панцирем в этом же тике
+                    if not self.enemies.has(enemy):
+                        continue
+                    if shell.rect.colliderect(enemy.rect):
+                        # Подсчет убитых врагов
+                        if enemy.enemy_type == "turtle":
+                            self.enemies_killed['turtle'] += 1
+                            self.total_enemies_killed += 1
+                        elif enemy.enemy_type == "spike_turtle":
+                            self.enemies_killed['spike_turtle'] += 1
+                            self.total_enemies_killed += 1
+                            # Создаем обычный панцирь
+                            new_shell = Shell(enemy.rect.x, enemy.rect.y, enemy.depth_layer)
+                            self.shells.add(new_shell)
+                        enemy.kill()
+                        shell.kill()
 
         # Снаряды попадают в игрока
-        for proj in self.projectiles:
-            # Пули призраков бьют на обоих планах, обычные пули только на своем слое
-            if proj.from_ghost or proj.depth_layer == self.player.depth_layer:
-                if self.player.rect.colliderect(proj.rect):
-                    self.player.take_damage()
-                    proj.kill()
+        for depth_layer in ("front", "back"):
+            for proj in self.spatial.query(self.player.rect, depth_layer, "projectile"):
+                # Пули призраков бьют на обоих планах, обычные пули только на своем слое
+                if proj.from_ghost or proj.depth_layer == self.player.depth_layer:
+                    if self.player.rect.colliderect(proj.rect):
+                        self.player.take_damage()
+                        proj.kill()
 
         # Проверка победы - считаем только врагов, не призраков
         non_ghost_enemies = [e for e in self.enemies if e.enemy_type != "ghost"]
@@ -1380,59 +1551,85 @@ class Game:
         # Показываем уведомление
         self.notification_manager.add_achievement(title, description, icon)
 
-        # Сохраняем в БД
-        if self.db and self.user_id:
-            try:
-                if self.db.unlock_achievement(self.user_id, achievement_id):
+        # Сохраняем в БД (в фоне)
+        if self.persistence and self.user_id:
+            def report(unlocked):
+                if unlocked:
                     print(f"Achievement '{title}' (ID {achievement_id}) unlocked!")
-            except Exception as e:
-                print(f"Error unlocking achievement {achievement_id}: {e}")
+
+            self.persistence.submit('unlock_achievement', self.user_id, achievement_id,
+                                    key=('unlock_achievement', self.user_id, achievement_id),
+                                    on_done=report)
 
     def save_level_progress(self, completed=True):
-        """Сохранение прогресса уровня в базу данных"""
-        if not self.db or not self.user_id:
+        """Сохранение прогресса уровня в базу данных (через фоновую очередь)"""
+        if not self.persistence or not self.user_id:
             return  # Работаем без БД
 
         # Расчет времени
         time_spent = int(time.time() - self.level_start_time)
 
         # Расчет очков
-        score_data = self.db.calculate_score(
+        score_data = DatabaseManager.calculate_score(
             turtles_killed=self.enemies_killed['turtle'],
             spike_turtles_killed=self.enemies_killed['spike_turtle'],
             time_spent=time_spent
         )
 
-        # Сохранение в БД
-        result = self.db.save_level_progress(
-            user_id=self.user_id,
-            level_id=self.current_level,
-            score=score_data['total_score'],
-            time_spent=time_spent,
-            enemies_killed=self.enemies_killed['turtle'] + self.enemies_killed['spike_turtle'],
-            completed=completed
-        )
+        level_id = self.current_level
 
-        if result['success']:
-            print(f"Level {self.current_level} progress saved!")
+        def report_saved(result):
+            print(f"Level {level_id} progress saved!")
 
             print(f"Score: {score_data['total_score']}")
             print(f"  - Turtles: {score_data['breakdown']['turtles']}")
             print(f"  - Spike Turtles: {score_data['breakdown']['spike_turtles']}")
             print(f"  - Time Bonus: {score_data['breakdown']['time_bonus']}")
 
-            # Проверка достижений
-            new_achievements = self.db.check_achievements(self.user_id)
+        def report_achievements(new_achievements):
             if new_achievements:
                 print(f"Unlocked {len(new_achievements)} new achievements!")
-        else:
-            print(f"Error saving progress: {result.get('error', 'Unknown error')}")
+
+        # Сохранение в БД (в фоне, с повторами при ошибках)
+        self.persistence.submit(
+            'save_level_progress',
+            user_id=self.user_id,
+            level_id=level_id,
+            score=score_data['total_score'],
+            time_spent=time_spent,
+            enemies_killed=self.enemies_killed['turtle'] + self.enemies_killed['spike_turtle'],
+            completed=completed,
+            on_done=report_saved
+        )
+
+        # Проверка достижений после сохранения (несколько проверок подряд схлопываются в одну)
+        self.persistence.submit('check_achievements', self.user_id,
+                                key=('check_achievements', self.user_id),
+                                on_done=report_achievements)
+
+    def close_persistence(self):
+        """Записать сессию и дописать очередь в БД перед выходом"""
+        if self.persistence:
+            if self.user_id:
+                self.persistence.submit('record_session', self.session_id, self.user_id,
+                                        self.session_started, time.time(),
+                                        self.session_levels_completed,
+                                        key=('record_session', self.session_id))
+            self.persistence.close(timeout=5.0)
+            stats = self.persistence.stats()
+            print(f"Persistence: {stats['completed']} saved, {stats['failed']} failed, "
+                  f"{stats['coalesced']} coalesced, {stats['dropped']} dropped")
+            self.persistence = None
 
     def show_game_complete_screen(self):
         """Экран завершения всех уровней с итоговой статистикой"""
         if not self.db or not self.user_id:
             return
 
+        # Итоговый экран должен видеть только что сохранённый прогресс
+        if self.persistence:
+            self.persistence.flush(timeout=5.0)
+
         # Получаем статистику
         stats = self.db.get_user_stats(self.user_id)
 
@@ -1485,6 +1682,7 @@ class Game:
         while waiting:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    self.close_persistence()
                     pygame.quit()
                     sys.exit()
                 if event.type == pygame.KEYDOWN:
@@ -1501,6 +1699,7 @@ class Game:
 
         # Сохраняем прогресс завершенного уровня
         self.save_level_progress(completed=True)
+        self.session_levels_completed += 1
 
         self.level_completed = True
         self.current_level += 1
@@ -1510,6 +1709,155 @@ class Game:
             self.current_level = 1  # Рестарт на первый уровень
         self.setup_level(self.current_level)
 
+    def draw_static_geometry(self, depth_layer, rects=None):
+        """Отрисовать платформы и трубы плана (запечённым слоем или поштучно)"""
+        start = time.perf_counter()
+        if self.bake_static_geometry:
+            self.static_layers.draw(self.screen, self.platforms, self.pipes, depth_layer, rects)
+            label = f"static {depth_layer} (baked)"
+        else:
+            StaticLayers.draw_geometry(self.screen, self.platforms, self.pipes, depth_layer)
+            label = f"static {depth_layer} (per sprite)"
+        self.draw_timer.add(label, time.perf_counter() - start)
+
+    def draw_layer_entities(self, depth_layer):
+        """Отрисовать врагов, панцири, снаряды и игрока одного плана"""
+        for enemy in self.enemies:
+            if enemy.depth_layer == depth_layer:
+                enemy.draw(self.screen)
+
+        for shell in self.shells:
+            if shell.depth_layer == depth_layer:
+                # Используем спрайт панциря
+                if hasattr(shell, 'pixel_sprite') and shell.pixel_sprite:
+                    self.screen.blit(shell.pixel_sprite, shell.rect)
+                else:
+                    pygame.draw.rect(self.screen, BROWN, shell.rect, border_radius=3)
+
+        for proj in self.projectiles:
+            if proj.depth_layer == depth_layer:
+                pygame.draw.circle(self.screen, RED, proj.rect.center, proj.size // 2)
+
+        if self.player.depth_layer == depth_layer:
+            self.player.draw(self.screen)
+
+    def draw_world(self, rects=None):
+        """
+        Фон, оба плана геометрии и объекты на них.
+        rects - восстановить фон и геометрию только в этих областях (режим dirty rects)
+        """
+        # Анимированный фон
+        if rects is None:
+            self.background.draw(self.screen)
+        else:
+            self.background.draw_regions(self.screen, rects)
+
+        # Задний план
+        self.draw_static_geometry("back", rects)
+        self.draw_layer_entities("back")
+
+        # Передний план
+        self.draw_static_geometry("front", rects)
+        self.draw_layer_entities("front")
+
+    def draw_overlay(self):
+        """Портал выхода, HUD, уведомления и частицы. Возвращает занятые области"""
+        drawn = []
+
+        # Портал выхода
+        if self.exit_portal:
+            self.exit_portal.draw(self.screen)
+            drawn.append(self.exit_portal.rect.inflate(12, 12))
+
+        # HUD
+        labels = self.hud_labels
+        lives_text = labels['lives'].render(f"Жизни: {self.player.lives}")
+        level_text = labels['level'].render(f"Уровень: {self.current_level}")
+        enemies_text = labels['enemies'].render(
+            f"Врагов: {len([e for e in self.enemies if e.enemy_type != 'ghost'])}")
+
+        drawn.append(self.screen.blit(lives_text, (10, 10)))
+        drawn.append(self.screen.blit(level_text, (10, 50)))
+        drawn.append(self.screen.blit(enemies_text, (10, 90)))
+
+        # Статистика уровня (справа)
+        if self.user_data:
+            username_text = labels['username'].render(f"Игрок: {self.user_data['username']}")
+            drawn.append(self.screen.blit(username_text, (SCREEN_WIDTH - 180, 10)))
+
+            elapsed_time = int(time.time() - self.level_start_time)
+            time_text = labels['time'].render(f"Время: {elapsed_time}s")
+            drawn.append(self.screen.blit(time_text, (SCREEN_WIDTH - 180, 40)))
+
+            kills_text = labels['kills'].render(
+                f"Убито: {self.enemies_killed['turtle']}T {self.enemies_killed['spike_turtle']}S"
+            )
+            drawn.append(self.screen.blit(kills_text, (SCREEN_WIDTH - 180, 70)))
+
+            # Предварительный счет
+            if elapsed_time > 0:
+                preview_score = DatabaseManager.calculate_score(
+                    self.enemies_killed['turtle'],
+                    self.enemies_killed['spike_turtle'],
+                    elapsed_time
+                )
+                score_text = labels['score'].render(f"Счет: ~{preview_score['total_score']}")
+                drawn.append(self.screen.blit(score_text, (SCREEN_WIDTH - 180, 100)))
+
+        # Инструкции
+        controls = labels['controls'].render(
+            "A/D или Стрелки - движение | W/Space - прыжок | E - бросить панцирь | Трубы телепортируют автоматически")
+        drawn.append(self.screen.blit(controls, (SCREEN_WIDTH // 2 - 450, SCREEN_HEIGHT - 30)))
+
+        # НОВОЕ: Отрисовка уведомлений (ПОВЕРХ ВСЕГО!)
+        self.notification_manager.draw(self.screen)
+        for notification in getattr(self.notification_manager, 'notifications', []):
+            # Уведомление + тень со смещением 4 пикселя
+            drawn.append(pygame.Rect(notification.x - 4, int(notification.current_y) - 4,
+                                     notification.width + 8, notification.height + 8))
+
+        # Частицы поверх всего
+        particle_pool.draw(self.screen)
+        for effect in self.particle_effects:
+            drawn.append(effect.get_rect())
+
+        return drawn
+
+    def moving_rects(self):
+        """Области, где в этом кадре будут облака и движущиеся объекты"""
+        rects = self.background.cloud_rects()
+        for sprite in (*self.enemies, *self.shells, *self.projectiles, self.player):
+            bounds = sprite.rect.copy()
+            pixel_sprite = getattr(sprite, 'pixel_sprite', None)
+            if pixel_sprite:
+                bounds.union_ip(pygame.Rect(sprite.rect.topleft, pixel_sprite.get_size()))
+            # Запас под fallback-отрисовку (шипы, глаза, скругления)
+            rects.append(bounds.inflate(12, 12))
+        return rects
+
+    def draw_frame_dirty(self):
+        """Кадр в режиме dirty rects: фон восстанавливается только там, где что-то двигалось"""
+        renderer = self.dirty_renderer
+        renderer.begin_frame()
+
+        # Без запечённых слоёв восстанавливать геометрию не из чего - рисуем целиком
+        if not self.bake_static_geometry:
+            renderer.invalidate()
+
+        for rect in self.moving_rects():
+            renderer.mark(rect)
+
+        if renderer.full_redraw:
+            self.draw_world()
+        else:
+            self.draw_world(renderer.restore_rects())
+
+        # То, что поверх всего, не требует восстановления слоёв под собой
+        for rect in self.draw_overlay():
+            renderer.mark(rect)
+
+        renderer.present()
+
     def run(self):
         running = True
 
@@ -1517,9 +1865,14 @@ class Game:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    self.bake_static_geometry = not self.bake_static_geometry
+                    if self.dirty_renderer:
+                        self.dirty_renderer.invalidate()
+                    print(f"Static geometry baking: {'ON' if self.bake_static_geometry else 'OFF'}")
 
             # Обновление
-            self.player.update(self.platforms, self.pipes)
+            self.player.update(self.platforms, self.pipes, self.spatial)
 
             # Обновление панциря, который держит игрок
             if self.player.holding_shell:
@@ -1529,13 +1882,13 @@ class Game:
                 )
 
             for enemy in self.enemies:
-                enemy.update(self.platforms, self.pipes, self.projectiles, self.player)
+                enemy.update(self.platforms, self.pipes, self.projectiles, self.player, self.spatial)
 
             for shell in self.shells:
-                shell.update(self.platforms, self.pipes)
+                shell.update(self.platforms, self.pipes, self.spatial)
 
             for proj in self.projectiles:
-                proj.update(self.platforms, self.pipes)
+                proj.update(self.platforms, self.pipes, self.spatial)
 
             if self.exit_portal:
                 self.exit_portal.update()
@@ -1546,141 +1899,20 @@ class Game:
             self.check_achievements()
 
             # Обновление частиц
-            for effect in self.particle_effects[:]:
-                effect.update()
-                if not effect.is_alive():
-                    self.particle_effects.remove(effect)
+            particle_pool.update()
+            self.particle_effects = [effect for effect in self.particle_effects if effect.is_alive()]
 
             # НОВОЕ: Обновление уведомлений
             self.notification_manager.update(SCREEN_WIDTH)
 
             # Отрисовка
-            # Анимированный фон
             self.background.update()
-            self.background.draw(self.screen)
-
-            # Рисуем задний план
-            for platform in self.platforms:
-                if platform.depth_layer == "back":
-                    # Пиксель-арт платформа (задний)
-                    sprite = PixelArtSprite.create_platform_sprite(platform.rect.width, platform.rect.height, False)
-                    self.screen.blit(sprite, platform.rect)
-                    pygame.draw.rect(self.screen, (150, 30, 30), platform.rect, 2)
-
-            for pipe in self.pipes:
-                if pipe.depth_layer == "back":
-                    # Используем загруженный спрайт из pipe.image
-                    self.screen.blit(pipe.image, pipe.rect)
-
-            for enemy in self.enemies:
-                if enemy.depth_layer == "back":
-                    enemy.draw(self.screen)
-
-            for shell in self.shells:
-                if shell.depth_layer == "back":
-                    # Используем спрайт панциря
-                    if hasattr(shell, 'pixel_sprite') and shell.pixel_sprite:
-                        self.screen.blit(shell.pixel_sprite, shell.rect)
-                    else:
-                        pygame.draw.rect(self.screen, BROWN, shell.rect, border_radius=3)
-
-            for proj in self.projectiles:
-                if proj.depth_layer == "back":
-                    pygame.draw.circle(self.screen, RED, proj.rect.center, proj.size // 2)
-
-            # Игрок на заднем плане
-            if self.player.depth_layer == "back":
-                self.player.draw(self.screen)
-
-            # Рисуем передний план
-            for platform in self.platforms:
-                if platform.depth_layer == "front":
-                    # Пиксель-арт платформа
-                    sprite = PixelArtSprite.create_platform_sprite(platform.rect.width, platform.rect.height, True)
-                    self.screen.blit(sprite, platform.rect)
-                    pygame.draw.rect(self.screen, (30, 60, 150), platform.rect, 3)
-
-            for pipe in self.pipes:
-                if pipe.depth_layer == "front":
-                    # Используем загруженный спрайт из pipe.image
-                    self.screen.blit(pipe.image, pipe.rect)
-
-            for enemy in self.enemies:
-                if enemy.depth_layer == "front":
-                    enemy.draw(self.screen)
-
-            for shell in self.shells:
-                if shell.depth_layer == "front":
-                    # Используем спрайт панциря
-                    if hasattr(shell, 'pixel_sprite') and shell.pixel_sprite:
-                        self.screen.blit(shell.pixel_sprite, shell.rect)
-                    else:
-                        pygame.draw.rect(self.screen, BROWN, shell.rect, border_radius=3)
-
-            for proj in self.projectiles:
-                if proj.depth_layer == "front":
-                    pygame.draw.circle(self.screen, RED, proj.rect.center, proj.size // 2)
-
-            # Игрок на переднем плане
-            if self.player.depth_layer == "front":
-                self.player.draw(self.screen)
-
-            # Портал выхода
-            if self.exit_portal:
-                self.exit_portal.draw(self.screen)
-
-            # HUD
-            lives_text = self.font.render(f"Жизни: {self.player.lives}", True, BLACK)
-            level_text = self.font.render(f"Уровень: {self.current_level}", True, BLACK)
-            enemies_text = self.small_font.render(
-                f"Врагов: {len([e for e in self.enemies if e.enemy_type != 'ghost'])}", True, BLACK)
-
-            self.screen.blit(lives_text, (10, 10))
-            self.screen.blit(level_text, (10, 50))
-            self.screen.blit(enemies_text, (10, 90))
-
-            # Статистика уровня (справа)
-            if self.user_data:
-                username_text = self.small_font.render(f"Игрок: {self.user_data['username']}", True, BLUE)
-                self.screen.blit(username_text, (SCREEN_WIDTH - 180, 10))
-
-                elapsed_time = int(time.time() - self.level_start_time)
-                time_text = self.small_font.render(f"Время: {elapsed_time}s", True, BLACK)
-                self.screen.blit(time_text, (SCREEN_WIDTH - 180, 40))
-
-                kills_text = self.small_font.render(
-                    f"Убито: {self.enemies_killed['turtle']}T {self.enemies_killed['spike_turtle']}S",
-                    True, BLACK
-                )
-                self.screen.blit(kills_text, (SCREEN_WIDTH - 180, 70))
-
-                # Предварительный счет
-                if elapsed_time > 0:
-                    preview_score = self.db.calculate_score(
-                        self.enemies_killed['turtle'],
-                        self.enemies_killed['spike_turtle'],
-                        elapsed_time
-                    )
-                    score_text = self.small_font.render(
-                        f"Счет: ~{preview_score['total_score']}",
-                        True, GREEN
-                    )
-                    self.screen.blit(score_text, (SCREEN_WIDTH - 180, 100))
-
-            # Инструкции
-            controls = self.small_font.render(
-                "A/D или Стрелки - движение | W/Space - прыжок | E - бросить панцирь | Трубы телепортируют автоматически",
-                True, BLACK)
-            self.screen.blit(controls, (SCREEN_WIDTH // 2 - 450, SCREEN_HEIGHT - 30))
-
-            # НОВОЕ: Отрисовка уведомлений (ПОВЕРХ ВСЕГО!)
-            self.notification_manager.draw(self.screen)
-
-            # Частицы поверх всего
-            for effect in self.particle_effects:
-                effect.draw(self.screen)
-
-            pygame.display.flip()
+            if self.dirty_renderer:
+                self.draw_frame_dirty()
+            else:
+                self.draw_world()
+                self.draw_overlay()
+                pygame.display.flip()
             self.clock.tick(FPS)
 
             # Проверка конца игры
@@ -1700,16 +1932,39 @@ class Game:
                                 running = False
                                 waiting = False
 
+        print("Draw timings:")
+        self.draw_timer.report()
+        if self.dirty_renderer:
+            stats = self.dirty_renderer.stats()
+            print(f"  dirty rects: {stats['avg_screen_coverage']:.1%} of screen per frame, "
+                  f"{stats['full_frames']}/{stats['frames']} full redraws")
+
+        self.close_persistence()
         pygame.quit()
         sys.exit()
 
 
 if __name__ == "__main__":
+    # Инициализация Pygame (не при импорте: рабочие процессы spawn импортируют этот модуль заново)
+    pygame.init()
+
+    # --dirty-rects: обновлять только изменившиеся области экрана (слабые машины)
+    DIRTY_RECTS = "--dirty-rects" in sys.argv
+
     if DB_AVAILABLE:
         print("=" * 60)
         print("MARIO CLASH - Database Mode")
         print("=" * 60)
 
+        # Локальный журнал: прогресс сохраняется и без сети, отправляется позже
+        try:
+            local_store = LocalStore()
+        except Exception as e:
+            print(f"Local journal unavailable: {e}")
+            local_store = None
+        # Игрок, вошедший с паролем в этом запуске (прогресс в журнал - только за него)
+        signed_in_user = None
+
         # Инициализация БД
         try:
             db = DatabaseManager()
@@ -1722,10 +1977,11 @@ if __name__ == "__main__":
         # Показываем экран авторизации
         if db:
             try:
-                auth_screen = AuthScreen()
+                auth_screen = AuthScreen(local_store=local_store)
                 user_data = auth_screen.run()
 
                 if user_data:
+                    signed_in_user = user_data
                     print(f"\nWelcome, {user_data.get('username', 'Player')}!")
                     print(f"  Role: {user_data.get('role', 'player')}")
                     print(f"  Total Score: {user_data.get('total_score', 0)}")
@@ -1742,7 +1998,8 @@ if __name__ == "__main__":
                         print("\nStarting game...")
 
                         # Запуск игры с данными пользователя
-                        game = Game(user_data=user_data, db_manager=db)
+                        game = Game(user_data=user_data, db_manager=db, dirty_rects=DIRTY_RECTS,
+                                    local_store=local_store)
                         game.run()
                     else:
                         print("\nGoodbye!")
@@ -1755,15 +2012,30 @@ if __name__ == "__main__":
 
                 traceback.print_exc()
                 print("\nRunning in offline mode...")
-                game = Game()
+                game = Game(user_data=signed_in_user, dirty_rects=DIRTY_RECTS, local_store=local_store)
                 game.run()
             finally:
                 if db:
+                    print("\nQuery timings:")
+                    for method, metrics in sorted(db.stats()['queries'].items()):
+                        print(f"  {method}: {metrics['calls']} calls, avg {metrics['avg_ms']:.1f} ms, "
+                              f"p95 <= {metrics['p95_ms']:g} ms, max {metrics['max_ms']:.1f} ms")
                     db.close_all_connections()
                     print("\nDatabase connections closed")
         else:
-            # Работаем без БД
-            game = Game()
+            # Работаем без БД: последний вошедший игрок может войти по паролю,
+            # проверенному по сохранённому хешу; прогресс копится в локальном журнале
+            if local_store and local_store.last_sign_in():
+                signed_in_user = AuthScreen(local_store=local_store, offline=True).run()
+                if not signed_in_user:
+                    print("Login cancelled")
+                    sys.exit()
+                print(f"Playing offline as {signed_in_user.get('username', 'Player')}, "
+                      f"progress will sync when the database is back")
+                game = Game(user_data=signed_in_user, dirty_rects=DIRTY_RECTS, local_store=local_store)
+            else:
+                print("Playing anonymously, progress will not be saved")
+                game = Game(dirty_rects=DIRTY_RECTS)
             game.run()
     else:
         # БД недоступна - запускаем в оффлайн режиме
@@ -1771,5 +2043,5 @@ if __name__ == "__main__":
         print("MARIO CLASH - Offline Mode")
         print("Database modules not available")
         print("=" * 60)
-        game = Game()
+        game = Game(dirty_rects=DIRTY_RECTS)
         game.run()
\ No newline at end of file
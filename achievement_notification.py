@@ -5,6 +5,7 @@ Achievement Notification System
 
 import pygame
 import time
+from text_cache import get_font
 
 
 class AchievementNotification:
@@ -36,10 +37,16 @@ class AchievementNotification:
         self.bg_dark = (39, 174, 96)
         self.text_color = (255, 255, 255)
 
-        # Шрифты
-        self.font_title = pygame.font.Font(None, 32)
-        self.font_desc = pygame.font.Font(None, 24)
-        self.font_icon = pygame.font.Font(None, 48)
+        # Шрифты (общие для всех уведомлений)
+        self.font_title = get_font(32)
+        self.font_desc = get_font(24)
+        self.font_icon = get_font(48)
+
+        # Текст рендерится один раз; поверхности свои, т.к. при исчезновении им меняется альфа
+        self.icon_surface = self.font_icon.render(self.icon, True, self.text_color)
+        self.title_surface = self.font_title.render("ДОСТИЖЕНИЕ!", True, self.text_color)
+        self.name_surface = self.font_title.render(self.name, True, self.text_color)
+        self.desc_surface = self.font_desc.render(self.description, True, self.text_color)
 
     def update(self, screen_width):
         """Обновление позиции уведомления"""
@@ -98,37 +105,26 @@ class AchievementNotification:
         # Текст (применяем альфа через set_alpha)
         if alpha < 255:
             # Иконка
-            icon_surface = self.font_icon.render(self.icon, True, self.text_color)
-            icon_surface.set_alpha(alpha)
-            surface.blit(icon_surface, (20, 25))
+            self.icon_surface.set_alpha(alpha)
+            surface.blit(self.icon_surface, (20, 25))
 
             # Заголовок
-            title_surface = self.font_title.render("ДОСТИЖЕНИЕ!", True, self.text_color)
-            title_surface.set_alpha(alpha)
-            surface.blit(title_surface, (80, 15))
+            self.title_surface.set_alpha(alpha)
+            surface.blit(self.title_surface, (80, 15))
 
             # Название
-            name_surface = self.font_title.render(self.name, True, self.text_color)
-            name_surface.set_alpha(alpha)
-            surface.blit(name_surface, (80, 40))
+            self.name_surface.set_alpha(alpha)
+            surface.blit(self.name_surface, (80, 40))
 
             # Описание
-            desc_surface = self.font_desc.render(self.description, True, self.text_color)
-            desc_surface.set_alpha(alpha)
-            surface.blit(desc_surface, (80, 68))
+            self.desc_surface.set_alpha(alpha)
+            surface.blit(self.desc_surface, (80, 68))
         else:
             # Полная непрозрачность - без set_alpha (быстрее)
-            icon_surface = self.font_icon.render(self.icon, True, self.text_color)
-            surface.blit(icon_surface, (20, 25))
-
-            title_surface = self.font_title.render("ДОСТИЖЕНИЕ!", True, self.text_color)
-            surface.blit(title_surface, (80, 15))
-
-            name_surface = self.font_title.render(self.name, True, self.text_color)
-            surface.blit(name_surface, (80, 40))
-
-            desc_surface = self.font_desc.render(self.description, True, self.text_color)
-            surface.blit(desc_surface, (80, 68))
+            surface.blit(self.icon_surface, (20, 25))
+            surface.blit(self.title_surface, (80, 15))
+            surface.blit(self.name_surface, (80, 40))
+            surface.blit(self.desc_surface, (80, 68))
 
         # Отрисовка на главном экране
         screen.blit(surface, (self.x, int(self.current_y)))
@@ -0,0 +1,84 @@
+"""
+Apply Schema
+Применение версионированных файлов schema/NNN_*.sql по порядку.
+Применённые версии и их контрольные суммы хранятся в schema_migrations;
+уже применённая версия пропускается, изменённый после применения файл
+отмечается предупреждением (файлы идемпотентны - --reapply применит его снова)
+
+Запуск:
+    python apply_schema.py [--reapply]
+"""
+
+import hashlib
+import os
+import sys
+
+from database_manager import DatabaseManager
+
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema")
+
+
+def schema_files():
+    """[(версия, имя, путь)] по возрастанию версии"""
+    files = []
+    for name in sorted(os.listdir(SCHEMA_DIR)):
+        prefix = name.split('_', 1)[0]
+        if name.endswith('.sql') and prefix.isdigit():
+            files.append((int(prefix), name, os.path.join(SCHEMA_DIR, name)))
+    return files
+
+
+def main():
+    reapply = "--reapply" in sys.argv
+    db = DatabaseManager(prepare_statements=False)
+    try:
+        with db.connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version     INTEGER PRIMARY KEY,
+                    name        VARCHAR(200) NOT NULL,
+                    checksum    CHAR(64) NOT NULL,
+                    applied_at  TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cur.execute("SELECT version, checksum FROM schema_migrations")
+            applied = dict(cur.fetchall())
+            conn.commit()
+
+        for version, name, path in schema_files():
+            with open(path, encoding='utf-8') as f:
+                sql = f.read()
+            checksum = hashlib.sha256(sql.encode('utf-8')).hexdigest()
+
+            if version in applied and not reapply:
+                if applied[version] != checksum:
+                    print(f"⚠ {name} changed after it was applied (run with --reapply)")
+                else:
+                    print(f"  {name}: already applied")
+                continue
+
+            # Каждый файл - одна транзакция
+            with db.connection() as conn, conn.cursor() as cur:
+                cur.execute(sql)
+                cur.execute("""
+                    INSERT INTO schema_migrations (version, name, checksum)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (version) DO UPDATE
+                    SET name = EXCLUDED.name, checksum = EXCLUDED.checksum,
+                        applied_at = CURRENT_TIMESTAMP
+                """, (version, name, checksum))
+                conn.commit()
+            print(f"✓ {name}")
+
+        db.invalidate_queries()
+        return 0
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        return 1
+    finally:
+        db.close_all_connections()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,7 +7,9 @@ import pygame
 import sys
 import math
 from database_manager import DatabaseManager
-from pixel_art_system import PixelArtSprite, AnimatedBackground, ParticleEffect
+from password_hashing import PasswordHasher
+from pixel_art_system import PixelArtSprite, AnimatedBackground, ParticleEffect, particle_pool
+from text_cache import get_font, render_text
 
 
 class AnimatedButton:
@@ -19,7 +21,7 @@ class AnimatedButton:
         self.color = color
         self.hover_color = hover_color
         self.current_color = color
-        self.font = pygame.font.Font(None, 36)
+        self.font = get_font(36)
         self.hover_scale = 1.0
         self.target_scale = 1.0
         self.pulse = 0
@@ -61,7 +63,7 @@ class AnimatedButton:
         pygame.draw.rect(screen, border_color, scaled_rect, pulse_width, 15)
 
         # Текст
-        text_surface = self.font.render(self.text, True, (255, 255, 255))
+        text_surface = render_text(self.font, self.text, (255, 255, 255))
         text_rect = text_surface.get_rect(center=scaled_rect.center)
         screen.blit(text_surface, text_rect)
 
@@ -81,7 +83,7 @@ class InputField:
         self.placeholder = placeholder
         self.text = ""
         self.active = False
-        self.font = pygame.font.Font(None, 32)
+        self.font = get_font(32)
         self.cursor_visible = True
         self.cursor_timer = 0
         self.shake_offset = 0
@@ -138,9 +140,9 @@ class InputField:
 
         # Текст или placeholder
         if self.text:
-            text_surface = self.font.render(self.text, True, (0, 0, 0))
+            text_surface = render_text(self.font, self.text, (0, 0, 0))
         else:
-            text_surface = self.font.render(self.placeholder, True, (150, 150, 150))
+            text_surface = render_text(self.font, self.placeholder, (150, 150, 150))
 
         text_rect = text_surface.get_rect(midleft=(draw_rect.left + 15, draw_rect.centery))
         screen.blit(text_surface, text_rect)
@@ -176,20 +178,30 @@ class FloatingMario:
 
 
 class AuthScreen:
-    """Красивый экран авторизации"""
+    """
+    Красивый экран авторизации.
 
-    def __init__(self):
+    С local_store успешный вход запоминается (LocalStore.remember_sign_in).
+    offline=True - БД недоступна: войти можно только под последним игроком,
+    пароль сверяется с сохранённым bcrypt-хешем, регистрация недоступна
+    """
+
+    def __init__(self, local_store=None, offline=False):
         pygame.init()
         self.screen = pygame.display.set_mode((1000, 700))
         pygame.display.set_caption("Mario Clash - Login")
         self.clock = pygame.time.Clock()
+        self.local_store = local_store
 
         # База данных
-        try:
-            self.db = DatabaseManager()
-        except:
-            print("Running without database")
-            self.db = None
+        self.db = None
+        if not offline:
+            try:
+                self.db = DatabaseManager()
+            except:
+                print("Running without database")
+        # Проверка пароля без БД - по хешу последнего входа
+        self.offline_hasher = PasswordHasher() if self.db is None and local_store else None
 
         # Фон
         self.background = AnimatedBackground(1000, 700)
@@ -206,20 +218,27 @@ class AuthScreen:
         self.register_button = AnimatedButton(510, 450, 140, 50, "Register", (52, 152, 219), (41, 128, 185))
 
         # Заголовок
-        self.title_font = pygame.font.Font(None, 80)
-        self.message_font = pygame.font.Font(None, 28)
+        self.title_font = get_font(80)
+        self.message_font = get_font(28)
 
         # Сообщение об ошибке/успехе
         self.message = ""
         self.message_color = (255, 0, 0)
         self.message_timer = 0
 
-        # Частицы
+        # Частицы (общий пул, остатки с прошлого экрана не нужны)
         self.particles = []
+        particle_pool.clear()
 
         # Анимация заголовка
         self.title_bounce = 0
 
+        # Вход/регистрация идут в фоне: (вид, Future) пока ждём ответа
+        self.pending = None
+        self.pending_frames = 0
+        self.logged_in_user = None
+        self.exit_timer = 0  # Кадры до выхода после успешного входа (показываем частицы)
+
     def show_message(self, text, is_error=True):
         """Показать сообщение"""
         self.message = text
@@ -232,30 +251,58 @@ class AuthScreen:
 
     def handle_login(self):
         """Обработка входа"""
-        if not self.db:
-            self.show_message("Database not available", True)
-            return None
-
         username = self.username_field.text
         password = self.password_field.text
 
+        if not self.db:
+            self.handle_offline_login(username, password)
+            return None
+
         if not username or not password:
             self.show_message("Please fill all fields", True)
             return None
 
-        result = self.db.login_user(username, password)
+        # Проверка пароля (bcrypt) идёт в фоне, экран продолжает анимироваться
+        self.start_pending('login', self.db.login_user_async(username, password))
+        return None
 
+    def handle_offline_login(self, username, password):
+        """Вход без БД: только последний вошедший игрок, пароль - по сохранённому хешу"""
+        sign_in = self.local_store.last_sign_in() if self.local_store else None
+        if sign_in is None:
+            self.show_message("Database not available", True)
+            return
+        user_data, password_hash = sign_in
+        if not username or not password:
+            self.show_message("Please fill all fields", True)
+            return
+        if username != user_data.get('username'):
+            self.show_message(f"Offline: only {user_data.get('username')} can sign in", True)
+            return
+        self.start_pending('offline_login', self.offline_hasher.submit_verify(password, password_hash))
+
+    def finish_offline_login(self, verified):
+        """Результат проверки пароля без БД"""
+        if verified:
+            user_data, _ = self.local_store.last_sign_in()
+            self.finish_login({'success': True, 'user': user_data})
+        else:
+            self.finish_login({'success': False, 'error': 'Invalid password'})
+
+    def finish_login(self, result):
+        """Ответ на вход пришёл"""
         if result['success']:
+            if self.local_store and result.get('password_hash'):
+                self.local_store.remember_sign_in(result['user'], result['password_hash'])
             # Успех - создаём эффект частиц
             for _ in range(30):
                 self.particles.append(ParticleEffect(500, 400, (46, 204, 113), 10))
 
             self.show_message("Login successful!", False)
-            pygame.time.wait(500)
-            return result['user']
+            self.logged_in_user = result['user']
+            self.exit_timer = 30  # ~0.5 секунды на частицы
         else:
             self.show_message(result.get('error', 'Login failed'), True)
-            return None
 
     def handle_register(self):
         """Обработка регистрации"""
@@ -274,14 +321,44 @@ class AuthScreen:
             self.show_message("Password too short (min 4 chars)", True)
             return
 
-        result = self.db.register_user(username, password)
+        self.start_pending('register', self.db.register_user_async(username, password))
 
+    def finish_register(self, result):
+        """Ответ на регистрацию пришёл"""
         if result['success']:
             self.show_message("Registration successful! Please login.", False)
             self.password_field.text = ""
         else:
             self.show_message(result.get('error', 'Registration failed'), True)
 
+    def start_pending(self, kind, future):
+        """Запомнить запрос, который выполняется в фоне"""
+        self.pending = (kind, future)
+        self.pending_frames = 0
+        self.message_timer = 0
+
+    def poll_pending(self):
+        """Проверить, готов ли ответ фонового запроса (вызывается каждый кадр)"""
+        if not self.pending:
+            return
+        kind, future = self.pending
+        self.pending_frames += 1
+        if not future.done():
+            return
+
+        self.pending = None
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+
+        if kind == 'login':
+            self.finish_login(result)
+        elif kind == 'offline_login':
+            self.finish_offline_login(result is True)
+        else:
+            self.finish_register(result)
+
     def run(self):
         """Главный цикл"""
         running = True
@@ -302,21 +379,27 @@ class AuthScreen:
                     self.password_field.active = True
                     self.username_field.active = False
 
-                if self.password_field.handle_event(event):
+                # Пока ждём ответа или уже вошли - новые запросы не отправляем
+                busy = self.pending is not None or self.logged_in_user is not None
+
+                if self.password_field.handle_event(event) and not busy:
                     # Enter в поле password - попытка входа
-                    user = self.handle_login()
-                    if user:
-                        return user
+                    self.handle_login()
 
                 # Кнопки
-                if self.login_button.is_clicked(event):
-                    user = self.handle_login()
-                    if user:
-                        return user
+                if self.login_button.is_clicked(event) and not busy:
+                    self.handle_login()
 
-                if self.register_button.is_clicked(event):
+                if self.register_button.is_clicked(event) and not busy:
                     self.handle_register()
 
+            # Фоновый вход/регистрация
+            self.poll_pending()
+            if self.logged_in_user:
+                self.exit_timer -= 1
+                if self.exit_timer <= 0:
+                    return self.logged_in_user
+
             # Обновление
             self.background.update()
             self.mario.update()
@@ -329,10 +412,8 @@ class AuthScreen:
             self.title_bounce += 0.05
 
             # Частицы
-            for p in self.particles[:]:
-                p.update()
-                if not p.is_alive():
-                    self.particles.remove(p)
+            particle_pool.update()
+            self.particles = [p for p in self.particles if p.is_alive()]
 
             # Сообщение
             if self.message_timer > 0:
@@ -346,8 +427,8 @@ class AuthScreen:
 
             # Заголовок с анимацией
             title_y = 150 + math.sin(self.title_bounce) * 10
-            title_text = self.title_font.render("MARIO CLASH", True, (220, 20, 20))
-            title_shadow = self.title_font.render("MARIO CLASH", True, (100, 0, 0))
+            title_text = render_text(self.title_font, "MARIO CLASH", (220, 20, 20))
+            title_shadow = render_text(self.title_font, "MARIO CLASH", (100, 0, 0))
 
             title_rect = title_text.get_rect(center=(500, title_y))
             shadow_rect = title_shadow.get_rect(center=(503, title_y + 3))
@@ -370,7 +451,7 @@ class AuthScreen:
 
             # Сообщение
             if self.message_timer > 0:
-                message_surf = self.message_font.render(self.message, True, self.message_color)
+                message_surf = render_text(self.message_font, self.message, self.message_color)
                 message_rect = message_surf.get_rect(center=(500, 250))
 
                 # Фон для сообщения
@@ -379,13 +460,18 @@ class AuthScreen:
                 pygame.draw.rect(self.screen, self.message_color, bg_rect, 2, 10)
 
                 self.screen.blit(message_surf, message_rect)
+            elif self.pending:
+                # Ожидание ответа: анимированные точки
+                dots = "." * (1 + (self.pending_frames // 15) % 3)
+                label = "Registering" if self.pending[0] == 'register' else "Logging in"
+                pending_surf = render_text(self.message_font, label + dots, (100, 100, 100))
+                self.screen.blit(pending_surf, pending_surf.get_rect(midleft=(420, 250)))
 
             # Частицы
-            for p in self.particles:
-                p.draw(self.screen)
+            particle_pool.draw(self.screen)
 
             # Подсказка
-            hint_text = self.message_font.render("Press ESC to exit", True, (100, 100, 100))
+            hint_text = render_text(self.message_font, "Press ESC to exit", (100, 100, 100))
             self.screen.blit(hint_text, (10, 670))
 
             pygame.display.flip()
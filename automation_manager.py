@@ -1,9 +1,12 @@
 
 
+import os
 import schedule
 import time
 from datetime import datetime
-from database_manager import DatabaseManager
+from database_manager import DatabaseManager, cleanup_progress_printer
+from backup_engine import BackupEngine
+from daily_stats import DailyStats, REPORTS_DIR, print_report
 
 
 class AutomationManager:
@@ -11,53 +14,61 @@ class AutomationManager:
 
     def __init__(self):
         self.db = DatabaseManager()
+        self.backups = BackupEngine(self.db)
+        self.daily_stats = DailyStats(self.db)
         print("=" * 60)
         print("MARIO CLASH - Automation Manager")
         print("=" * 60)
         print(f"Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print()
 
-    def cleanup_inactive_accounts(self):
-        """Удаление неактивных аккаунтов (старше 7 дней)"""
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] Running account cleanup...")
+    def cleanup_inactive_accounts(self, dry_run=False):
+        """Удаление неактивных аккаунтов (старше 7 дней) пачками, с прогрессом"""
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Running account cleanup"
+              f"{' (dry run)' if dry_run else ''}...")
         try:
-            deleted_count = self.db.delete_inactive_accounts()
-            print(f"  ✓ Deleted {deleted_count} inactive accounts")
+            deleted_count = self.db.delete_inactive_accounts(dry_run=dry_run,
+                                                             on_progress=cleanup_progress_printer())
+            if dry_run:
+                print(f"  ✓ {deleted_count} inactive accounts would be deleted")
+            else:
+                print(f"  ✓ Deleted {deleted_count} inactive accounts")
         except Exception as e:
             print(f"  ✗ Error: {e}")
 
     def create_daily_backup(self):
-        """Создание ежедневной резервной копии"""
+        """Создание ежедневной резервной копии (раз в неделю полная, иначе инкрементальная)"""
         print(f"[{datetime.now().strftime('%H:%M:%S')}] Creating daily backup...")
         try:
-            backup_id = self.db.create_backup('full')
-            print(f"  ✓ Backup created (ID: {backup_id})")
+            manifest = self.backups.scheduled_backup()
+            print(f"  ✓ Backup {manifest['backup_id']}: {manifest['rows']} rows, "
+                  f"{manifest['bytes'] / 1024 / 1024:.1f} MB in {manifest['duration_s']:.1f}s")
+            for name in self.backups.prune():
+                print(f"  ✓ Removed old backup {name}")
+        except Exception as e:
+            print(f"  ✗ Error: {e}")
+
+    def refresh_daily_stats(self):
+        """Досчитать дневные агрегаты (только новые дни)"""
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Refreshing daily stats...")
+        try:
+            print(f"  ✓ Refreshed {self.daily_stats.refresh()} days")
         except Exception as e:
             print(f"  ✗ Error: {e}")
 
     def generate_weekly_report(self):
-        """Генерация еженедельного отчета"""
+        """Генерация еженедельного отчета из daily_stats, экспорт в CSV и JSON"""
         print(f"[{datetime.now().strftime('%H:%M:%S')}] Generating weekly report...")
         try:
-            # Получаем статистику
-            conn = self.db.get_connection()
-            with conn.cursor() as cur:
-                # Общая статистика
-                cur.execute("""
-                    SELECT 
-                        COUNT(*) as total_users,
-                        COUNT(*) FILTER (WHERE created_at > CURRENT_TIMESTAMP - INTERVAL '7 days') as new_users,
-                        COALESCE(SUM(total_score), 0) as total_scores
-                    FROM users
-                    WHERE banned = FALSE
-                """)
-                stats = cur.fetchone()
-
-                print(f"  Total Users: {stats[0]}")
-                print(f"  New Users (7 days): {stats[1]}")
-                print(f"  Total Scores: {stats[2]}")
-
-            self.db.release_connection(conn)
+            self.daily_stats.refresh()
+            report = self.daily_stats.weekly_report()
+            print_report(report)
+
+            name = f"weekly-{report['to']}"
+            for extension in ('csv', 'json'):
+                path = self.daily_stats.export(report, os.path.join(REPORTS_DIR, f"{name}.{extension}"))
+                print(f"  ✓ Exported {path}")
+
             print(f"  ✓ Report generated")
         except Exception as e:
             print(f"  ✗ Error: {e}")
@@ -67,11 +78,13 @@ class AutomationManager:
         # Планирование задач
         schedule.every().day.at("03:00").do(self.cleanup_inactive_accounts)
         schedule.every().day.at("02:00").do(self.create_daily_backup)
+        schedule.every().day.at("00:15").do(self.refresh_daily_stats)
         schedule.every().monday.at("09:00").do(self.generate_weekly_report)
 
         print("Scheduled tasks:")
         print("  - Account cleanup: Daily at 03:00")
         print("  - Daily backup: Daily at 02:00")
+        print("  - Daily stats rollup: Daily at 00:15")
         print("  - Weekly report: Monday at 09:00")
         print()
         print("Press Ctrl+C to stop")
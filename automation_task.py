@@ -2,7 +2,8 @@
 
 import sys
 from datetime import datetime
-from database_manager import DatabaseManager
+from database_manager import DatabaseManager, cleanup_progress_printer
+from backup_engine import BackupEngine
 
 def main():
     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Starting automation task...")
@@ -11,14 +12,18 @@ def main():
         db = DatabaseManager()
 
         # Удаление неактивных аккаунтов
-        print("Running account cleanup...")
-        deleted_count = db.delete_inactive_accounts()
-        print(f"✓ Deleted {deleted_count} inactive accounts")
+        dry_run = "--dry-run" in sys.argv
+        print(f"Running account cleanup{' (dry run)' if dry_run else ''}...")
+        deleted_count = db.delete_inactive_accounts(dry_run=dry_run, on_progress=cleanup_progress_printer())
+        print(f"✓ {'Found' if dry_run else 'Deleted'} {deleted_count} inactive accounts")
 
         # Создание резервной копии
         print("Creating backup...")
-        backup_id = db.create_backup('full')
-        print(f"✓ Backup created (ID: {backup_id})")
+        backups = BackupEngine(db)
+        manifest = backups.scheduled_backup()
+        print(f"✓ Backup created (ID: {manifest['backup_id']}, {manifest['rows']} rows, "
+              f"{manifest['bytes'] / 1024 / 1024:.1f} MB in {manifest['duration_s']:.1f}s)")
+        backups.prune()
 
         db.close_all_connections()
         print("✓ All tasks completed successfully")
@@ -0,0 +1,564 @@
+"""
+Backup Engine для Mario Clash
+Клиентские резервные копии: каждая таблица потоком COPY ... TO STDOUT в сжатые
+куски (gzip), контрольные суммы sha256 и manifest.json, параллельно по таблицам,
+инкрементальный режим по времени изменения строк, параллельное восстановление
+через промежуточные таблицы и хранение N цепочек.
+
+Структура каталога:
+    backups/<backup_id>/manifest.json
+    backups/<backup_id>/<table>.<номер куска>.copy.gz
+
+Запуск:
+    python backup_engine.py backup [--incremental]
+    python backup_engine.py list
+    python backup_engine.py verify [backup_id]
+    python backup_engine.py restore [backup_id] --yes
+    python backup_engine.py prune [--keep=N]
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from database_manager import DatabaseManager
+
+
+BACKUP_DIR = os.environ.get("MARIO_BACKUP_DIR", "backups")
+
+# Несжатый размер куска: новый файл начинается на границе строки после порога
+CHUNK_BYTES = 64 * 1024 * 1024
+
+# Сколько цепочек (полная копия + её инкрементальные) хранить
+KEEP_CHAINS = 4
+
+# Полная копия не реже, чем раз в столько дней (остальные дни - инкрементальные)
+FULL_EVERY_DAYS = 7
+
+# Запас назад от снимка предыдущей копии: транзакция, начатая до снимка, могла
+# записать updated_at раньше него, а закоммититься позже. Повторы снимает UPSERT
+INCREMENTAL_OVERLAP = timedelta(minutes=10)
+
+# Префикс промежуточных таблиц восстановления
+STAGING_PREFIX = 'restore_'
+
+# Порядок переноса при восстановлении: следующая волна ссылается внешними ключами на предыдущие
+TABLE_WAVES = (
+    ('users', 'levels', 'achievements'),
+    ('user_progress', 'user_achievements', 'level_plays', 'game_sessions', 'applied_events'),
+)
+
+# Столбец изменения для инкрементального режима (если его нет в таблице - копируется целиком).
+# Время записи на сервере, а не события: офлайн-сессия приходит с прошлым started_at
+INCREMENTAL_COLUMNS = {
+    'users': 'updated_at',
+    'user_progress': 'updated_at',
+    'user_achievements': 'earned_at',
+    'level_plays': 'played_at',
+    'game_sessions': 'recorded_at',
+    'applied_events': 'applied_at',
+}
+
+
+class BackupError(Exception):
+    """Резервная копия не найдена, повреждена или неполна"""
+
+
+class _HashingFile:
+    """Запись в файл с подсчётом sha256 и размера (то, что реально лежит на диске)"""
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ChunkWriter:
+    """
+    Приёмник для copy_expert: строки COPY пишутся в gzip-куски.
+    psycopg2 отдаёт COPY OUT по строке за вызов write(), поэтому куски
+    режутся по границам строк и каждый можно загрузить отдельно
+    """
+
+    def __init__(self, directory, table, chunk_bytes=CHUNK_BYTES):
+        self.directory = directory
+        self.table = table
+        self.chunk_bytes = chunk_bytes
+        self.chunks = []  # Описания закрытых кусков
+        self.name = None
+        self.raw = None
+        self.gzip = None
+        self.chunk_rows = 0
+        self.chunk_raw_bytes = 0
+
+    def _open(self):
+        name = f"{self.table}.{len(self.chunks):04d}.copy.gz"
+        self.raw = _HashingFile(os.path.join(self.directory, name))
+        self.gzip = gzip.GzipFile(filename='', mode='wb', fileobj=self.raw, compresslevel=6, mtime=0)
+        self.name = name
+        self.chunk_rows = 0
+        self.chunk_raw_bytes = 0
+
+    def _close(self):
+        self.gzip.close()
+        self.raw.close()
+        self.chunks.append({
+            'file': self.name,
+            'rows': self.chunk_rows,
+            'raw_bytes': self.chunk_raw_bytes,
+            'bytes': self.raw.size,
+            'sha256': self.raw.sha256.hexdigest()
+        })
+        self.gzip = None
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if self.gzip is None:
+            self._open()
+        self.gzip.write(data)
+        self.chunk_rows += data.count(b'\n')
+        self.chunk_raw_bytes += len(data)
+        if self.chunk_raw_bytes >= self.chunk_bytes:
+            self._close()
+
+    def finish(self):
+        """Закрыть последний кусок, вернуть список кусков"""
+        if self.gzip is not None:
+            self._close()
+        return self.chunks
+
+
+class _ChunkReader:
+    """Чтение нескольких gzip-кусков подряд для copy_expert (COPY FROM STDIN)"""
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self.current = None
+
+    def read(self, size=-1):
+        while True:
+            if self.current is None:
+                if not self.paths:
+                    return b''
+                self.current = gzip.open(self.paths.pop(0), 'rb')
+            data = self.current.read(size if size and size > 0 else 1 << 16)
+            if data:
+                return data
+            self.current.close()
+            self.current = None
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+
+
+def _sha256_of(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BackupEngine:
+    """
+    Резервное копирование через DatabaseManager (соединения берутся из его пула).
+
+    Все таблицы копируются из одного снимка БД (pg_export_snapshot), поэтому
+    копия согласована, даже если таблицы пишутся параллельно разными соединениями.
+    Инкрементальная копия содержит строки, изменённые с момента снимка
+    предыдущей копии (удаления в ней не видны - их покрывает следующая полная)
+    """
+
+    def __init__(self, db, backup_dir=BACKUP_DIR, workers=4, chunk_bytes=CHUNK_BYTES,
+                 keep_chains=KEEP_CHAINS):
+        self.db = db
+        self.backup_dir = backup_dir
+        self.workers = workers
+        self.chunk_bytes = chunk_bytes
+        self.keep_chains = keep_chains
+        os.makedirs(backup_dir, exist_ok=True)
+
+    # ==========================================
+    # СПИСОК И MANIFEST
+    # ==========================================
+
+    def _manifest_path(self, backup_id):
+        return os.path.join(self.backup_dir, backup_id, 'manifest.json')
+
+    def load_manifest(self, backup_id):
+        path = self._manifest_path(backup_id)
+        if not os.path.exists(path):
+            raise BackupError(f"Backup {backup_id} has no manifest (missing or incomplete)")
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def list_backups(self):
+        """Завершённые копии (с manifest), от старых к новым"""
+        manifests = []
+        for name in sorted(os.listdir(self.backup_dir)):
+            if os.path.exists(self._manifest_path(name)):
+                manifests.append(self.load_manifest(name))
+        return manifests
+
+    def chain(self, backup_id=None):
+        """Цепочка для восстановления: полная копия и инкрементальные до backup_id (по умолчанию последней)"""
+        if backup_id is None:
+            backups = self.list_backups()
+            if not backups:
+                raise BackupError("No backups found")
+            backup_id = backups[-1]['backup_id']
+        chain = []
+        while backup_id is not None:
+            manifest = self.load_manifest(backup_id)
+            chain.append(manifest)
+            backup_id = manifest.get('parent')
+        chain.reverse()
+        if chain[0]['kind'] != 'full':
+            raise BackupError(f"Backup chain of {chain[-1]['backup_id']} does not start with a full backup")
+        return chain
+
+    # ==========================================
+    # РЕЗЕРВНОЕ КОПИРОВАНИЕ
+    # ==========================================
+
+    def _table_columns(self, cur, tables):
+        """Существующие таблицы и их столбцы (по порядку)"""
+        cur.execute("""
+            SELECT table_name, column_name
+            FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = ANY(%s)
+            ORDER BY table_name, ordinal_position
+        """, (list(tables),))
+        columns = {}
+        for table, column in cur.fetchall():
+            columns.setdefault(table, []).append(column)
+        return columns
+
+    def backup(self, incremental=False):
+        """Сделать копию всех таблиц, вернуть manifest"""
+        tables = [table for wave in TABLE_WAVES for table in wave]
+        parent = None
+        if incremental:
+            backups = self.list_backups()
+            if backups:
+                parent = backups[-1]
+            else:
+                print("  No previous backup - making a full one")
+                incremental = False
+
+        kind = 'incremental' if incremental else 'full'
+        backup_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{kind}"
+        directory = os.path.join(self.backup_dir, backup_id)
+        os.makedirs(directory)
+        started = time.perf_counter()
+
+        # Координатор держит снимок открытым, пока его используют рабочие соединения
+        with self.db.connection() as conn, conn.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            cur.execute("SELECT pg_export_snapshot(), now()")
+            snapshot, snapshot_time = cur.fetchone()
+            columns = self._table_columns(cur, tables)
+
+            jobs = []
+            for table in tables:
+                if table not in columns:
+                    print(f"  - {table}: not in database, skipped")
+                    continue
+                since_column = INCREMENTAL_COLUMNS.get(table)
+                if not incremental or since_column not in columns[table]:
+                    since_column = None
+                jobs.append((table, columns[table], since_column))
+
+            since = None
+            if parent:
+                since = (datetime.fromisoformat(parent['snapshot_time']) - INCREMENTAL_OVERLAP).isoformat()
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="backup") as pool:
+                futures = {table: pool.submit(self._dump_table, snapshot, directory, table,
+                                              table_columns, since_column, since)
+                           for table, table_columns, since_column in jobs}
+                results = {table: future.result() for table, future in futures.items()}
+            conn.rollback()
+
+        manifest = {
+            'backup_id': backup_id,
+            'kind': kind,
+            'parent': parent['backup_id'] if parent else None,
+            'snapshot_time': snapshot_time.isoformat(),
+            'since': since,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'duration_s': round(time.perf_counter() - started, 3),
+            'rows': sum(result['rows'] for result in results.values()),
+            'raw_bytes': sum(result['raw_bytes'] for result in results.values()),
+            'bytes': sum(result['bytes'] for result in results.values()),
+            'tables': results
+        }
+        # Manifest пишется последним: каталог без него считается незавершённой копией
+        temp_path = self._manifest_path(backup_id) + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp_path, self._manifest_path(backup_id))
+        return manifest
+
+    def scheduled_backup(self, full_every_days=FULL_EVERY_DAYS):
+        """Копия по расписанию: полная, если последней полной больше full_every_days, иначе инкрементальная"""
+        fulls = [manifest for manifest in self.list_backups() if manifest['kind'] == 'full']
+        incremental = bool(fulls) and (
+            datetime.now() - datetime.fromisoformat(fulls[-1]['created_at']) < timedelta(days=full_every_days))
+        return self.backup(incremental=incremental)
+
+    def _dump_table(self, snapshot, directory, table, columns, since_column, since):
+        """COPY одной таблицы из общего снимка в gzip-куски"""
+        started = time.perf_counter()
+        writer = ChunkWriter(directory, table, self.chunk_bytes)
+        column_list = ', '.join(columns)
+        with self.db.connection() as conn, conn.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            cur.execute("SET TRANSACTION SNAPSHOT %s", (snapshot,))
+            if since_column and since:
+                query = cur.mogrify(f"SELECT {column_list} FROM {table} WHERE {since_column} >= %s",
+                                    (since,)).decode('utf-8')
+                cur.copy_expert(f"COPY ({query}) TO STDOUT", writer)
+            else:
+                cur.copy_expert(f"COPY {table} ({column_list}) TO STDOUT", writer)
+            conn.rollback()
+        chunks = writer.finish()
+        result = {
+            'columns': columns,
+            'mode': 'incremental' if since_column and since else 'full',
+            'since_column': since_column,
+            'rows': sum(chunk['rows'] for chunk in chunks),
+            'raw_bytes': sum(chunk['raw_bytes'] for chunk in chunks),
+            'bytes': sum(chunk['bytes'] for chunk in chunks),
+            'duration_s': round(time.perf_counter() - started, 3),
+            'chunks': chunks
+        }
+        print(f"  ✓ {table}: {result['rows']} rows, {result['bytes'] / 1024:.0f} KB "
+              f"in {result['duration_s']:.1f}s ({result['mode']})")
+        return result
+
+    # ==========================================
+    # ПРОВЕРКА И ВОССТАНОВЛЕНИЕ
+    # ==========================================
+
+    def verify(self, backup_id):
+        """Сверить sha256 всех кусков с manifest, вернуть список проблем"""
+        manifest = self.load_manifest(backup_id)
+        problems = []
+        for table, info in manifest['tables'].items():
+            for chunk in info['chunks']:
+                path = os.path.join(self.backup_dir, backup_id, chunk['file'])
+                if not os.path.exists(path):
+                    problems.append(f"{chunk['file']}: missing")
+                elif _sha256_of(path) != chunk['sha256']:
+                    problems.append(f"{chunk['file']}: checksum mismatch")
+        return problems
+
+    def restore(self, backup_id=None):
+        """
+        Восстановить цепочку до backup_id (по умолчанию последней копии).
+
+        Цепочка сначала собирается в промежуточных таблицах restore_<table>:
+        полная копия - COPY, инкрементальные - UPSERT по первичному ключу,
+        все таблицы параллельно. Живые таблицы заменяются одной транзакцией
+        только после того, как загрузилось всё; при любой ошибке раньше
+        данные в БД остаются нетронутыми
+        """
+        chain = self.chain(backup_id)
+        for manifest in chain:
+            problems = self.verify(manifest['backup_id'])
+            if problems:
+                raise BackupError(f"Backup {manifest['backup_id']} is damaged: {'; '.join(problems)}")
+
+        started = time.perf_counter()
+        full = chain[0]
+        tables = [table for wave in TABLE_WAVES for table in wave if table in full['tables']]
+        self._create_staging(tables)
+        try:
+            for manifest in chain:
+                print(f"Loading {manifest['backup_id']} ({manifest['kind']})...")
+                upsert = manifest['kind'] != 'full'
+                with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="restore") as pool:
+                    futures = [pool.submit(self._load_table, manifest, table, upsert)
+                               for table in tables if table in manifest['tables']]
+                    for future in futures:
+                        future.result()
+            self._swap_in(tables)
+        finally:
+            self._drop_staging(tables)
+
+        self.db.invalidate_queries()
+        self.db.invalidate_user_stats()
+        print(f"✓ Restored {len(chain)} backup(s) in {time.perf_counter() - started:.1f}s")
+
+    def _create_staging(self, tables):
+        """Пустые промежуточные таблицы по образцу живых (без внешних ключей, с первичным ключом)"""
+        with self.db.connection() as conn, conn.cursor() as cur:
+            for table in tables:
+                staging = STAGING_PREFIX + table
+                cur.execute(f"DROP TABLE IF EXISTS {staging}")
+                cur.execute(f"CREATE UNLOGGED TABLE {staging} "
+                            f"(LIKE {table} INCLUDING DEFAULTS INCLUDING INDEXES)")
+            conn.commit()
+
+    def _drop_staging(self, tables):
+        with self.db.connection() as conn, conn.cursor() as cur:
+            for table in tables:
+                cur.execute(f"DROP TABLE IF EXISTS {STAGING_PREFIX + table}")
+            conn.commit()
+
+    def _swap_in(self, tables):
+        """Заменить содержимое живых таблиц промежуточными - одной транзакцией"""
+        with self.db.connection() as conn, conn.cursor() as cur:
+            cur.execute(f"TRUNCATE {', '.join(tables)} CASCADE")
+            for table in tables:
+                cur.execute(f"INSERT INTO {table} SELECT * FROM {STAGING_PREFIX + table}")
+                print(f"  ✓ {table}: {cur.rowcount} rows")
+            self._reset_sequences(cur, tables)
+            conn.commit()
+
+    def _primary_key(self, cur, table):
+        cur.execute("""
+            SELECT a.attname
+            FROM pg_index i
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            WHERE i.indrelid = %s::regclass AND i.indisprimary
+        """, (table,))
+        return [row[0] for row in cur.fetchall()]
+
+    def _load_table(self, manifest, table, upsert):
+        """COPY всех кусков таблицы в промежуточную; для инкрементальной копии - через временную таблицу и UPSERT"""
+        info = manifest['tables'][table]
+        staging = STAGING_PREFIX + table
+        column_list = ', '.join(info['columns'])
+        paths = [os.path.join(self.backup_dir, manifest['backup_id'], chunk['file'])
+                 for chunk in info['chunks']]
+        reader = _ChunkReader(paths)
+        try:
+            with self.db.connection() as conn, conn.cursor() as cur:
+                if not upsert:
+                    cur.copy_expert(f"COPY {staging} ({column_list}) FROM STDIN", reader)
+                else:
+                    key = self._primary_key(cur, staging)
+                    incoming = f"incoming_{table}"
+                    cur.execute(f"CREATE TEMP TABLE {incoming} (LIKE {staging} INCLUDING DEFAULTS) "
+                                f"ON COMMIT DROP")
+                    cur.copy_expert(f"COPY {incoming} ({column_list}) FROM STDIN", reader)
+                    if key:
+                        updates = ', '.join(f"{column} = EXCLUDED.{column}"
+                                            for column in info['columns'] if column not in key)
+                        conflict = (f"ON CONFLICT ({', '.join(key)}) DO UPDATE SET {updates}"
+                                    if updates else f"ON CONFLICT ({', '.join(key)}) DO NOTHING")
+                    else:
+                        conflict = ""
+                    cur.execute(f"INSERT INTO {staging} ({column_list}) "
+                                f"SELECT {column_list} FROM {incoming} {conflict}")
+                conn.commit()
+        finally:
+            reader.close()
+        print(f"  ✓ {table}: {info['rows']} rows loaded")
+
+    def _reset_sequences(self, cur, tables):
+        """Счётчики SERIAL после загрузки строк с явными id (на курсоре транзакции восстановления)"""
+        for table in tables:
+            for column in self._primary_key(cur, table):
+                cur.execute("SELECT pg_get_serial_sequence(%s, %s)", (table, column))
+                sequence = cur.fetchone()[0]
+                if sequence:
+                    cur.execute(f"SELECT setval(%s, COALESCE((SELECT MAX({column}) FROM {table}), 0) + 1, false)",
+                                (sequence,))
+
+    # ==========================================
+    # ХРАНЕНИЕ
+    # ==========================================
+
+    def prune(self, keep_chains=None):
+        """
+        Оставить keep_chains последних цепочек (полная копия + её инкрементальные),
+        удалить более старые копии и незавершённые каталоги без manifest
+        """
+        keep_chains = self.keep_chains if keep_chains is None else keep_chains
+        backups = self.list_backups()
+        fulls = [manifest['backup_id'] for manifest in backups if manifest['kind'] == 'full']
+        oldest_kept = fulls[-keep_chains] if len(fulls) >= keep_chains else (fulls[0] if fulls else None)
+        complete = {manifest['backup_id'] for manifest in backups}
+
+        removed = []
+        latest = backups[-1]['backup_id'] if backups else None
+        for name in sorted(os.listdir(self.backup_dir)):
+            path = os.path.join(self.backup_dir, name)
+            if not os.path.isdir(path):
+                continue
+            if name not in complete:
+                # Незавершённая копия (например, прерванная); самая свежая может ещё писаться
+                if latest is None or name < latest:
+                    shutil.rmtree(path)
+                    removed.append(name)
+            elif oldest_kept is not None and name < oldest_kept:
+                shutil.rmtree(path)
+                removed.append(name)
+        return removed
+
+
+def _print_backup(manifest):
+    ratio = manifest['bytes'] / manifest['raw_bytes'] if manifest['raw_bytes'] else 0
+    print(f"{manifest['backup_id']:<32} {manifest['rows']:>10} rows  "
+          f"{manifest['bytes'] / 1024 / 1024:8.1f} MB ({ratio:.0%} of raw)  {manifest['duration_s']:.1f}s")
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    flags = [arg for arg in sys.argv[1:] if arg.startswith("--")]
+    command = args[0] if args else "backup"
+
+    db = DatabaseManager()
+    try:
+        engine = BackupEngine(db)
+        if command == "backup":
+            manifest = engine.backup(incremental="--incremental" in flags)
+            _print_backup(manifest)
+        elif command == "list":
+            for manifest in engine.list_backups():
+                _print_backup(manifest)
+        elif command == "verify":
+            backup_id = args[1] if len(args) > 1 else engine.list_backups()[-1]['backup_id']
+            problems = engine.verify(backup_id)
+            print("✓ OK" if not problems else "\n".join(f"✗ {problem}" for problem in problems))
+            return 1 if problems else 0
+        elif command == "restore":
+            if "--yes" not in flags:
+                print("Restore replaces all game data - run again with --yes to confirm")
+                return 1
+            engine.restore(args[1] if len(args) > 1 else None)
+        elif command == "prune":
+            keep = next((int(flag.split("=")[1]) for flag in flags if flag.startswith("--keep=")), None)
+            for name in engine.prune(keep):
+                print(f"  removed {name}")
+        else:
+            print(__doc__)
+            return 1
+        return 0
+    finally:
+        db.close_all_connections()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
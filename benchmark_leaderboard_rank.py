@@ -0,0 +1,120 @@
+"""
+Benchmark Leaderboard Rank
+Сравнение старого ранга через ROW_NUMBER() с новым get_user_rank / get_rank_window
+на отдельной схеме rank_bench с 1 000 000 игроков (данные в основной схеме не трогаются)
+
+Запуск:
+    python benchmark_leaderboard_rank.py [число игроков] [--keep]
+"""
+
+import random
+import sys
+import time
+
+from database_manager import DatabaseManager
+
+
+BENCH_SCHEMA = "rank_bench"
+DEFAULT_USERS = 1000000
+SAMPLES = 50
+
+
+def setup_schema(db, users):
+    """Создать rank_bench.users и заполнить через generate_series"""
+    print(f"Seeding {users} users into {BENCH_SCHEMA}.users...")
+    start = time.perf_counter()
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+        cur.execute(f"""
+            CREATE TABLE {BENCH_SCHEMA}.users (
+                user_id SERIAL PRIMARY KEY,
+                username VARCHAR(50) NOT NULL,
+                total_score INTEGER NOT NULL DEFAULT 0,
+                current_level INTEGER NOT NULL DEFAULT 1,
+                banned BOOLEAN NOT NULL DEFAULT FALSE
+            )
+        """)
+        # Счёт с длинным хвостом: много слабых игроков, мало сильных
+        cur.execute(f"""
+            INSERT INTO {BENCH_SCHEMA}.users (username, total_score, current_level, banned)
+            SELECT 'bench_' || g,
+                   (power(random(), 3) * 100000)::int,
+                   1 + (random() * 2)::int,
+                   random() < 0.01
+            FROM generate_series(1, %s) g
+        """, (users,))
+        cur.execute(f"""
+            CREATE INDEX users_leaderboard_rank_idx
+                ON {BENCH_SCHEMA}.users (banned, total_score DESC, user_id DESC)
+        """)
+        cur.execute(f"ANALYZE {BENCH_SCHEMA}.users")
+        conn.commit()
+    print(f"  done in {time.perf_counter() - start:.1f}s")
+
+
+def legacy_rank(db, user_id):
+    """Старый вариант: ROW_NUMBER() по всей таблице"""
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            WITH ranked_users AS (
+                SELECT
+                    user_id,
+                    ROW_NUMBER() OVER (ORDER BY total_score DESC) as rank
+                FROM users
+                WHERE banned = FALSE
+            )
+            SELECT rank FROM ranked_users WHERE user_id = %s
+        """, (user_id,))
+        row = cur.fetchone()
+        return row[0] if row else None
+
+
+def measure(name, func, user_ids):
+    """Время вызова func для каждого user_id: p50 / p95 / max в миллисекундах"""
+    timings = []
+    for user_id in user_ids:
+        start = time.perf_counter()
+        func(user_id)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p50 = timings[len(timings) // 2]
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"  {name:<28} p50 {p50:8.2f} ms   p95 {p95:8.2f} ms   max {timings[-1]:8.2f} ms")
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    users = int(args[0]) if args else DEFAULT_USERS
+    keep = "--keep" in sys.argv
+
+    # Все соединения пула смотрят в схему бенчмарка
+    db = DatabaseManager(options=f"-c search_path={BENCH_SCHEMA},public")
+    try:
+        setup_schema(db, users)
+
+        rng = random.Random(42)
+        user_ids = [rng.randint(1, users) for _ in range(SAMPLES)]
+
+        # Ранги должны совпадать, кроме порядка внутри одинакового счёта
+        mismatches = 0
+        for user_id in user_ids[:10]:
+            old, new = legacy_rank(db, user_id), db.get_user_rank(user_id)
+            if (old is None) != (new is None) or (new is not None and new > old):
+                mismatches += 1
+        print(f"Rank sanity check: {mismatches} mismatches out of 10")
+
+        print(f"Timings over {SAMPLES} random users:")
+        measure("ROW_NUMBER (old)", lambda uid: legacy_rank(db, uid), user_ids)
+        measure("get_user_rank (COUNT)", db.get_user_rank, user_ids)
+        measure("get_rank_window(radius=5)", lambda uid: db.get_rank_window(uid, 5), user_ids)
+    finally:
+        if not keep:
+            with db.connection() as conn, conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+                conn.commit()
+        db.close_all_connections()
+
+
+if __name__ == "__main__":
+    main()
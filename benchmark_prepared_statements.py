@@ -0,0 +1,139 @@
+"""
+Benchmark Prepared Statements
+Горячие запросы (прогресс, лидерборды, сохранение прогресса, достижение) под нагрузкой
+из нескольких потоков: обычный execute против PREPARE/EXECUTE.
+Запись выполняется в транзакции, которая откатывается, - данные не меняются
+
+Запуск:
+    python benchmark_prepared_statements.py [потоков] [итераций на поток]
+"""
+
+import random
+import sys
+import threading
+import time
+
+from database_manager import DatabaseManager
+
+
+DEFAULT_THREADS = 8
+DEFAULT_ITERATIONS = 500
+
+
+def load_ids(db):
+    """Существующие пользователи, уровни и достижения для параметров запросов"""
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT user_id FROM users ORDER BY user_id LIMIT 200")
+        user_ids = [row[0] for row in cur.fetchall()]
+        cur.execute("SELECT level_id FROM levels ORDER BY level_id")
+        level_ids = [row[0] for row in cur.fetchall()]
+        cur.execute("SELECT achievement_id FROM achievements ORDER BY achievement_id")
+        achievement_ids = [row[0] for row in cur.fetchall()]
+    return user_ids, level_ids, achievement_ids
+
+
+def one_round(db, rng, user_ids, level_ids, achievement_ids):
+    """Одна «игровая» смесь запросов; кэш лидерборда обходится, чтобы мерить саму БД"""
+    user_id = rng.choice(user_ids)
+    level_id = rng.choice(level_ids)
+    db.get_user_progress(user_id)
+    db._load_leaderboard(None, 10)
+    db._load_leaderboard(level_id, 10)
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            db._save_level_progress(cur, user_id, level_id, rng.randint(0, 5000),
+                                    rng.randint(10, 300), rng.random() < 0.5)
+            if achievement_ids:
+                db._unlock_achievement(cur, user_id, rng.choice(achievement_ids))
+        conn.rollback()
+
+
+def run_load(db, threads, iterations, ids):
+    """Прогнать нагрузку, вернуть (секунды, задержки раундов в мс)"""
+    timings = []
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        local = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            one_round(db, rng, *ids)
+            local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            timings.extend(local)
+
+    # Прогрев: соединения открыты, запросы подготовлены
+    one_round(db, random.Random(0), *ids)
+    db.query_metrics.reset()
+
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start, sorted(timings)
+
+
+def planning_times(db, ids):
+    """Время планирования каждого горячего запроса (то, что PREPARE экономит на каждом вызове)"""
+    user_ids, level_ids, achievement_ids = ids
+    samples = {
+        'get_user_progress': (user_ids[0],),
+        'leaderboard': (10,),
+        'level_leaderboard': (level_ids[0], 10),
+        'save_level_progress': (user_ids[0], level_ids[0], 1000, True, 60, level_ids[0] + 1),
+        'unlock_achievement': (user_ids[0], achievement_ids[0] if achievement_ids else 1)
+    }
+    result = {}
+    with db.connection() as conn, conn.cursor() as cur:
+        for name, sql in db.statements.statements.items():
+            if name not in samples:
+                continue
+            text, args = db.statements.plain(name, sql, samples[name])
+            # Без ANALYZE запрос не выполняется, SUMMARY добавляет Planning Time
+            cur.execute("EXPLAIN (SUMMARY ON) " + text, args)
+            for (line,) in cur.fetchall():
+                if line.strip().startswith("Planning Time"):
+                    result[name] = float(line.split(":")[1].split()[0])
+        conn.rollback()
+    return result
+
+
+def report(name, elapsed, timings, rounds):
+    p50 = timings[len(timings) // 2]
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"  {name:<20} {rounds / elapsed:8.0f} rounds/s   p50 {p50:6.2f} ms   "
+          f"p95 {p95:6.2f} ms   p99 {p99:6.2f} ms")
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_THREADS
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_ITERATIONS
+
+    plain_db = DatabaseManager(prepare_statements=False)
+    prepared_db = DatabaseManager(prepare_statements=True)
+    try:
+        ids = load_ids(plain_db)
+        if not ids[0] or not ids[1]:
+            print("Need at least one user and one level in the database (see seed scripts)")
+            return
+
+        print(f"{threads} threads x {iterations} rounds (5 hot queries per round):")
+        for name, db in (("execute (plain)", plain_db), ("PREPARE/EXECUTE", prepared_db)):
+            elapsed, timings = run_load(db, threads, iterations, ids)
+            report(name, elapsed, timings, threads * iterations)
+
+        print("Planning time per call saved by prepared statements:")
+        for name, ms in sorted(planning_times(plain_db, ids).items()):
+            print(f"  {name:<20} {ms:6.3f} ms")
+        print(f"Prepared registry: {prepared_db.statements.stats()}")
+    finally:
+        plain_db.close_all_connections()
+        prepared_db.close_all_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Check Progress Concurrency
+Проверка, что параллельные save_level_progress не теряют обновления.
+
+Несколько потоков одновременно сохраняют прогресс одного пользователя
+на одном уровне. В конце должно быть:
+- attempts = число всех сохранений
+- score = максимальный из отправленных
+- best_time = минимальное из отправленных
+"""
+
+import random
+import sys
+import threading
+import uuid
+
+from database_manager import DatabaseManager
+
+
+THREADS = 8
+SAVES_PER_THREAD = 25
+LEVEL_ID = 1
+
+
+def main():
+    db = DatabaseManager()
+    username = f"concurrency_{uuid.uuid4().hex[:8]}"
+    result = db.register_user(username, "check-password")
+    if not result['success']:
+        print(f"✗ Could not create test user: {result['error']}")
+        return 1
+    user_id = result['user']['user_id']
+
+    sent_scores = []
+    sent_times = []
+    errors = []
+    lock = threading.Lock()
+    start = threading.Barrier(THREADS)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        start.wait()  # Все потоки стартуют одновременно
+        for _ in range(SAVES_PER_THREAD):
+            score = rng.randint(0, 5000)
+            time_spent = rng.randint(20, 300)
+            saved = db.save_level_progress(user_id, LEVEL_ID, score, time_spent,
+                                           enemies_killed=0, completed=True)
+            with lock:
+                if saved['success']:
+                    sent_scores.append(score)
+                    sent_times.append(time_spent)
+                else:
+                    errors.append(saved['error'])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    try:
+        with db.connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT attempts, score, best_time, completed
+                FROM user_progress
+                WHERE user_id = %s AND level_id = %s
+            """, (user_id, LEVEL_ID))
+            attempts, score, best_time, completed = cur.fetchone()
+
+        expected = THREADS * SAVES_PER_THREAD
+        checks = [
+            ("no failed saves", not errors, f"{len(errors)} errors, first: {errors[:1]}"),
+            ("attempts", attempts == expected, f"{attempts} != {expected}"),
+            ("best score", score == max(sent_scores), f"{score} != {max(sent_scores)}"),
+            ("best time", best_time == min(sent_times), f"{best_time} != {min(sent_times)}"),
+            ("completed", completed, "level not marked completed"),
+        ]
+
+        failed = 0
+        for name, ok, detail in checks:
+            if ok:
+                print(f"✓ {name}")
+            else:
+                failed += 1
+                print(f"✗ {name}: {detail}")
+        return 1 if failed else 0
+    finally:
+        with db.connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM user_progress WHERE user_id = %s", (user_id,))
+            cur.execute("DELETE FROM users WHERE user_id = %s", (user_id,))
+            conn.commit()
+        db.close_all_connections()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""
+Check Query Plans
+Проверка планов запросов DatabaseManager на заполненной базе (seed_data.py).
+
+Скрипт вызывает методы DatabaseManager для игрока из середины таблицы и
+перехватывает каждый выполненный запрос (QueryMetrics.on_query). Для каждого
+запроса делается EXPLAIN (без выполнения); если в плане есть Seq Scan по
+большой таблице (больше --min-rows строк по статистике), проверка падает.
+Записывающие запросы выполняются в транзакции, которая откатывается, а
+удаление неактивных аккаунтов только перехватывается и не выполняется вовсе.
+
+Запуск:
+    python apply_schema.py
+    python seed_data.py --users 1000000
+    python check_query_plans.py [--min-rows=10000]
+"""
+
+import sys
+import time
+import uuid
+
+from database_manager import DatabaseManager
+
+
+DEFAULT_MIN_ROWS = 10000
+
+# Запросы, план которых имеет смысл проверять
+PLANNED_PREFIXES = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+
+class QueryIntercepted(Exception):
+    """Запрос перехвачен до выполнения (QueryCapture.intercept)"""
+
+
+class QueryCapture:
+    """Уникальные запросы (по тексту с параметрами-заглушками) с подставленными значениями"""
+
+    def __init__(self):
+        self.queries = {}  # Исходный текст -> (метод, SQL с подставленными параметрами)
+        self.label = None  # Имя метода, если запрос идёт через внутренний помощник
+        self.intercept = False  # Не давать выполнить проверяемый запрос (исключение вместо execute)
+
+    def __call__(self, tag, cursor, query, args):
+        text = query.decode('utf-8') if isinstance(query, bytes) else str(query)
+        if not text.lstrip().upper().startswith(PLANNED_PREFIXES):
+            return
+        if text not in self.queries:
+            sql = cursor.mogrify(query, args).decode('utf-8') if args is not None else text
+            self.queries[text] = (self.label or tag, sql)
+        if self.intercept:
+            raise QueryIntercepted(text)
+
+
+def exercise(db):
+    """Вызвать все запросы DatabaseManager для игрока из середины таблицы"""
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM users")
+        total = cur.fetchone()[0]
+        cur.execute("SELECT user_id, username FROM users ORDER BY user_id OFFSET %s LIMIT 1",
+                    (total // 2,))
+        user_id, username = cur.fetchone()
+        cur.execute("SELECT MIN(level_id) FROM levels")
+        level_id = cur.fetchone()[0]
+        cur.execute("SELECT MIN(achievement_id) FROM achievements")
+        achievement_id = cur.fetchone()[0]
+
+    capture = QueryCapture()
+    db.query_metrics.on_query = capture
+    try:
+        # Чтение
+        db.login_user(username, "not-the-password")
+        db.get_user_stats(user_id)
+        db.get_levels()
+        db.get_user_progress(user_id)
+        db.get_leaderboard(None, 10)
+        db.get_leaderboard(level_id, 10)
+        db.get_user_rank(user_id)
+        db.get_rank_window(user_id, 5)
+        db.get_achievements()
+        db.get_user_achievements(user_id)
+        db.delete_inactive_accounts(batch_size=1000, pause=0, dry_run=True)
+
+        # Запись: те же запросы, что в save_level_progress / unlock_achievement /
+        # check_achievements / record_session, но с откатом
+        with db.connection() as conn, conn.cursor() as cur:
+            capture.label = 'save_level_progress'
+            db._save_level_progress(cur, user_id, level_id, 0, 999, False)
+            if achievement_id is not None:
+                capture.label = 'unlock_achievement'
+                db._unlock_achievement(cur, user_id, achievement_id)
+            capture.label = 'check_achievements'
+            db._check_achievements(cur, [user_id])
+            capture.label = 'record_session'
+            now = time.time()
+            db._record_session(cur, uuid.uuid4().hex, user_id, now - 60, now, 0)
+            conn.rollback()
+
+        # DELETE окна очистки: запрос только перехватывается, соединение откатывается
+        capture.label = 'delete_inactive_accounts'
+        capture.intercept = True
+        try:
+            db._inactive_accounts_batch(0, 36500, 1000, False)
+        except QueryIntercepted:
+            pass
+    finally:
+        capture.label = None
+        capture.intercept = False
+        db.query_metrics.on_query = None
+    return capture.queries
+
+
+def large_tables(db, min_rows):
+    """Таблицы текущей схемы, в которых по статистике не меньше min_rows строк"""
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.relname
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = current_schema() AND c.relkind = 'r' AND c.reltuples >= %s
+        """, (min_rows,))
+        return {row[0] for row in cur.fetchall()}
+
+
+def seq_scans(plan, tables):
+    """Узлы Seq Scan по таблицам из tables (рекурсивно по плану)"""
+    found = []
+    if plan.get('Node Type') == 'Seq Scan' and plan.get('Relation Name') in tables:
+        found.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        found.extend(seq_scans(child, tables))
+    return found
+
+
+def main():
+    min_rows = next((int(arg.split("=")[1]) for arg in sys.argv[1:] if arg.startswith("--min-rows=")),
+                    DEFAULT_MIN_ROWS)
+
+    # Без PREPARE: перехватывается обычный текст запросов
+    db = DatabaseManager(prepare_statements=False, bcrypt_rounds=4)
+    try:
+        tables = large_tables(db, min_rows)
+        if not tables:
+            print(f"✗ No table has {min_rows}+ rows - seed the database first (seed_data.py)")
+            return 1
+        print(f"Large tables: {', '.join(sorted(tables))}")
+
+        queries = exercise(db)
+        failed = 0
+        with db.connection() as conn, conn.cursor() as cur:
+            for tag, sql in sorted(queries.values()):
+                cur.execute("EXPLAIN (FORMAT JSON) " + sql)
+                plan = cur.fetchone()[0][0]['Plan']
+                scans = seq_scans(plan, tables)
+                if scans:
+                    failed += 1
+                    print(f"✗ {tag}: Seq Scan on {', '.join(sorted(set(scans)))}")
+                    print("    " + " ".join(sql.split())[:300])
+                else:
+                    print(f"✓ {tag}")
+            conn.rollback()
+
+        print(f"{len(queries)} queries checked, {failed} with sequential scans on large tables")
+        return 1 if failed else 0
+    finally:
+        db.close_all_connections()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
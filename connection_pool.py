@@ -0,0 +1,227 @@
+"""
+Connection Pool для Mario Clash
+Потокобезопасный пул соединений PostgreSQL с проверкой здоровья и метриками
+"""
+
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+
+class PoolTimeout(TimeoutError):
+    """Не удалось получить соединение за отведённое время"""
+
+
+class ConnectionPool:
+    """
+    Пул соединений, безопасный для нескольких потоков.
+
+    - getconn() ждёт свободное соединение не дольше timeout (PoolTimeout)
+    - соединение, простоявшее дольше health_check_interval, проверяется SELECT 1
+      перед выдачей; сломанные соединения пересоздаются
+    - соединения, которые держат дольше leak_threshold, считаются утечками
+      (печатается место, где соединение было взято)
+    """
+
+    def __init__(self, minconn, maxconn, timeout=10.0, health_check_interval=30.0,
+                 leak_threshold=60.0, **conn_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.leak_threshold = leak_threshold
+        self.conn_kwargs = conn_kwargs
+
+        self.condition = threading.Condition()
+        self.idle = []  # [(conn, время возврата в пул)], последний - самый «тёплый»
+        self.in_use = {}  # id(conn) -> {'conn', 'since', 'thread', 'stack'}
+        self.total = 0  # Открытых соединений (idle + in_use)
+        self.closed = False
+
+        # Метрики
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.timeouts = 0
+        self.health_failures = 0
+        self.leaks_reported = set()
+
+        for _ in range(minconn):
+            conn = self._connect()
+            self.idle.append((conn, time.monotonic()))
+            self.total += 1
+
+    def _connect(self):
+        """Открыть новое соединение"""
+        return psycopg2.connect(**self.conn_kwargs)
+
+    def _is_healthy(self, conn, idle_since):
+        """Проверка соединения перед выдачей"""
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            if not conn.closed:
+                conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self, timeout=None):
+        """Взять соединение из пула (ждать не дольше timeout секунд)"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+
+        with self.condition:
+            while True:
+                if self.closed:
+                    raise PoolError("connection pool is closed")
+                if self.idle or self.total < self.maxconn:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    self._report_leaks()
+                    raise PoolTimeout(f"no free connection after {timeout:.1f}s "
+                                      f"({len(self.in_use)}/{self.maxconn} in use)")
+                waited = True
+                self.condition.wait(remaining)
+
+            if self.idle:
+                conn, idle_since = self.idle.pop()
+            else:
+                conn, idle_since = None, None
+                self.total += 1  # Резервируем место под новое соединение
+
+        # Проверка и создание соединений - без блокировки пула
+        try:
+            if conn is not None and not self._is_healthy(conn, idle_since):
+                with self.condition:
+                    self.health_failures += 1
+                self._discard(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self.condition:
+                self.total -= 1
+                self.condition.notify()
+            raise
+
+        wait_time = time.monotonic() - start
+        with self.condition:
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+            self.wait_time_total += wait_time
+            self.wait_time_max = max(self.wait_time_max, wait_time)
+            self.in_use[id(conn)] = {
+                'conn': conn,
+                'since': time.monotonic(),
+                'thread': threading.current_thread().name,
+                'stack': traceback.extract_stack(limit=8)[:-1]
+            }
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Вернуть соединение в пул"""
+        # Незавершённая транзакция не должна достаться следующему владельцу
+        if not close and not conn.closed:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+
+        with self.condition:
+            if self.in_use.pop(id(conn), None) is None:
+                raise PoolError("trying to put unkeyed connection")
+            self.leaks_reported.discard(id(conn))
+            if close or conn.closed or self.closed:
+                self._discard(conn)
+                self.total -= 1
+            else:
+                self.idle.append((conn, time.monotonic()))
+            self.condition.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """with pool.connection() as conn: ... - соединение вернётся в пул в любом случае"""
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        except Exception:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            raise
+        finally:
+            self.putconn(conn)
+
+    def _report_leaks(self):
+        """Напечатать соединения, которые держат слишком долго (под блокировкой)"""
+        now = time.monotonic()
+        leaks = []
+        for key, checkout in self.in_use.items():
+            held = now - checkout['since']
+            if held < self.leak_threshold:
+                continue
+            leaks.append(checkout)
+            if key not in self.leaks_reported:
+                self.leaks_reported.add(key)
+                origin = ''.join(traceback.format_list(checkout['stack'][-3:]))
+                print(f"⚠ Connection held for {held:.0f}s by thread {checkout['thread']}:\n{origin}")
+        return leaks
+
+    def check_leaks(self):
+        """Соединения, которые держат дольше leak_threshold"""
+        with self.condition:
+            return len(self._report_leaks())
+
+    def stats(self):
+        """Текущее состояние пула"""
+        with self.condition:
+            return {
+                'in_use': len(self.in_use),
+                'idle': len(self.idle),
+                'total': self.total,
+                'max': self.maxconn,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'avg_wait_ms': self.wait_time_total / self.checkouts * 1000 if self.checkouts else 0.0,
+                'max_wait_ms': self.wait_time_max * 1000,
+                'timeouts': self.timeouts,
+                'health_failures': self.health_failures,
+                'leaks': len(self._report_leaks())
+            }
+
+    def closeall(self):
+        """Закрыть все соединения"""
+        with self.condition:
+            self.closed = True
+            for conn, _ in self.idle:
+                self._discard(conn)
+            self.total -= len(self.idle)
+            self.idle = []
+            for checkout in self.in_use.values():
+                self._discard(checkout['conn'])
+            self.condition.notify_all()
@@ -15,12 +15,9 @@ def create_admin():
 
     # Удаляем старого админа если есть
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM users WHERE username = 'admin'")
-        conn.commit()
-        cursor.close()
-        db.release_connection(conn)
+        with db.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("DELETE FROM users WHERE username = 'admin'")
+            conn.commit()
         print("✓ Old admin removed")
     except:
         pass
@@ -32,12 +29,9 @@ def create_admin():
         print("✓ User 'admin' created")
 
         # Делаем его админом
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE users SET role = 'admin' WHERE username = 'admin'")
-        conn.commit()
-        cursor.close()
-        db.release_connection(conn)
+        with db.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("UPDATE users SET role = 'admin' WHERE username = 'admin'")
+            conn.commit()
 
         print("✓ Role set to 'admin'")
         print()
@@ -0,0 +1,201 @@
+"""
+Daily Stats для Mario Clash
+Дневные агрегаты (таблица daily_stats, schema/001_tables.sql): новые и активные игроки,
+набранные очки, пройденные уровни, открытые достижения. refresh() пересчитывает только
+дни начиная с последнего посчитанного, отчёт за период - чтение нескольких строк,
+экспорт в CSV/JSON для дашбордов.
+
+Запуск:
+    python daily_stats.py refresh [--since=2026-01-01]
+    python daily_stats.py report 2026-01-01 2026-01-31 [--out=reports/january.csv]
+"""
+
+import csv
+import json
+import os
+import sys
+from datetime import date, timedelta
+
+from database_manager import DatabaseManager
+
+
+REPORTS_DIR = os.environ.get("MARIO_REPORTS_DIR", "reports")
+
+# Столбцы daily_stats в порядке экспорта
+STAT_COLUMNS = ('new_users', 'active_users', 'scores_earned', 'levels_completed', 'achievements_unlocked')
+
+
+class DailyStats:
+    """
+    Накопительные дневные агрегаты.
+
+    День считается по времени событий из таблиц, в которые только добавляют:
+    регистрация (users.created_at), попытка уровня (level_plays.played_at),
+    игровая сессия (game_sessions.started_at), достижение (user_achievements.earned_at).
+    scores_earned - сумма очков всех попыток за день, levels_completed - число
+    успешных попыток. Попытки, сыгранные без сети, попадают в день синхронизации.
+    level_plays появилась позже остальных таблиц: в днях до неё активность видна
+    только по сессиям, а очков и прохождений нет - такая история неполна.
+    Пересчитываются последний посчитанный день (туда могли дописаться поздние
+    коммиты) и все следующие до сегодняшнего; более старые дни не меняются
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def refresh(self, since=None):
+        """Пересчитать дни начиная с since (по умолчанию - с последнего посчитанного), вернуть их число"""
+        with self.db.connection() as conn, conn.cursor() as cur:
+            if since is None:
+                cur.execute("SELECT MAX(day) FROM daily_stats")
+                since = cur.fetchone()[0]
+            if since is None:
+                # Первый запуск: с самой ранней регистрации
+                cur.execute("SELECT MIN(created_at)::date FROM users")
+                since = cur.fetchone()[0] or date.today()
+
+            cur.execute("""
+                WITH days AS (
+                    SELECT d::date AS day
+                    FROM generate_series(%(since)s::date, CURRENT_DATE, INTERVAL '1 day') d
+                ),
+                new_users AS (
+                    SELECT created_at::date AS day, COUNT(*) AS value
+                    FROM users
+                    WHERE created_at >= %(since)s::date
+                    GROUP BY 1
+                ),
+                active_users AS (
+                    SELECT day, COUNT(DISTINCT user_id) AS value
+                    FROM (
+                        SELECT played_at::date AS day, user_id
+                        FROM level_plays
+                        WHERE played_at >= %(since)s::date
+                        UNION ALL
+                        SELECT started_at::date, user_id
+                        FROM game_sessions
+                        WHERE started_at >= %(since)s::date
+                    ) activity
+                    GROUP BY day
+                ),
+                plays AS (
+                    SELECT played_at::date AS day,
+                           SUM(score) AS scores,
+                           COUNT(*) FILTER (WHERE completed) AS completions
+                    FROM level_plays
+                    WHERE played_at >= %(since)s::date
+                    GROUP BY 1
+                ),
+                unlocked AS (
+                    SELECT earned_at::date AS day, COUNT(*) AS value
+                    FROM user_achievements
+                    WHERE earned_at >= %(since)s::date
+                    GROUP BY 1
+                )
+                INSERT INTO daily_stats
+                    (day, new_users, active_users, scores_earned, levels_completed,
+                     achievements_unlocked, refreshed_at)
+                SELECT d.day,
+                       COALESCE(nu.value, 0),
+                       COALESCE(au.value, 0),
+                       COALESCE(p.scores, 0),
+                       COALESCE(p.completions, 0),
+                       COALESCE(u.value, 0),
+                       CURRENT_TIMESTAMP
+                FROM days d
+                LEFT JOIN new_users nu ON nu.day = d.day
+                LEFT JOIN active_users au ON au.day = d.day
+                LEFT JOIN plays p ON p.day = d.day
+                LEFT JOIN unlocked u ON u.day = d.day
+                ON CONFLICT (day) DO UPDATE
+                SET new_users = EXCLUDED.new_users,
+                    active_users = EXCLUDED.active_users,
+                    scores_earned = EXCLUDED.scores_earned,
+                    levels_completed = EXCLUDED.levels_completed,
+                    achievements_unlocked = EXCLUDED.achievements_unlocked,
+                    refreshed_at = EXCLUDED.refreshed_at
+            """, {'since': since})
+            refreshed = cur.rowcount
+            conn.commit()
+        return refreshed
+
+    def report(self, start, end):
+        """
+        Отчёт за дни [start, end]: строки по дням и итоги.
+        Активные игроки не суммируются (один игрок активен много дней) - даны среднее и пик
+        """
+        with self.db.connection() as conn, conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT day, {', '.join(STAT_COLUMNS)}
+                FROM daily_stats
+                WHERE day BETWEEN %s AND %s
+                ORDER BY day
+            """, (start, end))
+            days = [dict(zip(('day',) + STAT_COLUMNS, row)) for row in cur.fetchall()]
+
+        totals = {column: sum(row[column] for row in days)
+                  for column in STAT_COLUMNS if column != 'active_users'}
+        active = [row['active_users'] for row in days]
+        totals['avg_daily_active_users'] = round(sum(active) / len(active), 1) if active else 0.0
+        totals['peak_daily_active_users'] = max(active, default=0)
+        return {'from': str(start), 'to': str(end), 'days': days, 'totals': totals}
+
+    def weekly_report(self, end=None):
+        """Отчёт за 7 дней, заканчивающихся вчера (или end)"""
+        end = end or date.today() - timedelta(days=1)
+        return self.report(end - timedelta(days=6), end)
+
+    @staticmethod
+    def export(report, path):
+        """Сохранить отчёт: .csv - строка на день, .json - дни и итоги"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(('day',) + STAT_COLUMNS)
+                for row in report['days']:
+                    writer.writerow([row['day']] + [row[column] for column in STAT_COLUMNS])
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, default=str)
+        return path
+
+
+def print_report(report):
+    totals = report['totals']
+    print(f"  Period: {report['from']} .. {report['to']}")
+    print(f"  New Users: {totals['new_users']}")
+    print(f"  Daily Active Users: avg {totals['avg_daily_active_users']}, peak {totals['peak_daily_active_users']}")
+    print(f"  Scores Earned: {totals['scores_earned']}")
+    print(f"  Levels Completed: {totals['levels_completed']}")
+    print(f"  Achievements Unlocked: {totals['achievements_unlocked']}")
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+    command = args[0] if args else "refresh"
+
+    db = DatabaseManager()
+    try:
+        stats = DailyStats(db)
+        if command == "refresh":
+            since = date.fromisoformat(options["since"]) if "since" in options else None
+            print(f"✓ Refreshed {stats.refresh(since)} days")
+        elif command == "report" and len(args) >= 3:
+            report = stats.report(date.fromisoformat(args[1]), date.fromisoformat(args[2]))
+            print_report(report)
+            if "out" in options:
+                print(f"✓ Exported to {stats.export(report, options['out'])}")
+        else:
+            print(__doc__)
+            return 1
+        return 0
+    finally:
+        db.close_all_connections()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
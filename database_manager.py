@@ -4,26 +4,171 @@ Database Manager для Mario Clash
 """
 
 import psycopg2
-from psycopg2 import pool
 from psycopg2.extras import RealDictCursor
-import bcrypt
 from datetime import datetime, timedelta
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from connection_pool import ConnectionPool
+from query_cache import QueryCache
+from password_hashing import PasswordHasher, BCRYPT_ROUNDS
+from query_metrics import QueryMetrics, SLOW_QUERY_MS
+from prepared_statements import PreparedStatements
+
+
+# Сколько секунд статистика пользователя считается свежей
+USER_STATS_TTL = 30.0
+
+# Пауза перед повторным запросом статистики после ошибки
+USER_STATS_RETRY_DELAY = 5.0
+
+# Неактивный аккаунт: игрок, зарегистрированный раньше чем N дней назад и ни разу не сыгравший
+INACTIVE_ACCOUNT_DAYS = 7
+INACTIVE_ACCOUNT_CONDITION = """
+    u.role = 'player'
+    AND u.created_at < CURRENT_TIMESTAMP - make_interval(days => %(days)s)
+    AND NOT EXISTS (SELECT 1 FROM user_progress up WHERE up.user_id = u.user_id)
+"""
+
+# Время жизни закэшированных запросов (секунды) по пространствам QueryCache
+QUERY_CACHE_TTLS = {
+    'leaderboard': 5.0,  # Лидерборд терпит несколько секунд задержки
+    'levels': 3600.0,  # Каталоги почти не меняются
+    'achievements': 3600.0
+}
+
+
+def cleanup_progress_printer(every=10.0):
+    """on_progress для delete_inactive_accounts: строка прогресса не чаще раза в every секунд"""
+    last_report = [time.monotonic()]
+
+    def report(last_user_id, max_user_id, affected):
+        now = time.monotonic()
+        if now - last_report[0] >= every or last_user_id >= max_user_id:
+            last_report[0] = now
+            percent = last_user_id / max_user_id * 100 if max_user_id else 100.0
+            print(f"    ... {percent:5.1f}% scanned (user_id {last_user_id}/{max_user_id}), "
+                  f"{affected} inactive so far")
+    return report
+
+
+class UserStatsCache:
+    """
+    Кэш статистики пользователей с TTL.
+    peek() никогда не ждёт БД: возвращает то, что есть (возможно устаревшее),
+    и при необходимости запускает обновление в фоновом потоке
+    """
+
+    def __init__(self, loader, ttl=USER_STATS_TTL, retry_delay=USER_STATS_RETRY_DELAY):
+        self.loader = loader  # Функция user_id -> dict со статистикой
+        self.ttl = ttl
+        self.retry_delay = retry_delay
+        self.lock = threading.Lock()
+        self.entries = {}  # user_id -> {'stats', 'expires', 'generation', 'loading'}
+
+    def _entry(self, user_id):
+        entry = self.entries.get(user_id)
+        if entry is None:
+            entry = {'stats': None, 'expires': 0.0, 'generation': 0, 'loading': False}
+            self.entries[user_id] = entry
+        return entry
+
+    def peek(self, user_id):
+        """Статистика из кэша (None если ещё не загружена), без ожидания БД"""
+        with self.lock:
+            entry = self._entry(user_id)
+            stats = entry['stats']
+            if entry['loading'] or time.monotonic() < entry['expires']:
+                return stats
+            entry['loading'] = True
+            generation = entry['generation']
+
+        thread = threading.Thread(target=self._refresh, args=(user_id, generation), daemon=True)
+        thread.start()
+        return stats
+
+    def get(self, user_id):
+        """Статистика с ожиданием БД, если в кэше нет свежей"""
+        with self.lock:
+            entry = self._entry(user_id)
+            if entry['stats'] is not None and time.monotonic() < entry['expires']:
+                return entry['stats']
+            generation = entry['generation']
+
+        stats = self.loader(user_id)
+        self._store(user_id, generation, stats)
+        return stats
+
+    def _refresh(self, user_id, generation):
+        """Фоновая загрузка статистики"""
+        try:
+            stats = self.loader(user_id)
+        except Exception as e:
+            print(f"Error loading user stats: {e}")
+            with self.lock:
+                entry = self._entry(user_id)
+                entry['loading'] = False
+                entry['expires'] = time.monotonic() + self.retry_delay
+            return
+
+        self._store(user_id, generation, stats, finished_loading=True)
+
+    def _store(self, user_id, generation, stats, finished_loading=False):
+        with self.lock:
+            entry = self._entry(user_id)
+            if finished_loading:
+                entry['loading'] = False
+            # Пока шёл запрос, данные успели измениться - результат уже устарел
+            if entry['generation'] != generation:
+                return
+            entry['stats'] = stats
+            entry['expires'] = time.monotonic() + self.ttl
+
+    def invalidate(self, user_id=None):
+        """
+        Пометить статистику устаревшей (одного пользователя или всех).
+        Старые значения остаются видны, пока не придут новые. Идущая загрузка
+        не сбрасывается (второй поток не запускается): её результат будет
+        отброшен по generation, и следующий peek() загрузит заново
+        """
+        with self.lock:
+            targets = [user_id] if user_id is not None else list(self.entries)
+            for uid in targets:
+                entry = self._entry(uid)
+                entry['generation'] += 1
+                entry['expires'] = 0.0
 
 
 class DatabaseManager:
     def __init__(self, host='localhost', database='mario_clash_db',
                  user='mario_app_user', password='1708',
-                 port=5432):
-        """Инициализация менеджера БД с пулом соединений"""
+                 port=5432, pool_timeout=10.0, bcrypt_rounds=BCRYPT_ROUNDS,
+                 slow_query_ms=SLOW_QUERY_MS, prepare_statements=True, max_connections=10,
+                 **connect_kwargs):
+        """
+        Инициализация менеджера БД с пулом соединений
+        (connect_kwargs передаются в psycopg2.connect, например options)
+        """
+        # Каждый запрос замеряется и помечается именем вызвавшего метода
+        self.query_metrics = QueryMetrics(slow_query_ms=slow_query_ms)
+
+        # Горячие запросы готовятся на сервере один раз на соединение
+        self.statements = PreparedStatements(enabled=prepare_statements)
+
         try:
-            self.connection_pool = psycopg2.pool.SimpleConnectionPool(
-                1, 10,  # min и max соединений
+            # Потокобезопасный пул: статистика и запись идут из фоновых потоков
+            self.connection_pool = ConnectionPool(
+                1, max_connections,  # min и max соединений
+                timeout=pool_timeout,
                 host=host,
                 database=database,
                 user=user,
                 password=password,
-                port=port
+                port=port,
+                connection_factory=self.query_metrics.connection_class,
+                **connect_kwargs
             )
             if self.connection_pool:
                 print("✓ Connection pool created successfully")
@@ -31,96 +176,164 @@ class DatabaseManager:
             print(f"✗ Error creating connection pool: {e}")
             raise
 
-    def get_connection(self):
-        """Получить соединение из пула"""
-        return self.connection_pool.getconn()
+        self.stats_cache = UserStatsCache(self.get_user_stats)
+        self.query_cache = QueryCache()
+
+        # bcrypt в пуле процессов, вход/регистрация для UI - в фоновом потоке
+        self.hasher = PasswordHasher(rounds=bcrypt_rounds)
+        self.auth_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="db-auth")
+
+    def get_connection(self, timeout=None):
+        """Получить соединение из пула (лучше использовать with self.connection())"""
+        return self.connection_pool.getconn(timeout)
 
     def release_connection(self, conn):
         """Вернуть соединение в пул"""
         self.connection_pool.putconn(conn)
 
+    def connection(self, timeout=None):
+        """
+        Соединение на время блока with: возвращается в пул в любом случае,
+        при исключении транзакция откатывается
+        """
+        return self.connection_pool.connection(timeout)
+
+    def _cached(self, key, loader):
+        """Результат запроса через QueryCache (копии строк - вызывающий код может их менять)"""
+        rows = self.query_cache.get_or_load(key, loader, QUERY_CACHE_TTLS[key[0]])
+        return [dict(row) for row in rows]
+
+    def invalidate_queries(self, *namespaces):
+        """Сбросить кэш запросов ('leaderboard', 'levels', 'achievements'; без аргументов - всё)"""
+        self.query_cache.invalidate(*namespaces)
+
+    def cache_stats(self):
+        """Метрики кэша запросов (hit_rate по пространствам)"""
+        return self.query_cache.stats()
+
+    def pool_stats(self):
+        """Состояние пула: занятые/свободные соединения, ожидание, утечки"""
+        return self.connection_pool.stats()
+
+    def stats(self):
+        """
+        Снимок всех метрик: запросы по методам (задержки, гистограммы, строки),
+        медленные запросы, пул соединений, кэш запросов, подготовленные запросы
+        """
+        queries = self.query_metrics.snapshot()
+        return {
+            'queries': queries['methods'],
+            'slow_queries': queries['slow_queries'],
+            'pool': self.pool_stats(),
+            'cache': self.cache_stats(),
+            'prepared': self.statements.stats()
+        }
+
     def close_all_connections(self):
         """Закрыть все соединения"""
         if self.connection_pool:
             self.connection_pool.closeall()
+        self.auth_executor.shutdown(wait=False)
+        self.hasher.shutdown()
 
     # ==========================================
     # МЕТОДЫ ДЛЯ ПОЛЬЗОВАТЕЛЕЙ
     # ==========================================
 
     def hash_password(self, password):
-        """Хеширование пароля с использованием bcrypt"""
-        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        """Хеширование пароля с использованием bcrypt (в пуле процессов)"""
+        return self.hasher.hash(password)
 
     def verify_password(self, password, hashed):
-        """Проверка пароля"""
-        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+        """Проверка пароля (в пуле процессов)"""
+        return self.hasher.verify(password, hashed)
+
+    def hash_passwords(self, passwords):
+        """Хеши для многих паролей сразу на всех ядрах (массовое создание аккаунтов)"""
+        return self.hasher.hash_many(passwords)
+
+    def login_user_async(self, username, password):
+        """login_user в фоне: Future с тем же результатом (UI опрашивает done())"""
+        return self.auth_executor.submit(self.login_user, username, password)
+
+    def register_user_async(self, username, password):
+        """register_user в фоне: Future с тем же результатом"""
+        return self.auth_executor.submit(self.register_user, username, password)
 
     def register_user(self, username, password):
         """Регистрация нового пользователя"""
-        conn = self.get_connection()
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                # Проверка существования пользователя
-                cur.execute("SELECT user_id FROM users WHERE username = %s", (username,))
-                if cur.fetchone():
-                    return {'success': False, 'error': 'Username already exists'}
+        with self.connection() as conn:
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    # Проверка существования пользователя
+                    cur.execute("SELECT user_id FROM users WHERE username = %s", (username,))
+                    if cur.fetchone():
+                        return {'success': False, 'error': 'Username already exists'}
+
+                    # Создание пользователя
+                    hashed_password = self.hash_password(password)
+                    cur.execute("""
+                        INSERT INTO users (username, password, role, current_level)
+                        VALUES (%s, %s, 'player', 1)
+                        RETURNING user_id, username, role, current_level
+                    """, (username, hashed_password))
 
-                # Создание пользователя
-                hashed_password = self.hash_password(password)
-                cur.execute("""
-                    INSERT INTO users (username, password, role, current_level)
-                    VALUES (%s, %s, 'player', 1)
-                    RETURNING user_id, username, role, current_level
-                """, (username, hashed_password))
+                    user = cur.fetchone()
+                    conn.commit()
+                    self.invalidate_queries('leaderboard')
 
-                user = cur.fetchone()
-                conn.commit()
-
-                return {'success': True, 'user': dict(user)}
-        except Exception as e:
-            conn.rollback()
-            return {'success': False, 'error': str(e)}
-        finally:
-            self.release_connection(conn)
+                    return {'success': True, 'user': dict(user)}
+            except Exception as e:
+                conn.rollback()
+                return {'success': False, 'error': str(e)}
 
     def login_user(self, username, password):
         """Авторизация пользователя"""
-        conn = self.get_connection()
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    SELECT user_id, username, password, role, total_score, 
-                           current_level, banned
-                    FROM users
-                    WHERE username = %s
-                """, (username,))
+        with self.connection() as conn:
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    self.statements.execute(cur, 'login_user', """
+                        SELECT user_id, username, password, role, total_score,
+                               current_level, banned
+                        FROM users
+                        WHERE username = $1
+                    """, (username,))
 
-                user = cur.fetchone()
+                    user = cur.fetchone()
 
-                if not user:
-                    return {'success': False, 'error': 'User not found'}
+                    if not user:
+                        return {'success': False, 'error': 'User not found'}
 
-                if user['banned']:
-                    return {'success': False, 'error': 'Account is banned'}
+                    if user['banned']:
+                        return {'success': False, 'error': 'Account is banned'}
 
-                if not self.verify_password(password, user['password']):
-                    return {'success': False, 'error': 'Invalid password'}
+                    if not self.verify_password(password, user['password']):
+                        return {'success': False, 'error': 'Invalid password'}
 
-                # Удаляем пароль из ответа
-                user_data = dict(user)
-                del user_data['password']
+                    # Стоимость bcrypt изменилась - пересчитываем хеш, пока пароль известен
+                    password_hash = user['password']
+                    if self.hasher.needs_rehash(password_hash):
+                        try:
+                            new_hash = self.hash_password(password)
+                            cur.execute("UPDATE users SET password = %s WHERE user_id = %s",
+                                        (new_hash, user['user_id']))
+                            conn.commit()
+                            password_hash = new_hash
+                        except Exception as e:
+                            conn.rollback()
+                            print(f"Error rehashing password: {e}")
 
-                return {'success': True, 'user': user_data}
-        except Exception as e:
-            return {'success': False, 'error': str(e)}
-        finally:
-            self.release_connection(conn)
+                    # Удаляем пароль из данных игрока; хеш - отдельно, для входа без сети (LocalStore)
+                    user_data = dict(user)
+                    del user_data['password']
+
+                    return {'success': True, 'user': user_data, 'password_hash': password_hash}
+            except Exception as e:
+                return {'success': False, 'error': str(e)}
 
     def get_user_stats(self, user_id):
-        """Получить статистику пользователя"""
-        conn = self.get_connection()
-        try:
+        """Получить статистику пользователя (None если пользователя нет)"""
+        with self.connection() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute("""
                     SELECT 
@@ -137,9 +350,16 @@ class DatabaseManager:
                     GROUP BY u.user_id
                 """, (user_id,))
 
-                return dict(cur.fetchone())
-        finally:
-            self.release_connection(conn)
+                row = cur.fetchone()
+                return dict(row) if row else None
+
+    def peek_user_stats(self, user_id):
+        """Статистика пользователя из кэша, без ожидания БД (для отрисовки)"""
+        return self.stats_cache.peek(user_id)
+
+    def invalidate_user_stats(self, user_id=None):
+        """Сбросить кэш статистики после изменения данных пользователя"""
+        self.stats_cache.invalidate(user_id)
 
     # ==========================================
     # МЕТОДЫ ДЛЯ УРОВНЕЙ И ПРОГРЕССА
@@ -147,8 +367,10 @@ class DatabaseManager:
 
     def get_levels(self):
         """Получить все уровни"""
-        conn = self.get_connection()
-        try:
+        return self._cached(('levels',), self._load_levels)
+
+    def _load_levels(self):
+        with self.connection() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute("""
                     SELECT level_id, title, max_score, difficulty
@@ -156,16 +378,13 @@ class DatabaseManager:
                     ORDER BY level_id
                 """)
                 return [dict(row) for row in cur.fetchall()]
-        finally:
-            self.release_connection(conn)
 
     def get_user_progress(self, user_id):
         """Получить прогресс пользователя по всем уровням"""
-        conn = self.get_connection()
-        try:
+        with self.connection() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    SELECT 
+                self.statements.execute(cur, 'get_user_progress', """
+                    SELECT
                         l.level_id,
                         l.title,
                         l.max_score,
@@ -174,12 +393,10 @@ class DatabaseManager:
                         COALESCE(up.attempts, 0) as attempts,
                         COALESCE(up.best_time, 0) as best_time
                     FROM levels l
-                    LEFT JOIN user_progress up ON l.level_id = up.level_id AND up.user_id = %s
+                    LEFT JOIN user_progress up ON l.level_id = up.level_id AND up.user_id = $1
                     ORDER BY l.level_id
                 """, (user_id,))
                 return [dict(row) for row in cur.fetchall()]
-        finally:
-            self.release_connection(conn)
 
     def save_level_progress(self, user_id, level_id, score, time_spent,
                             enemies_killed, completed=False):
@@ -190,68 +407,56 @@ class DatabaseManager:
         - Обычная черепаха: 200 очков
         - Шипастая черепаха: 500 очков
         - Бонус за время: до 500 очков
-        """
-        conn = self.get_connection()
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                # Проверяем существование записи
-                cur.execute("""
-                    SELECT progress_id, score, best_time, attempts
-                    FROM user_progress
-                    WHERE user_id = %s AND level_id = %s
-                """, (user_id, level_id))
-
-                existing = cur.fetchone()
-
-                if existing:
-                    # Обновляем только если новый счет лучше
-                    old_score = existing['score']
-                    old_best_time = existing['best_time']
-                    attempts = existing['attempts'] + 1
-
-                    new_score = max(old_score, score)
-                    new_best_time = min(old_best_time, time_spent) if old_best_time else time_spent
-
-                    cur.execute("""
-                        UPDATE user_progress
-                        SET score = %s,
-                            completed = %s,
-                            attempts = %s,
-                            time_spent = %s,
-                            best_time = %s,
-                            completed_at = CASE WHEN %s THEN CURRENT_TIMESTAMP ELSE completed_at END,
-                            updated_at = CURRENT_TIMESTAMP
-                        WHERE progress_id = %s
-                        RETURNING progress_id
-                    """, (new_score, completed, attempts, time_spent, new_best_time,
-                          completed, existing['progress_id']))
-                else:
-                    # Создаем новую запись
-                    cur.execute("""
-                        INSERT INTO user_progress 
-                        (user_id, level_id, score, completed, attempts, time_spent, best_time, completed_at)
-                        VALUES (%s, %s, %s, %s, 1, %s, %s, 
-                                CASE WHEN %s THEN CURRENT_TIMESTAMP ELSE NULL END)
-                        RETURNING progress_id
-                    """, (user_id, level_id, score, completed, time_spent, time_spent, completed))
-
-                progress_id = cur.fetchone()['progress_id']
-
-                # Обновляем текущий уровень пользователя
-                if completed:
-                    cur.execute("""
-                        UPDATE users
-                        SET current_level = GREATEST(current_level, %s)
-                        WHERE user_id = %s
-                    """, (level_id + 1, user_id))
 
+        Всё делается одним атомарным запросом: UPSERT прогресса и повышение
+        текущего уровня. Параллельные сохранения не теряют попытки и рекорды
+        """
+        with self.connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    progress_id = self._save_level_progress(cur, user_id, level_id, score,
+                                                            time_spent, completed)
                 conn.commit()
+                self.invalidate_user_stats(user_id)
+                self.invalidate_queries('leaderboard')
                 return {'success': True, 'progress_id': progress_id}
-        except Exception as e:
-            conn.rollback()
-            return {'success': False, 'error': str(e)}
-        finally:
-            self.release_connection(conn)
+            except Exception as e:
+                conn.rollback()
+                return {'success': False, 'error': str(e)}
+
+    def _save_level_progress(self, cur, user_id, level_id, score, time_spent, completed):
+        """UPSERT прогресса и запись попытки в level_plays на уже взятом курсоре (без commit), возвращает progress_id"""
+        # $1 user_id, $2 level_id, $3 score, $4 completed, $5 time_spent, $6 следующий уровень
+        self.statements.execute(cur, 'save_level_progress', """
+            WITH play AS (
+                INSERT INTO level_plays (user_id, level_id, score, completed, time_spent)
+                VALUES ($1, $2, $3, $4, $5)
+            ),
+            progress AS (
+                INSERT INTO user_progress
+                (user_id, level_id, score, completed, attempts, time_spent, best_time, completed_at)
+                VALUES ($1, $2, $3, $4, 1, $5, $5,
+                        CASE WHEN $4::boolean THEN CURRENT_TIMESTAMP ELSE NULL END)
+                ON CONFLICT (user_id, level_id) DO UPDATE
+                SET score = GREATEST(user_progress.score, EXCLUDED.score),
+                    completed = user_progress.completed OR EXCLUDED.completed,
+                    attempts = user_progress.attempts + 1,
+                    time_spent = EXCLUDED.time_spent,
+                    best_time = LEAST(NULLIF(user_progress.best_time, 0), EXCLUDED.best_time),
+                    completed_at = CASE WHEN EXCLUDED.completed THEN CURRENT_TIMESTAMP
+                                        ELSE user_progress.completed_at END,
+                    updated_at = CURRENT_TIMESTAMP
+                RETURNING progress_id
+            ),
+            level_bump AS (
+                -- Обновляем текущий уровень пользователя
+                UPDATE users
+                SET current_level = GREATEST(current_level, $6::integer)
+                WHERE user_id = $1 AND $4::boolean
+            )
+            SELECT progress_id FROM progress
+        """, (user_id, level_id, score, completed, time_spent, level_id + 1))
+        return cur.fetchone()[0]
 
     # ==========================================
     # МЕТОДЫ ДЛЯ ЛИДЕРБОРДА
@@ -259,26 +464,29 @@ class DatabaseManager:
 
     def get_leaderboard(self, level_id=None, limit=10):
         """Получить лидерборд (общий или по уровню)"""
-        conn = self.get_connection()
-        try:
+        return self._cached(('leaderboard', level_id, limit),
+                            lambda: self._load_leaderboard(level_id, limit))
+
+    def _load_leaderboard(self, level_id, limit):
+        with self.connection() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 if level_id:
                     # Лидерборд по конкретному уровню
-                    cur.execute("""
-                        SELECT 
+                    self.statements.execute(cur, 'level_leaderboard', """
+                        SELECT
                             ROW_NUMBER() OVER (ORDER BY score DESC, time_spent ASC) as rank,
                             username,
                             score,
                             time_spent
                         FROM leaderboard
-                        WHERE level_id = %s
+                        WHERE level_id = $1
                         ORDER BY score DESC, time_spent ASC
-                        LIMIT %s
+                        LIMIT $2
                     """, (level_id, limit))
                 else:
                     # Общий лидерборд
-                    cur.execute("""
-                        SELECT 
+                    self.statements.execute(cur, 'leaderboard', """
+                        SELECT
                             ROW_NUMBER() OVER (ORDER BY total_score DESC) as rank,
                             username,
                             total_score,
@@ -286,33 +494,110 @@ class DatabaseManager:
                         FROM users
                         WHERE banned = FALSE
                         ORDER BY total_score DESC
-                        LIMIT %s
+                        LIMIT $1
                     """, (limit,))
 
                 return [dict(row) for row in cur.fetchall()]
-        finally:
-            self.release_connection(conn)
 
     def get_user_rank(self, user_id):
-        """Получить ранг пользователя в общем лидерборде"""
-        conn = self.get_connection()
-        try:
+        """
+        Получить ранг пользователя в общем лидерборде.
+        Ранг = 1 + число игроков со строго большим счётом (одинаковый счёт - одинаковый ранг);
+        считается по индексу (banned, total_score DESC) без сортировки всей таблицы
+        """
+        with self.connection() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute("""
-                    WITH ranked_users AS (
-                        SELECT 
-                            user_id,
-                            ROW_NUMBER() OVER (ORDER BY total_score DESC) as rank
-                        FROM users
-                        WHERE banned = FALSE
-                    )
-                    SELECT rank FROM ranked_users WHERE user_id = %s
+                    SELECT 1 + (
+                        SELECT COUNT(*)
+                        FROM users higher
+                        WHERE higher.banned = FALSE
+                          AND higher.total_score > me.total_score
+                    ) as rank
+                    FROM users me
+                    WHERE me.user_id = %s AND me.banned = FALSE
                 """, (user_id,))
 
                 result = cur.fetchone()
                 return result['rank'] if result else None
-        finally:
-            self.release_connection(conn)
+
+    def get_rank_window(self, user_id, radius=5):
+        """
+        Игроки вокруг пользователя: до radius выше и до radius ниже него.
+        Порядок (total_score DESC, user_id DESC), соседи выбираются по ключу
+        (keyset) через индекс, а не через OFFSET/ROW_NUMBER.
+        Возвращает список словарей с rank, user_id, username, total_score, is_me
+        """
+        with self.connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("""
+                    WITH me AS (
+                        SELECT user_id, username, total_score
+                        FROM users
+                        WHERE user_id = %(user_id)s AND banned = FALSE
+                    ),
+                    above AS (
+                        SELECT u.user_id, u.username, u.total_score
+                        FROM users u, me
+                        WHERE u.banned = FALSE
+                          AND (u.total_score, u.user_id) > (me.total_score, me.user_id)
+                        ORDER BY u.total_score ASC, u.user_id ASC
+                        LIMIT %(radius)s
+                    ),
+                    below AS (
+                        SELECT u.user_id, u.username, u.total_score
+                        FROM users u, me
+                        WHERE u.banned = FALSE
+                          AND (u.total_score, u.user_id) < (me.total_score, me.user_id)
+                        ORDER BY u.total_score DESC, u.user_id DESC
+                        LIMIT %(radius)s
+                    ),
+                    board AS (
+                        SELECT * FROM above
+                        UNION ALL SELECT * FROM me
+                        UNION ALL SELECT * FROM below
+                    ),
+                    top AS (
+                        SELECT MAX(total_score) as total_score FROM board
+                    )
+                    SELECT
+                        b.user_id,
+                        b.username,
+                        b.total_score,
+                        (SELECT COUNT(*) FROM users h, top
+                         WHERE h.banned = FALSE AND h.total_score > top.total_score) as higher_than_top,
+                        (SELECT COUNT(*) FROM users h, top
+                         WHERE h.banned = FALSE AND h.total_score >= top.total_score) as at_least_top
+                    FROM board b
+                    ORDER BY b.total_score DESC, b.user_id DESC
+                """, {'user_id': user_id, 'radius': radius})
+
+                rows = [dict(row) for row in cur.fetchall()]
+
+        if not rows:
+            return []
+
+        # Ранги из двух счётчиков по верхней строке окна: все игроки между
+        # верхней строкой и любой строкой окна сами лежат в окне
+        top_score = rows[0]['total_score']
+        higher_than_top = rows[0]['higher_than_top']
+        at_least_top = rows[0]['at_least_top']
+        window = []
+        for row in rows:
+            score = row['total_score']
+            if score == top_score:
+                rank = higher_than_top + 1
+            else:
+                between = sum(1 for other in rows if top_score > other['total_score'] > score)
+                rank = at_least_top + between + 1
+            window.append({
+                'rank': rank,
+                'user_id': row['user_id'],
+                'username': row['username'],
+                'total_score': score,
+                'is_me': row['user_id'] == user_id
+            })
+        return window
 
     # ==========================================
     # МЕТОДЫ ДЛЯ ДОСТИЖЕНИЙ
@@ -320,8 +605,10 @@ class DatabaseManager:
 
     def get_achievements(self):
         """Получить все достижения"""
-        conn = self.get_connection()
-        try:
+        return self._cached(('achievements',), self._load_achievements)
+
+    def _load_achievements(self):
+        with self.connection() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute("""
                     SELECT achievement_id, title, description, icon, points
@@ -329,13 +616,10 @@ class DatabaseManager:
                     ORDER BY points ASC
                 """)
                 return [dict(row) for row in cur.fetchall()]
-        finally:
-            self.release_connection(conn)
 
     def get_user_achievements(self, user_id):
         """Получить достижения пользователя"""
-        conn = self.get_connection()
-        try:
+        with self.connection() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute("""
                     SELECT 
@@ -351,105 +635,297 @@ class DatabaseManager:
                     ORDER BY ua.earned_at DESC
                 """, (user_id,))
                 return [dict(row) for row in cur.fetchall()]
-        finally:
-            self.release_connection(conn)
+
+    def _unlock_achievement(self, cur, user_id, achievement_id):
+        """Вставка достижения на уже взятом соединении (без commit)"""
+        self.statements.execute(cur, 'unlock_achievement', """
+            INSERT INTO user_achievements (user_id, achievement_id)
+            VALUES ($1, $2)
+            ON CONFLICT (user_id, achievement_id) DO NOTHING
+            RETURNING user_achievement_id
+        """, (user_id, achievement_id))
+        return cur.fetchone() is not None  # True если достижение только что разблокировано
 
     def unlock_achievement(self, user_id, achievement_id):
-        """Разблокировать достижение для пользователя"""
-        conn = self.get_connection()
-        try:
+        """
+        Разблокировать достижение для пользователя.
+        Ошибки БД не глотаются: транзакция откатывается, исключение уходит
+        вызывающему (PersistenceWorker повторит запись с задержкой)
+        """
+        with self.connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO user_achievements (user_id, achievement_id)
-                    VALUES (%s, %s)
-                    ON CONFLICT (user_id, achievement_id) DO NOTHING
-                    RETURNING user_achievement_id
-                """, (user_id, achievement_id))
-
-                result = cur.fetchone()
-                conn.commit()
-                return result is not None  # True если достижение только что разблокировано
-        except Exception as e:
-            conn.rollback()
-            print(f"Error unlocking achievement: {e}")
-            return False
-        finally:
-            self.release_connection(conn)
+                unlocked = self._unlock_achievement(cur, user_id, achievement_id)
+            conn.commit()
+        if unlocked:
+            self.invalidate_user_stats(user_id)
+            self.invalidate_queries('leaderboard')
+        return unlocked
 
     def check_achievements(self, user_id):
         """Проверить и разблокировать достижения для пользователя"""
-        conn = self.get_connection()
-        newly_unlocked = []
-
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                # Получаем статистику пользователя
-                cur.execute("""
-                    SELECT 
-                        COUNT(*) FILTER (WHERE completed = TRUE AND level_id = 1) as level1_completed,
-                        COUNT(*) FILTER (WHERE completed = TRUE AND level_id = 3) as level3_completed,
-                        COUNT(*) FILTER (WHERE completed = TRUE) as total_completed,
-                        MIN(time_spent) FILTER (WHERE completed = TRUE) as best_time
-                    FROM user_progress
-                    WHERE user_id = %s
-                """, (user_id,))
+        return self.check_achievements_batch([user_id]).get(user_id, [])
 
-                stats = cur.fetchone()
+    def check_achievements_batch(self, user_ids, batch_size=1000):
+        """
+        Проверить достижения сразу для многих пользователей (например, бэкфилл).
 
-                # Достижение 1: Завершить уровень 1
-                if stats['level1_completed'] > 0:
-                    if self.unlock_achievement(user_id, 1):
-                        newly_unlocked.append(1)
+        Правила оцениваются одним запросом, новые достижения вставляются через
+        INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING.
+        Возвращает {user_id: [id новых достижений]}
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        newly_unlocked = {}
+
+        for start in range(0, len(user_ids), batch_size):
+            chunk = user_ids[start:start + batch_size]
+            with self.connection() as conn:
+                with conn.cursor() as cur:
+                    for uid, achievements in self._check_achievements(cur, chunk).items():
+                        newly_unlocked.setdefault(uid, []).extend(achievements)
+                conn.commit()
 
-                # Достижение 5: Завершить уровень 3
-                if stats['level3_completed'] > 0:
-                    if self.unlock_achievement(user_id, 5):
-                        newly_unlocked.append(5)
+        self._achievements_unlocked(newly_unlocked)
+        return newly_unlocked
 
-                # Достижение 4: Speed Runner (меньше 60 секунд)
-                if stats['best_time'] and stats['best_time'] < 60:
-                    if self.unlock_achievement(user_id, 4):
-                        newly_unlocked.append(4)
+    def _check_achievements(self, cur, user_ids):
+        """Оценка правил и вставка новых достижений на уже взятом курсоре (без commit)"""
+        cur.execute("""
+            WITH stats AS (
+                SELECT
+                    user_id,
+                    COUNT(*) FILTER (WHERE completed = TRUE AND level_id = 1) as level1_completed,
+                    COUNT(*) FILTER (WHERE completed = TRUE AND level_id = 3) as level3_completed,
+                    COUNT(*) FILTER (WHERE completed = TRUE) as total_completed,
+                    MIN(time_spent) FILTER (WHERE completed = TRUE) as best_time
+                FROM user_progress
+                WHERE user_id = ANY(%s)
+                GROUP BY user_id
+            )
+            INSERT INTO user_achievements (user_id, achievement_id)
+            SELECT s.user_id, rule.achievement_id
+            FROM stats s
+            CROSS JOIN LATERAL (VALUES
+                (1, s.level1_completed > 0),      -- Завершить уровень 1
+                (5, s.level3_completed > 0),      -- Завершить уровень 3
+                (4, s.best_time < 60),            -- Speed Runner (меньше 60 секунд)
+                (7, s.total_completed >= 3)       -- Completionist (все уровни)
+            ) AS rule(achievement_id, earned)
+            WHERE rule.earned
+            ON CONFLICT (user_id, achievement_id) DO NOTHING
+            RETURNING user_id, achievement_id
+        """, (user_ids,))
+
+        newly_unlocked = {}
+        for uid, achievement_id in cur.fetchall():
+            newly_unlocked.setdefault(uid, []).append(achievement_id)
+        for achievements in newly_unlocked.values():
+            achievements.sort()
+        return newly_unlocked
 
-                # Достижение 7: Completionist (все уровни)
-                if stats['total_completed'] >= 3:
-                    if self.unlock_achievement(user_id, 7):
-                        newly_unlocked.append(7)
+    def _achievements_unlocked(self, newly_unlocked):
+        """Сбросить кэши после разблокировки достижений {user_id: [...]}"""
+        for uid in newly_unlocked:
+            self.invalidate_user_stats(uid)
+        if newly_unlocked:
+            self.invalidate_queries('leaderboard')
 
-        finally:
-            self.release_connection(conn)
+    # ==========================================
+    # СЕССИИ И СИНХРОНИЗАЦИЯ ЛОКАЛЬНОГО ЖУРНАЛА
+    # ==========================================
 
-        return newly_unlocked
+    def _record_session(self, cur, session_id, user_id, started_at, ended_at, levels_completed):
+        """Записать игровую сессию на уже взятом курсоре (повторная запись игнорируется)"""
+        cur.execute("""
+            INSERT INTO game_sessions (session_id, user_id, started_at, ended_at, levels_completed)
+            VALUES (%s, %s, to_timestamp(%s), to_timestamp(%s), %s)
+            ON CONFLICT (session_id) DO NOTHING
+        """, (session_id, user_id, started_at, ended_at, levels_completed))
+
+    def record_session(self, session_id, user_id, started_at, ended_at, levels_completed=0):
+        """Записать игровую сессию (время - unix timestamp)"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                self._record_session(cur, session_id, user_id, started_at, ended_at, levels_completed)
+            conn.commit()
+            return True
 
+    def apply_event(self, event_id, method, args, kwargs):
+        """
+        Идемпотентно применить событие из локального журнала.
 
+        Номер события и сама запись фиксируются в одной транзакции, поэтому
+        повторная отправка того же события (после обрыва связи, перезапуска)
+        ничего не меняет. События забаненного игрока не применяются (ValueError -
+        ошибка данных, журнал отложит событие). Возвращает (применено ли сейчас,
+        результат метода)
+        """
+        appliers = {
+            'save_level_progress': self._apply_level_progress,
+            'unlock_achievement': self._apply_unlock_achievement,
+            'check_achievements': self._apply_check_achievements,
+            'record_session': self._record_session
+        }
+        applier = appliers.get(method)
+        if applier is None:
+            raise ValueError(f"Unknown journal event: {method}")
 
-    def delete_inactive_accounts(self):
-        """Удалить неактивные аккаунты (старше 7 дней)"""
-        conn = self.get_connection()
-        try:
+        with self.connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SELECT delete_inactive_accounts()")
-                deleted_count = cur.fetchone()[0]
-                conn.commit()
-                return deleted_count
-        finally:
-            self.release_connection(conn)
+                cur.execute("""
+                    INSERT INTO applied_events (event_id, kind)
+                    VALUES (%s, %s)
+                    ON CONFLICT (event_id) DO NOTHING
+                    RETURNING event_id
+                """, (event_id, method))
+                if cur.fetchone() is None:
+                    conn.rollback()
+                    return False, None  # Уже применено раньше
+
+                # Игрока могли забанить, пока событие ждало в журнале
+                user_id = self._event_user_id(method, args, kwargs)
+                cur.execute("SELECT banned FROM users WHERE user_id = %s", (user_id,))
+                row = cur.fetchone()
+                if row and row[0]:
+                    conn.rollback()
+                    raise ValueError(f"Journal event {method} rejected: user {user_id} is banned")
+
+                result = applier(cur, *args, **kwargs)
+            conn.commit()
+
+        # Кэши сбрасываются только после commit
+        if method == 'save_level_progress':
+            user_id = kwargs.get('user_id', args[0] if args else None)
+            self.invalidate_user_stats(user_id)
+            self.invalidate_queries('leaderboard')
+        elif method == 'unlock_achievement' and result:
+            self._achievements_unlocked({args[0]: [args[1]]})
+        elif method == 'check_achievements':
+            self._achievements_unlocked({args[0]: result} if result else {})
+        return True, result
+
+    @staticmethod
+    def _event_user_id(method, args, kwargs):
+        """user_id события журнала (у record_session он второй аргумент)"""
+        position = 1 if method == 'record_session' else 0
+        return kwargs.get('user_id', args[position] if len(args) > position else None)
+
+    def _apply_level_progress(self, cur, user_id, level_id, score, time_spent,
+                              enemies_killed, completed=False):
+        progress_id = self._save_level_progress(cur, user_id, level_id, score, time_spent, completed)
+        return {'success': True, 'progress_id': progress_id}
+
+    def _apply_unlock_achievement(self, cur, user_id, achievement_id):
+        return self._unlock_achievement(cur, user_id, achievement_id)
+
+    def _apply_check_achievements(self, cur, user_id):
+        return self._check_achievements(cur, [user_id]).get(user_id, [])
+
+    def delete_inactive_accounts(self, days=INACTIVE_ACCOUNT_DAYS, batch_size=1000, pause=0.1,
+                                 dry_run=False, on_progress=None):
+        """
+        Удалить неактивные аккаунты (старше days дней, без прогресса) пачками.
+
+        Таблица users проходится по user_id окнами по batch_size строк (keyset),
+        каждое окно - отдельная короткая транзакция, между окнами пауза pause секунд.
+        Строки, занятые игрой прямо сейчас, пропускаются (SKIP LOCKED), поэтому
+        очистка не мешает save_level_progress и может идти днём.
+        dry_run=True только считает, сколько аккаунтов было бы удалено.
+        on_progress(last_user_id, max_user_id, affected) вызывается после каждого окна.
+        Возвращает число удалённых (или найденных при dry_run) аккаунтов
+        """
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT COALESCE(MAX(user_id), 0) FROM users")
+            max_user_id = cur.fetchone()[0]
+            conn.rollback()
+
+        after = 0
+        affected = 0
+        lock_retries = 0
+        while after < max_user_id:
+            try:
+                last_id, count = self._inactive_accounts_batch(after, days, batch_size, dry_run)
+            except psycopg2.Error as e:
+                # 55P03 lock_not_available: окно упёрлось в чужую блокировку - повторим чуть позже
+                lock_retries += 1
+                if e.pgcode != '55P03' or lock_retries > 3:
+                    raise
+                time.sleep(max(pause, 0.5) * lock_retries)
+                continue
+            lock_retries = 0
+            if last_id is None:
+                break
+            after = last_id
+            affected += count
+            if count and not dry_run:
+                self.invalidate_queries('leaderboard')
+            if on_progress:
+                on_progress(after, max_user_id, affected)
+            if pause:
+                time.sleep(pause)
+        return affected
+
+    def _inactive_accounts_batch(self, after, days, batch_size, dry_run):
+        """Одно окно очистки: (последний просмотренный user_id или None, удалено/найдено)"""
+        params = {'after': after, 'limit': batch_size, 'days': days}
+        with self.connection() as conn, conn.cursor() as cur:
+            if dry_run:
+                cur.execute(f"""
+                    WITH scan AS (
+                        SELECT user_id FROM users
+                        WHERE user_id > %(after)s
+                        ORDER BY user_id
+                        LIMIT %(limit)s
+                    )
+                    SELECT (SELECT MAX(user_id) FROM scan),
+                           (SELECT COUNT(*) FROM users u JOIN scan USING (user_id)
+                            WHERE {INACTIVE_ACCOUNT_CONDITION})
+                """, params)
+                result = cur.fetchone()
+                conn.rollback()
+                return result
+
+            # Не ждать чужие блокировки дольше пары секунд (окно будет повторено)
+            cur.execute("SET LOCAL lock_timeout = '2s'")
+            cur.execute(f"""
+                WITH scan AS (
+                    SELECT user_id FROM users
+                    WHERE user_id > %(after)s
+                    ORDER BY user_id
+                    LIMIT %(limit)s
+                ),
+                victims AS (
+                    SELECT u.user_id FROM users u JOIN scan USING (user_id)
+                    WHERE {INACTIVE_ACCOUNT_CONDITION}
+                    FOR UPDATE OF u SKIP LOCKED
+                ),
+                achievements AS (
+                    DELETE FROM user_achievements ua USING victims v
+                    WHERE ua.user_id = v.user_id
+                ),
+                deleted AS (
+                    DELETE FROM users u USING victims v
+                    WHERE u.user_id = v.user_id
+                    RETURNING u.user_id
+                )
+                SELECT (SELECT MAX(user_id) FROM scan), (SELECT COUNT(*) FROM deleted)
+            """, params)
+            result = cur.fetchone()
+            conn.commit()
+            return result
 
     def create_backup(self, backup_type='full'):
         """Создать резервную копию"""
-        conn = self.get_connection()
-        try:
+        with self.connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("SELECT create_backup(%s)", (backup_type,))
                 backup_id = cur.fetchone()[0]
                 conn.commit()
                 return backup_id
-        finally:
-            self.release_connection(conn)
 
 
 
-    def calculate_score(self, turtles_killed, spike_turtles_killed, time_spent, max_time=300):
+    @staticmethod
+    def calculate_score(turtles_killed, spike_turtles_killed, time_spent, max_time=300):
 
         # Базовые очки
         turtle_score = turtles_killed * 200
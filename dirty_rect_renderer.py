@@ -0,0 +1,77 @@
+"""
+Dirty Rect Renderer для Mario Clash
+Обновление на экране только изменившихся областей вместо полного flip()
+"""
+
+import pygame
+
+
+class DirtyRectRenderer:
+    """
+    Учёт «грязных» прямоугольников между кадрами.
+
+    Каждый кадр:
+    1. mark() - отметить, где будут нарисованы движущиеся объекты
+    2. restore_rects() - области, которые нужно восстановить из кэша фона
+       (всё, что было нарисовано в прошлом кадре + текущие позиции объектов)
+    3. mark() - отметить то, что рисуется поверх всего (HUD, частицы)
+    4. present() - вывести на экран только эти области
+    """
+
+    def __init__(self, screen):
+        self.screen = screen
+        self.screen_rect = screen.get_rect()
+        self.previous_rects = []  # Нарисовано в прошлом кадре
+        self.current_rects = []  # Рисуется в этом кадре
+        self.full_redraw = True  # Первый кадр всегда рисуется целиком
+
+        # Статистика: сколько пикселей реально отправлено на экран
+        self.frames = 0
+        self.full_frames = 0
+        self.updated_pixels = 0
+
+    def invalidate(self):
+        """Следующий кадр нарисовать целиком (смена уровня, другой экран и т.п.)"""
+        self.full_redraw = True
+
+    def begin_frame(self):
+        """Начать новый кадр"""
+        self.current_rects = []
+
+    def mark(self, rect):
+        """Отметить область, которая меняется в этом кадре"""
+        if rect is None:
+            return
+        clipped = self.screen_rect.clip(rect)
+        if clipped.width > 0 and clipped.height > 0:
+            self.current_rects.append(clipped)
+
+    def restore_rects(self):
+        """Области для восстановления фона: прошлый кадр + отмеченное на текущий момент"""
+        return self.previous_rects + self.current_rects
+
+    def present(self):
+        """Вывести кадр на экран"""
+        self.frames += 1
+        if self.full_redraw:
+            pygame.display.flip()
+            self.full_redraw = False
+            self.full_frames += 1
+            self.updated_pixels += self.screen_rect.width * self.screen_rect.height
+        else:
+            rects = self.previous_rects + self.current_rects
+            pygame.display.update(rects)
+            self.updated_pixels += sum(r.width * r.height for r in rects)
+
+        self.previous_rects = self.current_rects
+        self.current_rects = []
+
+    def stats(self):
+        """Средняя доля экрана, обновляемая за кадр"""
+        screen_pixels = self.screen_rect.width * self.screen_rect.height
+        coverage = self.updated_pixels / (self.frames * screen_pixels) if self.frames else 0.0
+        return {
+            'frames': self.frames,
+            'full_frames': self.full_frames,
+            'avg_screen_coverage': coverage
+        }
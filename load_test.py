@@ -0,0 +1,275 @@
+"""
+Load Test для Mario Clash
+Нагрузочный тест слоя БД: N симулированных игроков (потоки) одновременно
+регистрируются, входят, сохраняют прогресс, проверяют достижения и смотрят
+лидерборд. В конце - пропускная способность, p50/p95/p99 по операциям,
+ожидание соединений в пуле и метрики запросов.
+
+Тестовые игроки создаются с префиксом lt<номер запуска>_ и удаляются в конце (кроме --keep)
+
+Запуск:
+    python load_test.py --players 1000 --duration 120 --ramp 20
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+
+from database_manager import DatabaseManager
+
+
+# Доли операций в игровом цикле (регистрация и первый вход - один раз при старте игрока)
+OPERATION_MIX = (
+    ('save_level_progress', 0.40),
+    ('get_leaderboard', 0.25),
+    ('check_achievements', 0.15),
+    ('get_user_stats', 0.12),
+    ('login_user', 0.08),
+)
+
+PLAYER_PASSWORD = "load-test-password"
+
+
+class LoadStats:
+    """Задержки и ошибки по операциям (из всех потоков)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}  # операция -> [мс]
+        self.errors = {}  # операция -> число ошибок
+        self.first_errors = {}  # операция -> текст первой ошибки
+
+    def record(self, operation, elapsed_ms, error=None):
+        with self.lock:
+            self.samples.setdefault(operation, []).append(elapsed_ms)
+            if error is not None:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+                self.first_errors.setdefault(operation, str(error)[:200])
+
+    @staticmethod
+    def percentile(sorted_samples, fraction):
+        if not sorted_samples:
+            return 0.0
+        return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * fraction))]
+
+    def summary(self, elapsed):
+        """Итог по операциям: calls, errors, ops/s, p50/p95/p99/max"""
+        with self.lock:
+            result = {}
+            for operation, samples in self.samples.items():
+                ordered = sorted(samples)
+                result[operation] = {
+                    'calls': len(ordered),
+                    'errors': self.errors.get(operation, 0),
+                    'ops_per_sec': len(ordered) / elapsed if elapsed else 0.0,
+                    'p50_ms': self.percentile(ordered, 0.50),
+                    'p95_ms': self.percentile(ordered, 0.95),
+                    'p99_ms': self.percentile(ordered, 0.99),
+                    'max_ms': ordered[-1],
+                    'first_error': self.first_errors.get(operation)
+                }
+            return result
+
+
+def timed(stats, operation, func, *args, **kwargs):
+    """Выполнить операцию и записать время; результат с success=False считается ошибкой"""
+    start = time.perf_counter()
+    error = None
+    result = None
+    try:
+        result = func(*args, **kwargs)
+        if isinstance(result, dict) and result.get('success') is False:
+            error = result.get('error')
+    except Exception as e:
+        error = e
+    stats.record(operation, (time.perf_counter() - start) * 1000, error)
+    return result if error is None else None
+
+
+class SimulatedPlayer:
+    """Один игрок: регистрация, вход и игровой цикл до остановки теста"""
+
+    def __init__(self, db, stats, username, level_ids, think_time, seed):
+        self.db = db
+        self.stats = stats
+        self.username = username
+        self.level_ids = level_ids
+        self.think_time = think_time
+        self.rng = random.Random(seed)
+        self.user_id = None
+        self.skill = self.rng.betavariate(2, 5)  # Большинство игроков средние, мало сильных
+        self.operations = [name for name, _ in OPERATION_MIX]
+        self.weights = [weight for _, weight in OPERATION_MIX]
+
+    def run(self, stop_event):
+        registered = timed(self.stats, 'register_user', self.db.register_user,
+                           self.username, PLAYER_PASSWORD)
+        if registered is None:
+            return
+        logged_in = timed(self.stats, 'login_user', self.db.login_user,
+                          self.username, PLAYER_PASSWORD)
+        if logged_in is None:
+            return
+        self.user_id = logged_in['user']['user_id']
+
+        while not stop_event.is_set():
+            operation = self.rng.choices(self.operations, self.weights)[0]
+            getattr(self, operation)()
+            # Пауза между действиями: экспоненциальная, как у живых игроков
+            stop_event.wait(self.rng.expovariate(1.0 / self.think_time) if self.think_time else 0)
+
+    def save_level_progress(self):
+        level_id = self.rng.choice(self.level_ids)
+        turtles = self.rng.randint(0, 8)
+        spike_turtles = self.rng.randint(0, 3)
+        time_spent = max(10, int(self.rng.gauss(180 - 100 * self.skill, 40)))
+        completed = self.rng.random() < 0.3 + 0.6 * self.skill
+        score = self.db.calculate_score(turtles, spike_turtles, time_spent)['total_score']
+        timed(self.stats, 'save_level_progress', self.db.save_level_progress,
+              self.user_id, level_id, score, time_spent, turtles + spike_turtles, completed)
+
+    def get_leaderboard(self):
+        level_id = self.rng.choice(self.level_ids) if self.rng.random() < 0.5 else None
+        timed(self.stats, 'get_leaderboard', self.db.get_leaderboard, level_id, 10)
+
+    def check_achievements(self):
+        timed(self.stats, 'check_achievements', self.db.check_achievements, self.user_id)
+
+    def get_user_stats(self):
+        timed(self.stats, 'get_user_stats', self.db.get_user_stats, self.user_id)
+
+    def login_user(self):
+        timed(self.stats, 'login_user', self.db.login_user, self.username, PLAYER_PASSWORD)
+
+
+def cleanup(db, prefix):
+    """Удалить тестовых игроков и всё, что они создали"""
+    with db.connection() as conn, conn.cursor() as cur:
+        pattern = prefix.replace('_', '\\_') + '%'  # _ в LIKE - любой символ
+        cur.execute("""
+            DELETE FROM user_achievements
+            WHERE user_id IN (SELECT user_id FROM users WHERE username LIKE %s)
+        """, (pattern,))
+        cur.execute("""
+            DELETE FROM user_progress
+            WHERE user_id IN (SELECT user_id FROM users WHERE username LIKE %s)
+        """, (pattern,))
+        cur.execute("DELETE FROM users WHERE username LIKE %s", (pattern,))
+        deleted = cur.rowcount
+        conn.commit()
+    print(f"Removed {deleted} load-test players")
+
+
+def print_report(report):
+    print()
+    print("=" * 78)
+    print(f"Players: {report['players']}   duration: {report['elapsed_s']:.1f}s   "
+          f"throughput: {report['throughput']:.0f} ops/s")
+    print("=" * 78)
+    print(f"{'operation':<22}{'calls':>8}{'errors':>8}{'ops/s':>9}"
+          f"{'p50':>9}{'p95':>9}{'p99':>9}{'max':>10}")
+    for operation, row in sorted(report['operations'].items()):
+        print(f"{operation:<22}{row['calls']:>8}{row['errors']:>8}{row['ops_per_sec']:>9.1f}"
+              f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['max_ms']:>10.1f}")
+    for operation, row in sorted(report['operations'].items()):
+        if row['first_error']:
+            print(f"  first {operation} error: {row['first_error']}")
+
+    pool = report['pool']
+    print()
+    print(f"Pool: {pool['checkouts']} checkouts, {pool['waits']} waited, "
+          f"avg wait {pool['avg_wait_ms']:.2f} ms, max wait {pool['max_wait_ms']:.1f} ms, "
+          f"{pool['timeouts']} timeouts, peak in use {report['peak_in_use']}/{pool['max']}")
+
+    print("Slowest queries by p95:")
+    queries = sorted(report['queries'].items(), key=lambda item: -item[1]['p95_ms'])
+    for tag, metrics in queries[:8]:
+        print(f"  {tag:<28} calls {metrics['calls']:>7}   avg {metrics['avg_ms']:7.2f} ms   "
+              f"p95 <= {metrics['p95_ms']:g} ms")
+
+    for namespace, metrics in sorted(report['cache'].items()):
+        print(f"Cache {namespace}: hit rate {metrics['hit_rate']:.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mario Clash database load test")
+    parser.add_argument("--players", type=int, default=200, help="simulated players")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of play after ramp-up")
+    parser.add_argument("--ramp", type=float, default=10.0, help="seconds to start all players")
+    parser.add_argument("--think", type=float, default=0.5, help="mean pause between actions (s)")
+    parser.add_argument("--pool", type=int, default=10, help="max pooled connections")
+    parser.add_argument("--bcrypt-rounds", type=int, default=4,
+                        help="bcrypt cost for test players (production uses 12)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--keep", action="store_true", help="keep test players in the database")
+    args = parser.parse_args()
+
+    # Тысячи потоков: небольшой стек, чтобы не тратить память зря
+    threading.stack_size(512 * 1024)
+
+    db = DatabaseManager(max_connections=args.pool, bcrypt_rounds=args.bcrypt_rounds)
+    prefix = f"lt{int(time.time()) % 1000000}_"
+    try:
+        levels = db.get_levels()
+        level_ids = [level['level_id'] for level in levels] or [1]
+
+        stats = LoadStats()
+        stop_event = threading.Event()
+        rng = random.Random(args.seed)
+        players = [SimulatedPlayer(db, stats, f"{prefix}{index}", level_ids, args.think,
+                                   rng.randrange(1 << 30))
+                   for index in range(args.players)]
+        threads = [threading.Thread(target=player.run, args=(stop_event,),
+                                    name=f"player-{index}", daemon=True)
+                   for index, player in enumerate(players)]
+
+        db.query_metrics.reset()
+        print(f"Starting {args.players} players over {args.ramp:.0f}s "
+              f"(pool {args.pool}, bcrypt rounds {args.bcrypt_rounds})...")
+        start = time.perf_counter()
+        for index, thread in enumerate(threads):
+            thread.start()
+            if args.ramp:
+                time.sleep(args.ramp / max(1, args.players))
+
+        # Пик занятых соединений - по снимкам пула раз в 0.2 с
+        peak_in_use = 0
+        deadline = time.perf_counter() + args.duration
+        while time.perf_counter() < deadline:
+            peak_in_use = max(peak_in_use, db.pool_stats()['in_use'])
+            time.sleep(0.2)
+
+        stop_event.set()
+        for thread in threads:
+            thread.join(timeout=30)
+        elapsed = time.perf_counter() - start
+
+        operations = stats.summary(elapsed)
+        db_stats = db.stats()
+        report = {
+            'players': args.players,
+            'elapsed_s': elapsed,
+            'throughput': sum(row['calls'] for row in operations.values()) / elapsed,
+            'operations': operations,
+            'pool': db_stats['pool'],
+            'peak_in_use': peak_in_use,
+            'queries': {tag: {k: v for k, v in metrics.items() if k != 'histogram'}
+                        for tag, metrics in db_stats['queries'].items()},
+            'cache': db_stats['cache']
+        }
+        print_report(report)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, default=str)
+            print(f"Report written to {args.json}")
+    finally:
+        if not args.keep:
+            cleanup(db, prefix)
+        db.close_all_connections()
+
+
+if __name__ == "__main__":
+    main()
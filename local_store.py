@@ -0,0 +1,316 @@
+"""
+Local Store для Mario Clash
+Локальный журнал игровых событий (SQLite, WAL) и фоновая синхронизация с PostgreSQL
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+
+# Файл локального журнала (рядом с игрой)
+LOCAL_STORE_PATH = "mario_clash_local.db"
+
+# Сколько хранить уже отправленные события
+SYNCED_RETENTION_SECONDS = 7 * 24 * 3600
+
+# После стольких ошибок данных (не связи) событие откладывается и не блокирует журнал
+MAX_EVENT_ATTEMPTS = 5
+
+
+def is_transient(error):
+    """Ошибка связи (повторять, пока сеть не вернётся) или ошибка в самих данных"""
+    # У ошибок psycopg2 от сервера есть SQLSTATE (pgcode), у обрывов связи - нет
+    return getattr(error, 'pgcode', '') is None or isinstance(error, OSError)
+
+
+class LocalStore:
+    """
+    Журнал событий в SQLite. Запись - одна вставка в WAL без сетевых задержек.
+    Неотправленные события переживают перезапуск игры и падение сети
+    """
+
+    def __init__(self, path=LOCAL_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # В WAL безопасно и без fsync на каждую запись
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS journal (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id TEXT NOT NULL UNIQUE,
+                method TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                coalesce_key TEXT,
+                created_at REAL NOT NULL,
+                synced_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            )
+        """)
+        self.conn.execute("""
+            CREATE INDEX IF NOT EXISTS journal_pending_idx
+                ON journal (synced_at, seq)
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+        self.prune()
+
+    def record(self, method, args=(), kwargs=None, key=None):
+        """
+        Записать событие, вернуть (номер события, заменило ли оно ожидавшее).
+        Неотправленное событие с тем же ключом заменяется новым (встаёт в конец)
+        """
+        event_id = uuid.uuid4().hex
+        payload = json.dumps({'args': list(args), 'kwargs': kwargs or {}})
+        coalesce_key = json.dumps(key) if key is not None else None
+        with self.lock:
+            self.conn.execute("BEGIN")
+            replaced = 0
+            if coalesce_key is not None:
+                replaced = self.conn.execute(
+                    "DELETE FROM journal WHERE coalesce_key = ? AND synced_at IS NULL",
+                    (coalesce_key,)).rowcount
+            self.conn.execute(
+                "INSERT INTO journal (event_id, method, payload, coalesce_key, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (event_id, method, payload, coalesce_key, time.time()))
+            self.conn.execute("COMMIT")
+        return event_id, replaced > 0
+
+    def pending(self, limit=50):
+        """Неотправленные события в порядке записи"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT event_id, method, payload FROM journal "
+                "WHERE synced_at IS NULL AND attempts < ? ORDER BY seq LIMIT ?",
+                (MAX_EVENT_ATTEMPTS, limit)).fetchall()
+        events = []
+        for event_id, method, payload in rows:
+            data = json.loads(payload)
+            events.append((event_id, method, data['args'], data['kwargs']))
+        return events
+
+    def pending_count(self):
+        """Сколько событий ещё не отправлено (без отложенных)"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM journal WHERE synced_at IS NULL AND attempts < ?",
+                (MAX_EVENT_ATTEMPTS,)).fetchone()[0]
+
+    def rejected_count(self):
+        """События, отложенные из-за повторяющихся ошибок данных"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM journal WHERE synced_at IS NULL AND attempts >= ?",
+                (MAX_EVENT_ATTEMPTS,)).fetchone()[0]
+
+    def mark_synced(self, event_id):
+        """Событие применено в PostgreSQL"""
+        with self.lock:
+            self.conn.execute("UPDATE journal SET synced_at = ? WHERE event_id = ?",
+                              (time.time(), event_id))
+
+    def mark_failed(self, event_id, error, count_attempt=True):
+        """Неудачная попытка отправки (ошибки связи попыткой не считаются)"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE journal SET attempts = attempts + ?, last_error = ? WHERE event_id = ?",
+                (1 if count_attempt else 0, str(error)[:500], event_id))
+
+    def prune(self, retention=SYNCED_RETENTION_SECONDS):
+        """Удалить давно отправленные события"""
+        with self.lock:
+            self.conn.execute("DELETE FROM journal WHERE synced_at IS NOT NULL AND synced_at < ?",
+                              (time.time() - retention,))
+
+    def remember_sign_in(self, user_data, password_hash):
+        """
+        Запомнить последний успешный вход: данные игрока и bcrypt-хеш его пароля.
+        Без сети войти можно только под этим игроком и только с тем же паролем
+        """
+        value = json.dumps({'user': user_data, 'password_hash': password_hash}, default=str)
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_sign_in', ?)",
+                              (value,))
+
+    def last_sign_in(self):
+        """(данные игрока, хеш пароля) последнего входа или None"""
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'last_sign_in'").fetchone()
+        if not row:
+            return None
+        data = json.loads(row[0])
+        return data['user'], data['password_hash']
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class SyncEngine:
+    """
+    Фоновая синхронизация журнала с PostgreSQL.
+
+    Интерфейс как у PersistenceWorker (submit/flush/close/stats), но задачи
+    сначала попадают в LocalStore, поэтому submit() не теряет данные при
+    переполнении, ошибках сети и выходе из игры. События применяются через
+    DatabaseManager.apply_event() строго по порядку и идемпотентно.
+    Если БД недоступна, db_factory периодически пробует подключиться
+    """
+
+    def __init__(self, store, db=None, db_factory=None, batch_size=50,
+                 idle_interval=2.0, base_delay=1.0, max_delay=30.0):
+        self.store = store
+        self.db = db
+        self.db_factory = db_factory
+        self.owns_db = False  # Соединение создано самим движком - он его и закроет
+        self.batch_size = batch_size
+        self.idle_interval = idle_interval
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.condition = threading.Condition()
+        self.callbacks = {}  # event_id -> on_done (только для событий этого запуска)
+        self.closing = False
+        self.failures_in_row = 0
+
+        # Статистика
+        self.submitted = 0
+        self.completed = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+        self.thread = threading.Thread(target=self._run, name="sync-engine", daemon=True)
+        self.thread.start()
+
+    def submit(self, method, *args, key=None, on_done=None, **kwargs):
+        """Записать событие в журнал (без сети) и разбудить синхронизацию"""
+        event_id, replaced = self.store.record(method, args, kwargs, key)
+        with self.condition:
+            self.submitted += 1
+            if replaced:
+                self.coalesced += 1
+            if on_done:
+                self.callbacks[event_id] = on_done
+            self.condition.notify_all()
+        return True
+
+    def _ensure_db(self):
+        """Подключиться к БД, если её ещё нет"""
+        if self.db is not None:
+            return True
+        if self.db_factory is None:
+            return False
+        try:
+            self.db = self.db_factory()
+            self.owns_db = True
+            print("Sync: database is reachable, replaying local journal")
+            return True
+        except Exception as e:
+            print(f"Sync: database unavailable ({e})")
+            return False
+
+    def _sync_batch(self):
+        """Отправить пачку событий. True если всё отправлено без ошибок"""
+        for event_id, method, args, kwargs in self.store.pending(self.batch_size):
+            try:
+                applied, result = self.db.apply_event(event_id, method, args, kwargs)
+            except Exception as e:
+                self.store.mark_failed(event_id, e, count_attempt=not is_transient(e))
+                with self.condition:
+                    self.failed += 1
+                print(f"Sync: {method} failed ({e})")
+                return False
+
+            self.store.mark_synced(event_id)
+            with self.condition:
+                if applied:
+                    self.completed += 1
+                else:
+                    self.duplicates += 1
+                callback = self.callbacks.pop(event_id, None)
+                self.condition.notify_all()
+            if callback and applied:
+                try:
+                    callback(result)
+                except Exception as e:
+                    print(f"Error in sync callback for {method}: {e}")
+        return True
+
+    def _run(self):
+        """Основной цикл фонового потока"""
+        while True:
+            with self.condition:
+                if self.closing:
+                    return
+
+            if self._ensure_db() and self.store.pending_count():
+                if self._sync_batch():
+                    self.failures_in_row = 0
+                    continue
+                self.failures_in_row += 1
+                delay = min(self.base_delay * (2 ** (self.failures_in_row - 1)), self.max_delay)
+            elif self.db is None and self.db_factory is not None:
+                self.failures_in_row += 1
+                delay = min(self.base_delay * (2 ** (self.failures_in_row - 1)), self.max_delay)
+            else:
+                delay = self.idle_interval
+
+            with self.condition:
+                if not self.closing:
+                    self.condition.wait(delay)
+
+    def pending(self):
+        """Сколько событий ещё не отправлено"""
+        return self.store.pending_count()
+
+    def flush(self, timeout=5.0):
+        """Дождаться отправки журнала. True если всё отправлено за timeout"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            self.condition.notify_all()
+        while self.store.pending_count():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            with self.condition:
+                self.condition.wait(min(remaining, 0.1))
+        return True
+
+    def close(self, timeout=5.0):
+        """Попробовать отправить журнал и остановить поток (неотправленное останется в журнале)"""
+        flushed = self.flush(timeout) if self.db is not None else False
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        self.thread.join(timeout=1.0)
+        if not flushed:
+            print(f"Sync: {self.store.pending_count()} events kept in local journal for next run")
+        if self.owns_db:
+            self.db.close_all_connections()
+
+    def stats(self):
+        """Статистика синхронизации"""
+        pending = self.store.pending_count()
+        with self.condition:
+            return {
+                'pending': pending,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'duplicates': self.duplicates,
+                'failed': self.failed,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped,
+                'rejected': self.store.rejected_count(),
+                'online': self.db is not None
+            }
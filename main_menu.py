@@ -8,7 +8,8 @@ import sys
 import math
 import time
 from database_manager import DatabaseManager
-from pixel_art_system import PixelArtSprite, AnimatedBackground, ParticleEffect
+from pixel_art_system import PixelArtSprite, AnimatedBackground, ParticleEffect, particle_pool
+from text_cache import get_font, render_text
 
 
 class PixelButton:
@@ -46,7 +47,7 @@ class PixelButton:
         }
 
         self.colors = schemes.get(color_scheme, schemes['green'])
-        self.font = pygame.font.Font(None, 48)
+        self.font = get_font(48)
 
     def update(self, mouse_pos):
         """Обновление анимации"""
@@ -99,8 +100,8 @@ class PixelButton:
         pygame.draw.rect(screen, self.colors['dark'], scaled_rect, 4, 15)
 
         # Текст с тенью
-        text_shadow = self.font.render(self.text, True, (50, 50, 50))
-        text_surface = self.font.render(self.text, True, (255, 255, 255))
+        text_shadow = render_text(self.font, self.text, (50, 50, 50))
+        text_surface = render_text(self.font, self.text, (255, 255, 255))
 
         text_rect = text_surface.get_rect(center=scaled_rect.center)
         shadow_rect = text_shadow.get_rect(center=(scaled_rect.centerx + 2, scaled_rect.centery + 2))
@@ -123,8 +124,8 @@ class UserCard:
         self.user = user
         self.is_selected = is_selected
         self.hover = False
-        self.font_name = pygame.font.Font(None, 32)
-        self.font_info = pygame.font.Font(None, 24)
+        self.font_name = get_font(32)
+        self.font_info = get_font(24)
 
     def update(self, mouse_pos):
         """Обновление"""
@@ -149,21 +150,21 @@ class UserCard:
 
         # Иконка роли
         icon = "👑" if self.user['role'] == 'admin' else "👤"
-        icon_text = self.font_name.render(icon, True, (0, 0, 0))
+        icon_text = render_text(self.font_name, icon, (0, 0, 0))
         screen.blit(icon_text, (self.rect.x + 15, self.rect.y + 10))
 
         # Имя
         name_color = (243, 156, 18) if self.user['role'] == 'admin' else (52, 73, 94)
-        name_text = self.font_name.render(self.user['username'][:15], True, name_color)
+        name_text = render_text(self.font_name, self.user['username'][:15], name_color)
         screen.blit(name_text, (self.rect.x + 60, self.rect.y + 12))
 
         # Очки
-        score_text = self.font_info.render(f"Счёт: {self.user.get('total_score', 0)}", True, (100, 100, 100))
+        score_text = render_text(self.font_info, f"Счёт: {self.user.get('total_score', 0)}", (100, 100, 100))
         screen.blit(score_text, (self.rect.x + 60, self.rect.y + 42))
 
         # Статус бана
         if self.user.get('banned', False):
-            ban_text = self.font_info.render("🚫 ЗАБАНЕН", True, (231, 76, 60))
+            ban_text = render_text(self.font_info, "🚫 ЗАБАНЕН", (231, 76, 60))
             screen.blit(ban_text, (self.rect.right - 150, self.rect.centery - 10))
 
 
@@ -181,9 +182,9 @@ class MainMenuPixelArt:
         self.is_admin = user_data['role'] == 'admin'
 
         # Шрифты
-        self.font_title = pygame.font.Font(None, 96)
-        self.font_subtitle = pygame.font.Font(None, 36)
-        self.font_info = pygame.font.Font(None, 28)
+        self.font_title = get_font(96)
+        self.font_subtitle = get_font(36)
+        self.font_info = get_font(28)
 
         # Анимированный фон
         self.background = AnimatedBackground(1400, 800)
@@ -213,8 +214,9 @@ class MainMenuPixelArt:
         self.selected_user = None
         self.scroll_offset = 0
 
-        # Частицы
+        # Частицы (общий пул, остатки с прошлого экрана не нужны)
         self.particles = []
+        particle_pool.clear()
 
         # Анимация заголовка
         self.title_wave = 0
@@ -242,8 +244,7 @@ class MainMenuPixelArt:
         self.leaderboard = self.db.get_leaderboard(limit=8)
 
         if self.is_admin:
-            conn = self.db.get_connection()
-            try:
+            with self.db.connection() as conn:
                 with conn.cursor() as cur:
                     cur.execute("""
                         SELECT user_id, username, role, total_score, current_level, banned
@@ -258,8 +259,6 @@ class MainMenuPixelArt:
                         }
                         for r in rows
                     ]
-            finally:
-                self.db.release_connection(conn)
 
     def draw_title(self):
         """Анимированный заголовок"""
@@ -272,12 +271,12 @@ class MainMenuPixelArt:
             y_offset = math.sin(self.title_wave + i * 0.5) * 15
 
             # Тень
-            shadow = self.font_title.render(char, True, (100, 0, 0))
+            shadow = render_text(self.font_title, char, (100, 0, 0))
             shadow_rect = shadow.get_rect(center=(x_offset + i * 80 + 3, 100 + y_offset + 3))
             self.screen.blit(shadow, shadow_rect)
 
             # Буква
-            letter = self.font_title.render(char, True, (220, 20, 20))
+            letter = render_text(self.font_title, char, (220, 20, 20))
             letter_rect = letter.get_rect(center=(x_offset + i * 80, 100 + y_offset))
             self.screen.blit(letter, letter_rect)
 
@@ -288,12 +287,12 @@ class MainMenuPixelArt:
             y_offset = math.sin(self.title_wave + i * 0.5 + 2) * 15
 
             # Тень
-            shadow = self.font_title.render(char, True, (0, 50, 100))
+            shadow = render_text(self.font_title, char, (0, 50, 100))
             shadow_rect = shadow.get_rect(center=(x_offset + i * 70 + 3, 100 + y_offset + 3))
             self.screen.blit(shadow, shadow_rect)
 
             # Буква
-            letter = self.font_title.render(char, True, (52, 152, 219))
+            letter = render_text(self.font_title, char, (52, 152, 219))
             letter_rect = letter.get_rect(center=(x_offset + i * 70, 100 + y_offset))
             self.screen.blit(letter, letter_rect)
 
@@ -307,36 +306,39 @@ class MainMenuPixelArt:
         self.screen.blit(panel_surf, panel_rect.topleft)
 
         # Приветствие
-        welcome = self.font_subtitle.render(f"Привет, {self.user_data['username']}!", True, (52, 73, 94))
+        welcome = render_text(self.font_subtitle, f"Привет, {self.user_data['username']}!", (52, 73, 94))
         welcome_rect = welcome.get_rect(center=(700, 240))
         self.screen.blit(welcome, welcome_rect)
 
-        # Статистика
-        stats = self.db.get_user_stats(self.user_data['user_id'])
+        # Статистика (только из кэша - отрисовка не ждёт БД)
+        stats = self.db.peek_user_stats(self.user_data['user_id'])
 
-        info_lines = [
-            f"Текущий уровень: {stats['current_level']}",
-            f"Общий счёт: {stats['total_score']}",
-            f"Достижений: {stats['achievements_count']}"
-        ]
+        if stats:
+            info_lines = [
+                f"Текущий уровень: {stats['current_level']}",
+                f"Общий счёт: {stats['total_score']}",
+                f"Достижений: {stats['achievements_count']}"
+            ]
+        else:
+            info_lines = ["Загрузка статистики..."]
 
         y = 290
         for line in info_lines:
-            text = self.font_info.render(line, True, (100, 100, 100))
+            text = render_text(self.font_info, line, (100, 100, 100))
             text_rect = text.get_rect(center=(700, y))
             self.screen.blit(text, text_rect)
             y += 35
 
         # Админ бейдж
         if self.is_admin:
-            admin_text = self.font_info.render("ADMIN", True, (243, 156, 18))
+            admin_text = render_text(self.font_info, "ADMIN", (243, 156, 18))
             admin_rect = admin_text.get_rect(center=(700, 390))
             self.screen.blit(admin_text, admin_rect)
 
     def draw_leaderboard(self):
         """Лидерборд слева"""
         # Заголовок
-        title = self.font_subtitle.render("TOP 8", True, (243, 156, 18))
+        title = render_text(self.font_subtitle, "TOP 8", (243, 156, 18))
         self.screen.blit(title, (50, 200))
 
         # Панель
@@ -347,7 +349,7 @@ class MainMenuPixelArt:
         self.screen.blit(panel_surf, panel_rect.topleft)
 
         # Список
-        font_rank = pygame.font.Font(None, 28)
+        font_rank = get_font(28)
         y = 265
 
         for i, player in enumerate(self.leaderboard[:8], 1):
@@ -371,11 +373,11 @@ class MainMenuPixelArt:
                 pygame.draw.rect(self.screen, (255, 235, 100, 200), highlight, 0, 8)
 
             # Ранг и имя
-            rank_text = font_rank.render(f"{medal} {player['username'][:12]}", True, color)
+            rank_text = render_text(font_rank, f"{medal} {player['username'][:12]}", color)
             self.screen.blit(rank_text, (55, y))
 
             # Счёт
-            score_text = font_rank.render(f"{player['total_score']}", True, (100, 100, 100))
+            score_text = render_text(font_rank, f"{player['total_score']}", (100, 100, 100))
             score_rect = score_text.get_rect(right=330, centery=y + 10)
             self.screen.blit(score_text, score_rect)
 
@@ -387,7 +389,7 @@ class MainMenuPixelArt:
             return
 
         # Заголовок
-        title = self.font_subtitle.render("ADMIN", True, (231, 76, 60))
+        title = render_text(self.font_subtitle, "ADMIN", (231, 76, 60))
         self.screen.blit(title, (1050, 200))
 
         # Панель пользователей
@@ -398,7 +400,7 @@ class MainMenuPixelArt:
         self.screen.blit(panel_surf, panel_rect.topleft)
 
         # Список пользователей
-        font_small = pygame.font.Font(None, 22)
+        font_small = get_font(22)
         y = 260
         max_visible = 3
 
@@ -413,16 +415,16 @@ class MainMenuPixelArt:
 
             # Иконка
             icon = "👑" if user['role'] == 'admin' else ("" if user['banned'] else "👤")
-            icon_text = font_small.render(icon, True, (0, 0, 0))
+            icon_text = render_text(font_small, icon, (0, 0, 0))
             self.screen.blit(icon_text, (1055, y + 7))
 
             # Имя
             color = (231, 76, 60) if user['banned'] else (52, 73, 94)
-            name = font_small.render(user['username'][:18], True, color)
+            name = render_text(font_small, user['username'][:18], color)
             self.screen.blit(name, (1085, y + 8))
 
             # Счёт
-            score = font_small.render(str(user['total_score']), True, (100, 100, 100))
+            score = render_text(font_small, str(user['total_score']), (100, 100, 100))
             score_rect = score.get_rect(right=1360, centery=y + 17)
             self.screen.blit(score, score_rect)
 
@@ -440,8 +442,8 @@ class MainMenuPixelArt:
         if not self.selected_user:
             return
 
-        conn = self.db.get_connection()
-        try:
+        target_id = self.selected_user['user_id']
+        with self.db.connection() as conn:
             with conn.cursor() as cur:
                 if action == 'ban':
                     cur.execute("UPDATE users SET banned = TRUE WHERE user_id = %s",
@@ -461,10 +463,10 @@ class MainMenuPixelArt:
                         self.selected_user = None
 
                 conn.commit()
+                self.db.invalidate_user_stats(target_id)
+                self.db.invalidate_queries('leaderboard')
                 # Частицы
                 self.particles.append(ParticleEffect(700, 400, (46, 204, 113), 20))
-        finally:
-            self.db.release_connection(conn)
 
         self.load_data()
 
@@ -520,6 +522,7 @@ class MainMenuPixelArt:
                         if self.selected_user['user_id'] != self.user_data['user_id']:
                             self.handle_admin_action('delete')
                     if self.refresh_button.is_clicked(event):
+                        self.db.invalidate_queries()
                         self.load_data()
                         self.particles.append(ParticleEffect(1140, 675, (52, 152, 219), 15))
 
@@ -545,10 +548,8 @@ class MainMenuPixelArt:
                 deco['y'] = deco['base_y'] + math.sin(deco['offset']) * 15
 
             # Частицы
-            for p in self.particles[:]:
-                p.update()
-                if not p.is_alive():
-                    self.particles.remove(p)
+            particle_pool.update()
+            self.particles = [p for p in self.particles if p.is_alive()]
 
             # Отрисовка
             self.background.draw(self.screen)
@@ -573,8 +574,7 @@ class MainMenuPixelArt:
             self.logout_button.draw(self.screen)
 
             # Частицы
-            for p in self.particles:
-                p.draw(self.screen)
+            particle_pool.draw(self.screen)
 
             pygame.display.flip()
             self.clock.tick(60)
@@ -0,0 +1,100 @@
+"""
+Password Hashing для Mario Clash
+bcrypt в фоне: одиночные вызовы - в потоках (bcrypt отпускает GIL), пачки - в пуле
+процессов на всех ядрах. Хеширование не тормозит UI
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import bcrypt
+
+
+# Стоимость bcrypt по умолчанию (2^rounds итераций); меняется через MARIO_BCRYPT_ROUNDS
+BCRYPT_ROUNDS = int(os.environ.get("MARIO_BCRYPT_ROUNDS", 12))
+
+
+def _hash_password(password, rounds):
+    """Хеширование в рабочем процессе"""
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _verify_password(password, hashed):
+    """Проверка в рабочем процессе"""
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def hash_rounds(hashed):
+    """Стоимость, с которой создан хеш ($2b$12$... -> 12), None если формат неизвестен"""
+    parts = hashed.split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+class PasswordHasher:
+    """
+    Хеширование и проверка паролей.
+
+    submit_*() возвращают Future (UI может опрашивать done()),
+    hash()/verify() ждут результат (для фоновых потоков и скриптов) -
+    всё это в ThreadPoolExecutor: bcrypt отпускает GIL, а лишние процессы
+    для одного пароля не нужны (spawn заново импортирует __main__ - в игре
+    это MAIN.py с pygame). hash_many() хеширует пачку паролей на всех ядрах
+    в ProcessPoolExecutor
+    """
+
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=None):
+        self.rounds = rounds
+        self.workers = workers or os.cpu_count() or 1
+        self.threads = None
+        self.executor = None
+
+    def _threads(self):
+        # Потоки создаются при первом использовании
+        if self.threads is None:
+            self.threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self.threads
+
+    def _pool(self):
+        # Процессы - только для hash_many; spawn - безопасно рядом с потоками и pygame
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context("spawn"))
+        return self.executor
+
+    def submit_hash(self, password):
+        """Future с хешем пароля"""
+        return self._threads().submit(_hash_password, password, self.rounds)
+
+    def submit_verify(self, password, hashed):
+        """Future с результатом проверки пароля"""
+        return self._threads().submit(_verify_password, password, hashed)
+
+    def hash(self, password):
+        """Хеш пароля (ждёт результат)"""
+        return self.submit_hash(password).result()
+
+    def verify(self, password, hashed):
+        """Проверка пароля (ждёт результат)"""
+        return self.submit_verify(password, hashed).result()
+
+    def needs_rehash(self, hashed):
+        """Хеш создан с другой стоимостью и должен быть пересчитан"""
+        return hash_rounds(hashed) != self.rounds
+
+    def hash_many(self, passwords, chunksize=16):
+        """Хеши для списка паролей (в том же порядке), параллельно на всех ядрах"""
+        passwords = list(passwords)
+        return list(self._pool().map(_hash_password, passwords,
+                                     [self.rounds] * len(passwords), chunksize=chunksize))
+
+    def shutdown(self):
+        """Остановить рабочие потоки и процессы"""
+        if self.threads is not None:
+            self.threads.shutdown(wait=False, cancel_futures=True)
+            self.threads = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
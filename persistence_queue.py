@@ -0,0 +1,173 @@
+"""
+Persistence Queue для Mario Clash
+Фоновая запись игровых событий в БД, чтобы игровой цикл не ждал сеть
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class PersistenceTask:
+    """Одна отложенная операция: вызов метода DatabaseManager"""
+
+    def __init__(self, method, args, kwargs, key=None, on_done=None):
+        self.method = method  # Имя метода DatabaseManager
+        self.args = args
+        self.kwargs = kwargs
+        self.key = key  # Ключ склейки: одинаковые задачи в очереди схлопываются
+        self.on_done = on_done  # Вызывается в фоновом потоке с результатом
+        self.attempts = 0
+
+
+class PersistenceWorker:
+    """
+    Фоновый поток записи перед DatabaseManager.
+
+    - Ограниченная очередь: при переполнении новая задача отбрасывается (счётчик dropped)
+    - Склейка: задача с тем же ключом заменяет ожидающую и встаёт в конец очереди
+      (повторный unlock_achievement, check_achievements после нескольких сохранений)
+    - Повторы с экспоненциальной паузой; порядок задач сохраняется
+    - close() дожидается записи оставшихся задач (с таймаутом)
+    """
+
+    def __init__(self, db, max_size=256, max_retries=5, base_delay=0.5, max_delay=10.0):
+        self.db = db
+        self.max_size = max_size
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.tasks = deque()
+        self.pending_keys = {}  # key -> PersistenceTask в очереди
+        self.condition = threading.Condition()
+        self.busy = False  # Поток сейчас выполняет задачу
+        self.closing = False
+
+        # Статистика
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+        self.thread = threading.Thread(target=self._run, name="persistence-worker", daemon=True)
+        self.thread.start()
+
+    def submit(self, method, *args, key=None, on_done=None, **kwargs):
+        """Поставить вызов db.<method>(*args, **kwargs) в очередь. Никогда не блокирует"""
+        task = PersistenceTask(method, args, kwargs, key, on_done)
+        with self.condition:
+            if self.closing:
+                self.dropped += 1
+                return False
+
+            if key is not None and key in self.pending_keys:
+                self.tasks.remove(self.pending_keys[key])
+                self.coalesced += 1
+            elif len(self.tasks) >= self.max_size:
+                self.dropped += 1
+                print(f"Persistence queue full, dropped {method}")
+                return False
+
+            self.tasks.append(task)
+            if key is not None:
+                self.pending_keys[key] = task
+            self.submitted += 1
+            self.condition.notify_all()
+        return True
+
+    def _run(self):
+        """Основной цикл фонового потока"""
+        while True:
+            with self.condition:
+                while not self.tasks and not self.closing:
+                    self.condition.wait()
+                if not self.tasks:
+                    return  # Закрытие и очередь пуста
+                task = self.tasks.popleft()
+                if task.key is not None and self.pending_keys.get(task.key) is task:
+                    del self.pending_keys[task.key]
+                self.busy = True
+
+            self._execute(task)
+
+            with self.condition:
+                self.busy = False
+                self.condition.notify_all()
+
+    def _execute(self, task):
+        """Выполнить задачу с повторами"""
+        while True:
+            task.attempts += 1
+            error = None
+            try:
+                result = getattr(self.db, task.method)(*task.args, **task.kwargs)
+                # Методы записи DatabaseManager сообщают об ошибке через словарь
+                if isinstance(result, dict) and result.get('success') is False:
+                    error = result.get('error', 'Unknown error')
+            except Exception as e:
+                error = e
+
+            if error is None:
+                self.completed += 1
+                if task.on_done:
+                    try:
+                        task.on_done(result)
+                    except Exception as e:
+                        print(f"Error in persistence callback for {task.method}: {e}")
+                return
+
+            if task.attempts > self.max_retries:
+                self.failed += 1
+                print(f"Persistence task {task.method} failed after {task.attempts} attempts: {error}")
+                return
+
+            self.retries += 1
+            delay = min(self.base_delay * (2 ** (task.attempts - 1)), self.max_delay)
+            print(f"Persistence task {task.method} failed ({error}), retry in {delay:.1f}s")
+            time.sleep(delay)
+
+    def pending(self):
+        """Сколько задач ещё не записано"""
+        with self.condition:
+            return len(self.tasks) + (1 if self.busy else 0)
+
+    def flush(self, timeout=5.0):
+        """Дождаться записи всех задач. True если очередь опустела за timeout"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.tasks or self.busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def close(self, timeout=5.0):
+        """Записать оставшиеся задачи и остановить поток"""
+        flushed = self.flush(timeout)
+        with self.condition:
+            self.closing = True
+            if not flushed:
+                lost = len(self.tasks)
+                self.dropped += lost
+                self.tasks.clear()
+                self.pending_keys.clear()
+                print(f"Persistence queue closed with {lost} unsaved tasks")
+            self.condition.notify_all()
+        self.thread.join(timeout=1.0)
+
+    def stats(self):
+        """Статистика очереди"""
+        with self.condition:
+            return {
+                'pending': len(self.tasks),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'retries': self.retries,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped
+            }
@@ -6,12 +6,124 @@ Pixel Art Rendering System для Mario Clash
 import pygame
 import math
 import random
+import functools
+from collections import OrderedDict
+
+# numpy необязателен: без него частицы считаются в ListParticlePool (медленнее, тот же интерфейс)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Бюджет памяти общего кэша спрайтов (байты)
+SPRITE_CACHE_BUDGET_BYTES = 32 * 1024 * 1024
+
+
+class SpriteCache:
+    """Общий для процесса LRU-кэш готовых спрайтов с ограничением по памяти"""
+
+    def __init__(self, max_bytes=SPRITE_CACHE_BUDGET_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (surface, size_in_bytes)
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def surface_bytes(surface):
+        """Примерный объём памяти поверхности"""
+        width, height = surface.get_size()
+        return width * height * surface.get_bytesize()
+
+    def get_or_create(self, key, factory):
+        """Вернуть спрайт из кэша или создать его через factory()"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        surface = factory()
+        size = self.surface_bytes(surface)
+
+        # Слишком большие спрайты не кэшируем, чтобы не вытеснить всё остальное
+        if size > self.max_bytes:
+            return surface
+
+        self.entries[key] = (surface, size)
+        self.current_bytes += size
+        self.evict()
+        return surface
+
+    def evict(self):
+        """Вытеснить самые старые спрайты, пока не уложимся в бюджет"""
+        while self.current_bytes > self.max_bytes and self.entries:
+            _, (_, size) = self.entries.popitem(last=False)
+            self.current_bytes -= size
+            self.evictions += 1
+
+    def configure(self, max_bytes):
+        """Изменить бюджет памяти"""
+        self.max_bytes = max_bytes
+        self.evict()
+
+    def clear(self):
+        """Очистить кэш (счётчики сохраняются)"""
+        self.entries.clear()
+        self.current_bytes = 0
+
+    def stats(self):
+        """Статистика кэша"""
+        total = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.current_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+
+# Единый кэш для игры, меню и экрана авторизации
+sprite_cache = SpriteCache()
+
+
+def cached_sprite(kind, dimensions=1, layered=True):
+    """
+    Декоратор фабрики спрайтов: ключ кэша (kind, size, is_front).
+    dimensions - сколько первых аргументов задают размер,
+    layered - принимает ли фабрика аргумент is_front
+    """
+    def decorator(factory):
+        @functools.wraps(factory)
+        def wrapper(*args, **kwargs):
+            size = args[0] if dimensions == 1 else tuple(args[:dimensions])
+            if not layered:
+                is_front = None
+            elif len(args) > dimensions:
+                is_front = bool(args[dimensions])
+            else:
+                is_front = bool(kwargs.get('is_front', True))
+            key = (kind, size, is_front)
+            return sprite_cache.get_or_create(key, lambda: factory(*args, **kwargs))
+        return wrapper
+    return decorator
 
 
 class PixelArtSprite:
-    """Базовый класс для пиксель-арт спрайтов"""
+    """
+    Базовый класс для пиксель-арт спрайтов.
+    Все фабрики кэшируются в sprite_cache: возвращаемые поверхности общие,
+    изменять их нельзя (для правок делайте copy())
+    """
 
     @staticmethod
+    @cached_sprite('mario', layered=False)
     def create_mario_sprite(size):
         """Создать спрайт Марио (игрок)"""
         sprite = pygame.Surface((size, size), pygame.SRCALPHA)
@@ -52,6 +164,7 @@ class PixelArtSprite:
         return sprite
 
     @staticmethod
+    @cached_sprite('turtle')
     def create_turtle_sprite(size, is_front=True):
         """Создать спрайт черепахи"""
         sprite = pygame.Surface((size, size), pygame.SRCALPHA)
@@ -86,9 +199,11 @@ class PixelArtSprite:
         return sprite
 
     @staticmethod
+    @cached_sprite('spike_turtle')
     def create_spike_turtle_sprite(size, is_front=True):
         """Создать спрайт черепахи с шипами"""
-        sprite = PixelArtSprite.create_turtle_sprite(size, is_front)
+        # Копия: базовый спрайт черепахи общий для всех (из кэша)
+        sprite = PixelArtSprite.create_turtle_sprite(size, is_front).copy()
         pixel_size = max(1, size // 7)
 
         # Красные шипы на панцире
@@ -111,6 +226,7 @@ class PixelArtSprite:
         return sprite
 
     @staticmethod
+    @cached_sprite('ghost', layered=False)
     def create_ghost_sprite(size):
         """Создать спрайт призрака"""
         sprite = pygame.Surface((size, size), pygame.SRCALPHA)
@@ -141,6 +257,7 @@ class PixelArtSprite:
         return sprite
 
     @staticmethod
+    @cached_sprite('shell')
     def create_shell_sprite(size, is_front=True):
         """Создать спрайт панциря"""
         sprite = pygame.Surface((int(size*1.2), int(size*0.8)), pygame.SRCALPHA)
@@ -162,6 +279,7 @@ class PixelArtSprite:
         return sprite
 
     @staticmethod
+    @cached_sprite('pipe', dimensions=2)
     def create_pipe_sprite(width, height, is_front=True):
         """Создать спрайт трубы (портала)"""
         sprite = pygame.Surface((width, height), pygame.SRCALPHA)
@@ -191,6 +309,7 @@ class PixelArtSprite:
         return sprite
 
     @staticmethod
+    @cached_sprite('platform', dimensions=2)
     def create_platform_sprite(width, height, is_front=True):
         """Создать спрайт платформы"""
         sprite = pygame.Surface((width, height), pygame.SRCALPHA)
@@ -231,6 +350,7 @@ class PixelArtSprite:
         return sprite
 
     @staticmethod
+    @cached_sprite('coin', layered=False)
     def create_coin_sprite(size):
         """Создать спрайт монеты"""
         sprite = pygame.Surface((size, size), pygame.SRCALPHA)
@@ -250,54 +370,283 @@ class PixelArtSprite:
         return sprite
 
 
-class ParticleEffect:
-    """Система частиц для эффектов"""
+# Начальная ёмкость общего пула частиц (растёт удвоением)
+PARTICLE_POOL_CAPACITY = 2048
 
-    def __init__(self, x, y, color, count=10):
-        self.particles = []
+# Число уровней прозрачности, для которых кэшируются готовые кружки
+PARTICLE_ALPHA_LEVELS = 16
+
+
+class _ParticlePoolBase:
+    """
+    Общее для пулов частиц: кэш готовых кружков, отрисовка одним blits()
+    и область на экране. Хранение и симуляцию частиц задают наследники:
+    _visible() - (цвет, радиус, уровень прозрачности, x, y) видимых частиц,
+    _bounds(burst_id) - (left, top, right, bottom) частиц или None
+    """
+
+    def __init__(self):
+        self.next_burst = 1
+        # (цвет (r, g, b), радиус, уровень прозрачности) -> Surface с кружком
+        self.stamps = {}
+
+    def get_stamp(self, color, radius, level):
+        """Готовый кружок заданного цвета, радиуса и уровня прозрачности"""
+        key = (color, radius, level)
+        stamp = self.stamps.get(key)
+        if stamp is None:
+            alpha = min(255, (level + 1) * 256 // PARTICLE_ALPHA_LEVELS)
+            stamp = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+            pygame.draw.circle(stamp, (*color, alpha), (radius, radius), radius)
+            self.stamps[key] = stamp
+        return stamp
+
+    def draw(self, screen):
+        """Отрисовать все частицы одним вызовом blits()"""
+        get_stamp = self.get_stamp
+        blits = [(get_stamp(color, radius, level), (left, top))
+                 for color, radius, level, left, top in self._visible()]
+        if blits:
+            screen.blits(blits, doreturn=False)
+
+    def get_rect(self, burst_id=None):
+        """Область, которую занимают частицы (вспышки или всего пула), None если пусто"""
+        bounds = self._bounds(burst_id)
+        if bounds is None:
+            return None
+        left, top, right, bottom = bounds
+        return pygame.Rect(int(left) - 1, int(top) - 1, int(right - left) + 3, int(bottom - top) + 3)
+
+    def _visible(self):
+        raise NotImplementedError
+
+    def _bounds(self, burst_id):
+        raise NotImplementedError
+
+
+class ParticlePool(_ParticlePoolBase):
+    """
+    Общий пул частиц в виде структуры массивов numpy.
+    Все вспышки живут в одних буферах: обновление - несколько векторных
+    операций на кадр, отрисовка - один screen.blits() готовых кружков
+    """
+
+    def __init__(self, capacity=PARTICLE_POOL_CAPACITY):
+        super().__init__()
+        self.capacity = capacity
+        self.count = 0  # Живые частицы занимают первые count ячеек
+        self.x = np.zeros(capacity, dtype=np.float32)
+        self.y = np.zeros(capacity, dtype=np.float32)
+        self.vx = np.zeros(capacity, dtype=np.float32)
+        self.vy = np.zeros(capacity, dtype=np.float32)
+        self.life = np.zeros(capacity, dtype=np.float32)
+        self.size = np.zeros(capacity, dtype=np.int16)
+        self.color = np.zeros(capacity, dtype=np.int16)  # Индекс в self.palette
+        self.burst = np.zeros(capacity, dtype=np.int32)  # Номер вспышки
+
+        self.palette = []  # Индекс -> цвет (r, g, b)
+        self.palette_index = {}  # Цвет -> индекс
+        self.rng = np.random.default_rng()
+
+    def _arrays(self):
+        return (self.x, self.y, self.vx, self.vy, self.life,
+                self.size, self.color, self.burst)
+
+    def _grow(self, needed):
+        """Увеличить буферы, чтобы поместилось needed частиц"""
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        for name in ('x', 'y', 'vx', 'vy', 'life', 'size', 'color', 'burst'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+        self.capacity = capacity
+
+    def _color_id(self, color):
+        color = tuple(color[:3])
+        index = self.palette_index.get(color)
+        if index is None:
+            index = len(self.palette)
+            self.palette.append(color)
+            self.palette_index[color] = index
+        return index
+
+    def emit(self, x, y, color, count=10):
+        """Выпустить вспышку из count частиц, вернуть её номер"""
+        burst_id = self.next_burst
+        self.next_burst += 1
+        if count <= 0:
+            return burst_id
+
+        start = self.count
+        end = start + count
+        if end > self.capacity:
+            self._grow(end)
+
+        angle = self.rng.uniform(0, 2 * math.pi, count)
+        speed = self.rng.uniform(2, 6, count)
+        self.x[start:end] = x
+        self.y[start:end] = y
+        self.vx[start:end] = np.cos(angle) * speed
+        self.vy[start:end] = np.sin(angle) * speed - 2  # Вверх
+        self.life[start:end] = 1.0
+        self.size[start:end] = self.rng.integers(2, 6, count)
+        self.color[start:end] = self._color_id(color)
+        self.burst[start:end] = burst_id
+        self.count = end
+        return burst_id
+
+    def update(self):
+        """Один шаг симуляции для всех частиц сразу"""
+        n = self.count
+        if n == 0:
+            return
+        self.x[:n] += self.vx[:n]
+        self.y[:n] += self.vy[:n]
+        self.vy[:n] += 0.3  # Гравитация
+        self.life[:n] -= 0.02
+
+        # Уплотнение: выжившие сдвигаются в начало буферов
+        alive = self.life[:n] > 0
+        survivors = int(np.count_nonzero(alive))
+        if survivors < n:
+            for array in self._arrays():
+                array[:survivors] = array[:n][alive]
+            self.count = survivors
+
+    def _visible(self):
+        """Радиусы, прозрачность и позиции считаются векторно для всего пула"""
+        n = self.count
+        if n == 0:
+            return []
+        life = self.life[:n]
+        radius = (self.size[:n] * life).astype(np.int32)
+        visible = radius > 0
+        if not visible.any():
+            return []
+
+        radius = radius[visible]
+        level = np.minimum((life[visible] * PARTICLE_ALPHA_LEVELS).astype(np.int32),
+                           PARTICLE_ALPHA_LEVELS - 1)
+        left = (self.x[:n][visible] - radius).astype(np.int32)
+        top = (self.y[:n][visible] - radius).astype(np.int32)
+        palette = self.palette
+        return [(palette[c], r, a, px, py) for c, r, a, px, py in
+                zip(self.color[:n][visible].tolist(), radius.tolist(), level.tolist(),
+                    left.tolist(), top.tolist())]
+
+    def burst_alive(self, burst_id):
+        """Остались ли частицы у вспышки"""
+        return bool(np.any(self.burst[:self.count] == burst_id))
+
+    def _bounds(self, burst_id):
+        n = self.count
+        x = self.x[:n]
+        y = self.y[:n]
+        size = self.size[:n]
+        if burst_id is not None:
+            mask = self.burst[:n] == burst_id
+            x, y, size = x[mask], y[mask], size[mask]
+        if len(x) == 0:
+            return None
+        return (float((x - size).min()), float((y - size).min()),
+                float((x + size).max()), float((y + size).max()))
+
+    def clear(self):
+        """Удалить все частицы (смена экрана или уровня)"""
+        self.count = 0
+
+
+class ListParticlePool(_ParticlePoolBase):
+    """
+    Пул частиц на списках Python - замена ParticlePool, когда numpy не установлен.
+    Интерфейс тот же: emit/update/draw/burst_alive/get_rect/clear
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.particles = []  # [x, y, vx, vy, life, size, color, burst]
+
+    @property
+    def count(self):
+        return len(self.particles)
+
+    def emit(self, x, y, color, count=10):
+        """Выпустить вспышку из count частиц, вернуть её номер"""
+        burst_id = self.next_burst
+        self.next_burst += 1
+        color = tuple(color[:3])
         for _ in range(count):
             angle = random.uniform(0, 2 * math.pi)
             speed = random.uniform(2, 6)
-            self.particles.append({
-                'x': x,
-                'y': y,
-                'vx': math.cos(angle) * speed,
-                'vy': math.sin(angle) * speed - 2,  # Вверх
-                'life': 1.0,
-                'color': color,
-                'size': random.randint(2, 5)
-            })
+            self.particles.append([x, y, math.cos(angle) * speed, math.sin(angle) * speed - 2,  # Вверх
+                                   1.0, random.randint(2, 5), color, burst_id])
+        return burst_id
 
     def update(self):
-        """Обновить частицы"""
-        for p in self.particles[:]:
-            p['x'] += p['vx']
-            p['y'] += p['vy']
-            p['vy'] += 0.3  # Гравитация
-            p['life'] -= 0.02
+        """Один шаг симуляции"""
+        for p in self.particles:
+            p[0] += p[2]
+            p[1] += p[3]
+            p[3] += 0.3  # Гравитация
+            p[4] -= 0.02
+        self.particles = [p for p in self.particles if p[4] > 0]
+
+    def _visible(self):
+        for x, y, _, _, life, size, color, _ in self.particles:
+            radius = int(size * life)
+            if radius > 0:
+                level = min(int(life * PARTICLE_ALPHA_LEVELS), PARTICLE_ALPHA_LEVELS - 1)
+                yield color, radius, level, int(x - radius), int(y - radius)
+
+    def burst_alive(self, burst_id):
+        """Остались ли частицы у вспышки"""
+        return any(p[7] == burst_id for p in self.particles)
+
+    def _bounds(self, burst_id):
+        particles = [p for p in self.particles if burst_id is None or p[7] == burst_id]
+        if not particles:
+            return None
+        return (min(p[0] - p[5] for p in particles), min(p[1] - p[5] for p in particles),
+                max(p[0] + p[5] for p in particles), max(p[1] + p[5] for p in particles))
+
+    def clear(self):
+        """Удалить все частицы (смена экрана или уровня)"""
+        self.particles = []
 
-            if p['life'] <= 0:
-                self.particles.remove(p)
 
-    def draw(self, screen):
-        """Отрисовать частицы"""
-        for p in self.particles:
-            alpha = int(255 * p['life'])
-            color = (*p['color'], alpha)
-            size = int(p['size'] * p['life'])
-            if size > 0:
-                surf = pygame.Surface((size*2, size*2), pygame.SRCALPHA)
-                pygame.draw.circle(surf, color, (size, size), size)
-                screen.blit(surf, (int(p['x']-size), int(p['y']-size)))
+# Единый пул частиц для игры, меню и экрана авторизации
+particle_pool = ParticlePool() if np is not None else ListParticlePool()
+
+
+class ParticleEffect:
+    """
+    Вспышка частиц. Сами частицы живут в общем ParticlePool:
+    обновляйте и рисуйте пул один раз за кадр (particle_pool.update()/draw())
+    """
+
+    def __init__(self, x, y, color, count=10, pool=None):
+        self.pool = pool if pool is not None else particle_pool
+        self.burst_id = self.pool.emit(x, y, color, count)
 
     def is_alive(self):
         """Живы ли частицы"""
-        return len(self.particles) > 0
+        return self.pool.burst_alive(self.burst_id)
+
+    def get_rect(self):
+        """Область экрана, которую занимают частицы (None если частиц нет)"""
+        return self.pool.get_rect(self.burst_id)
 
 
 class AnimatedBackground:
     """Анимированный фон с облаками и холмами"""
 
+    # Общие для всех экземпляров: небо с холмами по разрешению и облака по размеру
+    _static_surfaces = {}  # (width, height) -> Surface
+    _cloud_surfaces = {}  # size -> Surface
+
     def __init__(self, width, height):
         self.width = width
         self.height = height
@@ -319,43 +668,78 @@ class AnimatedBackground:
             if cloud['x'] > self.width + 100:
                 cloud['x'] = -100
 
+    def get_static_surface(self):
+        """Небо с холмами для текущего разрешения (рисуется один раз)"""
+        key = (self.width, self.height)
+        surface = AnimatedBackground._static_surfaces.get(key)
+        if surface is None:
+            surface = pygame.Surface(key).convert()
+
+            # Градиентное небо
+            for y in range(self.height):
+                progress = y / self.height
+                color = (
+                    int(135 + (200-135) * progress),  # R
+                    int(206 + (230-206) * progress),  # G
+                    int(235 + (255-235) * progress)   # B
+                )
+                pygame.draw.line(surface, color, (0, y), (self.width, y))
+
+            # Холмы на горизонте
+            self.draw_hills(surface)
+
+            AnimatedBackground._static_surfaces[key] = surface
+        return surface
+
     def draw(self, screen):
         """Отрисовать фон"""
-        # Градиентное небо
-        for y in range(self.height):
-            progress = y / self.height
-            color = (
-                int(135 + (200-135) * progress),  # R
-                int(206 + (230-206) * progress),  # G
-                int(235 + (255-235) * progress)   # B
-            )
-            pygame.draw.line(screen, color, (0, y), (self.width, y))
-
-        # Облака
+        screen.blit(self.get_static_surface(), (0, 0))
+
+        # Облака (летают в верхней трети экрана, с холмами не пересекаются)
         for cloud in self.clouds:
             self.draw_cloud(screen, int(cloud['x']), int(cloud['y']), cloud['size'])
 
-        # Холмы на горизонте
-        self.draw_hills(screen)
+    def draw_regions(self, screen, rects):
+        """Восстановить фон только в указанных областях (режим dirty rects)"""
+        static_surface = self.get_static_surface()
+        for rect in rects:
+            screen.blit(static_surface, rect, rect)
 
-    def draw_cloud(self, screen, x, y, size):
-        """Отрисовать пиксельное облако"""
-        cloud_surf = pygame.Surface((size*2, size), pygame.SRCALPHA)
-        pixel_size = max(2, size // 8)
-
-        # Белое облако
-        positions = [
-            (3, 2), (4, 2), (5, 2),
-            (2, 3), (3, 3), (4, 3), (5, 3), (6, 3),
-            (2, 4), (3, 4), (4, 4), (5, 4), (6, 4),
-            (3, 5), (4, 5), (5, 5)
-        ]
+        # Облака всегда входят в rects (см. cloud_rects), рисуем их целиком
+        for cloud in self.clouds:
+            self.draw_cloud(screen, int(cloud['x']), int(cloud['y']), cloud['size'])
+
+    def cloud_rects(self):
+        """Области, занятые облаками в текущем кадре"""
+        return [pygame.Rect(int(cloud['x']), int(cloud['y']), cloud['size'] * 2, cloud['size'])
+                for cloud in self.clouds]
 
-        for px, py in positions:
-            pygame.draw.rect(cloud_surf, (255, 255, 255, 200),
-                           (px*pixel_size, py*pixel_size, pixel_size, pixel_size))
+    @staticmethod
+    def get_cloud_surface(size):
+        """Пиксельное облако заданного размера (рисуется один раз)"""
+        cloud_surf = AnimatedBackground._cloud_surfaces.get(size)
+        if cloud_surf is None:
+            cloud_surf = pygame.Surface((size*2, size), pygame.SRCALPHA)
+            pixel_size = max(2, size // 8)
+
+            # Белое облако
+            positions = [
+                (3, 2), (4, 2), (5, 2),
+                (2, 3), (3, 3), (4, 3), (5, 3), (6, 3),
+                (2, 4), (3, 4), (4, 4), (5, 4), (6, 4),
+                (3, 5), (4, 5), (5, 5)
+            ]
+
+            for px, py in positions:
+                pygame.draw.rect(cloud_surf, (255, 255, 255, 200),
+                               (px*pixel_size, py*pixel_size, pixel_size, pixel_size))
+
+            AnimatedBackground._cloud_surfaces[size] = cloud_surf
+        return cloud_surf
 
-        screen.blit(cloud_surf, (x, y))
+    def draw_cloud(self, screen, x, y, size):
+        """Отрисовать пиксельное облако"""
+        screen.blit(self.get_cloud_surface(size), (x, y))
 
     def draw_hills(self, screen):
         """Отрисовать холмы"""
@@ -414,10 +798,8 @@ if __name__ == "__main__":
 
         # Обновление
         background.update()
-        for p in particles[:]:
-            p.update()
-            if not p.is_alive():
-                particles.remove(p)
+        particle_pool.update()
+        particles = [p for p in particles if p.is_alive()]
 
         # Отрисовка
         background.draw(screen)
@@ -429,8 +811,7 @@ if __name__ == "__main__":
         screen.blit(ghost, (500, 250))
         screen.blit(pipe, (600, 320))
 
-        for p in particles:
-            p.draw(screen)
+        particle_pool.draw(screen)
 
         # Инструкция
         font = pygame.font.Font(None, 24)
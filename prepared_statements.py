@@ -0,0 +1,120 @@
+"""
+Prepared Statements для Mario Clash
+Реестр серверных подготовленных запросов: PREPARE один раз на соединение, потом EXECUTE
+"""
+
+import re
+import threading
+
+from psycopg2 import extensions
+
+
+# SQLSTATE: подготовленного запроса нет / уже существует
+INVALID_STATEMENT_NAME = '26000'
+DUPLICATE_PREPARED_STATEMENT = '42P05'
+
+_PLACEHOLDER = re.compile(r'\$(\d+)')
+
+
+class PreparedStatements:
+    """
+    Горячие запросы пишутся с параметрами $1, $2, ... и выполняются через execute().
+
+    На каждом соединении запрос готовится лениво при первом использовании
+    (набор подготовленных имён хранится прямо на объекте соединения, поэтому
+    новое соединение из пула просто готовит всё заново). Если сервер
+    «забыл» запрос (DISCARD ALL, пересоздание сессии), он готовится повторно.
+    С enabled=False те же запросы идут обычным execute (для сравнения в бенчмарке)
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.statements = {}  # name -> SQL с $n
+        self.plain_sql = {}  # name -> (SQL с %s, порядок параметров)
+        self.prepares = 0
+        self.executions = 0
+        self.recoveries = 0
+
+    def _register(self, name, sql):
+        known = self.statements.get(name)
+        if known is None:
+            with self.lock:
+                self.statements[name] = sql
+        elif known != sql:
+            raise ValueError(f"Prepared statement {name} registered with different SQL")
+
+    @staticmethod
+    def _prepared_on(conn):
+        prepared = getattr(conn, 'prepared_statements', None)
+        if prepared is None:
+            prepared = set()
+            conn.prepared_statements = prepared
+        return prepared
+
+    def execute(self, cur, name, sql, params=()):
+        """Выполнить запрос name (SQL с $1..$n) с параметрами params на курсоре cur"""
+        self._register(name, sql)
+        if not self.enabled:
+            return self._execute_plain(cur, name, sql, params)
+
+        conn = cur.connection
+        prepared = self._prepared_on(conn)
+        # Только если транзакцию начинаем мы, её можно безопасно откатить при восстановлении
+        fresh_transaction = conn.info.transaction_status == extensions.TRANSACTION_STATUS_IDLE
+
+        try:
+            self._prepare_and_execute(cur, prepared, name, sql, params)
+        except Exception as e:
+            code = getattr(e, 'pgcode', None)
+            if code not in (INVALID_STATEMENT_NAME, DUPLICATE_PREPARED_STATEMENT):
+                raise
+            # Набор имён на соединении разошёлся с сервером
+            prepared.clear()
+            if not fresh_transaction:
+                raise
+            conn.rollback()
+            if code == DUPLICATE_PREPARED_STATEMENT:
+                prepared.add(name)
+            with self.lock:
+                self.recoveries += 1
+            self._prepare_and_execute(cur, prepared, name, sql, params)
+
+    def _prepare_and_execute(self, cur, prepared, name, sql, params):
+        if name not in prepared:
+            cur.execute(f"PREPARE {name} AS {sql}")
+            prepared.add(name)
+            with self.lock:
+                self.prepares += 1
+        if params:
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cur.execute(f"EXECUTE {name}")
+        with self.lock:
+            self.executions += 1
+
+    def plain(self, name, sql, params=()):
+        """Тот же запрос для обычного execute: (SQL с %s, параметры по порядку)"""
+        converted = self.plain_sql.get(name)
+        if converted is None:
+            order = [int(n) - 1 for n in _PLACEHOLDER.findall(sql)]
+            converted = (_PLACEHOLDER.sub('%s', sql), order)
+            self.plain_sql[name] = converted
+        text, order = converted
+        return text, [params[i] for i in order]
+
+    def _execute_plain(self, cur, name, sql, params):
+        text, args = self.plain(name, sql, params)
+        cur.execute(text, args or None)
+        with self.lock:
+            self.executions += 1
+
+    def stats(self):
+        """Сколько раз готовили и выполняли запросы"""
+        return {
+            'enabled': self.enabled,
+            'statements': len(self.statements),
+            'prepares': self.prepares,
+            'executions': self.executions,
+            'recoveries': self.recoveries
+        }
@@ -0,0 +1,120 @@
+"""
+Query Cache для Mario Clash
+Кэш результатов запросов в памяти процесса: TTL, ограничение размера, single-flight
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Flight:
+    """Загрузка, которая уже идёт: остальные потоки ждут её результат"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class QueryCache:
+    """
+    Read-through кэш. Ключ - кортеж (пространство, *параметры), например
+    ('leaderboard', None, 10). Пространство используется для TTL, метрик
+    и сброса: invalidate('leaderboard') удаляет все варианты лидерборда.
+
+    Если значения нет, загружает его ровно один поток, остальные ждут
+    (защита от одновременного промаха многих потоков)
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (value, expires)
+        self.flights = {}  # key -> _Flight
+        self.generations = {}  # пространство -> счётчик сбросов
+        self.metrics = {}  # пространство -> {'hits', 'misses', 'waits', 'evictions', 'invalidations'}
+
+    def _metrics(self, namespace):
+        metrics = self.metrics.get(namespace)
+        if metrics is None:
+            metrics = {'hits': 0, 'misses': 0, 'waits': 0, 'evictions': 0, 'invalidations': 0}
+            self.metrics[namespace] = metrics
+        return metrics
+
+    def get_or_load(self, key, loader, ttl):
+        """Значение из кэша или loader() (результат кэшируется на ttl секунд)"""
+        namespace = key[0]
+        with self.lock:
+            metrics = self._metrics(namespace)
+            cached = self.entries.get(key)
+            if cached is not None and time.monotonic() < cached[1]:
+                self.entries.move_to_end(key)
+                metrics['hits'] += 1
+                return cached[0]
+
+            flight = self.flights.get(key)
+            if flight is not None:
+                metrics['waits'] += 1
+                leader = False
+            else:
+                metrics['misses'] += 1
+                flight = _Flight()
+                self.flights[key] = flight
+                generation = self.generations.get(namespace, 0)
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+                # Если пространство сбросили во время загрузки, результат уже мог устареть
+                if flight.error is None and self.generations.get(namespace, 0) == generation:
+                    self._store(key, flight.value, ttl)
+            flight.done.set()
+        return flight.value
+
+    def _store(self, key, value, ttl):
+        """Положить значение (под блокировкой) с вытеснением самых старых"""
+        self.entries[key] = (value, time.monotonic() + ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            old_key, _ = self.entries.popitem(last=False)
+            self._metrics(old_key[0])['evictions'] += 1
+
+    def invalidate(self, *namespaces):
+        """Сбросить все записи указанных пространств (без аргументов - весь кэш)"""
+        with self.lock:
+            if not namespaces:
+                # И пространства, чья первая загрузка ещё идёт: иначе она сохранит данные до сброса
+                namespaces = tuple(set(key[0] for key in self.entries) | set(self.generations) |
+                                   set(key[0] for key in self.flights))
+            targets = set(namespaces)
+            for key in [k for k in self.entries if k[0] in targets]:
+                del self.entries[key]
+            for namespace in targets:
+                self.generations[namespace] = self.generations.get(namespace, 0) + 1
+                self._metrics(namespace)['invalidations'] += 1
+
+    def stats(self):
+        """Метрики по пространствам: попадания, промахи, доля попаданий"""
+        with self.lock:
+            result = {}
+            for namespace, metrics in self.metrics.items():
+                lookups = metrics['hits'] + metrics['misses'] + metrics['waits']
+                result[namespace] = dict(
+                    metrics,
+                    entries=sum(1 for key in self.entries if key[0] == namespace),
+                    hit_rate=(metrics['hits'] + metrics['waits']) / lookups if lookups else 0.0
+                )
+            return result
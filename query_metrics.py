@@ -0,0 +1,176 @@
+"""
+Query Metrics для Mario Clash
+Замер каждого запроса к PostgreSQL: гистограммы по методам, число строк, лог медленных запросов
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+from psycopg2 import extensions
+
+
+# Порог медленного запроса (мс); меняется через MARIO_SLOW_QUERY_MS
+SLOW_QUERY_MS = float(os.environ.get("MARIO_SLOW_QUERY_MS", 200))
+
+# Верхние границы корзин гистограммы задержек (мс)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+# Модули-обёртки: при поиске вызывающего метода их кадры пропускаются
+_SKIPPED_FILES = ('query_metrics.py', 'query_cache.py', 'connection_pool.py', 'prepared_statements.py',
+                  'contextlib.py')
+
+
+def caller_tag():
+    """
+    Имя метода, который выполнил запрос: первый кадр вверх по стеку,
+    не служебный (_helper, <lambda>) и не из модулей-обёрток
+    """
+    frame = sys._getframe(2)
+    depth = 0
+    while frame is not None and depth < 12:
+        code = frame.f_code
+        name = code.co_name
+        if (not name.startswith(('_', '<'))
+                and not code.co_filename.endswith(_SKIPPED_FILES)):
+            return name
+        frame = frame.f_back
+        depth += 1
+    return 'unknown'
+
+
+class QueryMetrics:
+    """Накопление метрик запросов по тегам (имя вызывающего метода)"""
+
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, slow_log_size=50):
+        self.slow_query_ms = slow_query_ms
+        self.lock = threading.Lock()
+        self.tags = {}  # tag -> метрики
+        self.slow_queries = deque(maxlen=slow_log_size)
+        self.on_query = None  # callback(tag, cursor, query, args) до выполнения - для check_query_plans.py
+        self.connection_class = self._make_connection_class()
+
+    def _tag_metrics(self, tag):
+        metrics = self.tags.get(tag)
+        if metrics is None:
+            metrics = {
+                'calls': 0,
+                'errors': 0,
+                'rows': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'buckets': [0] * (len(LATENCY_BUCKETS_MS) + 1)  # Последняя - больше всех границ
+            }
+            self.tags[tag] = metrics
+        return metrics
+
+    def record(self, tag, query, elapsed_ms, rows, failed=False):
+        """Учесть один выполненный запрос"""
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS_MS) and elapsed_ms > LATENCY_BUCKETS_MS[bucket]:
+            bucket += 1
+
+        with self.lock:
+            metrics = self._tag_metrics(tag)
+            metrics['calls'] += 1
+            metrics['total_ms'] += elapsed_ms
+            metrics['max_ms'] = max(metrics['max_ms'], elapsed_ms)
+            metrics['buckets'][bucket] += 1
+            if failed:
+                metrics['errors'] += 1
+            elif rows > 0:
+                metrics['rows'] += rows
+
+        if elapsed_ms >= self.slow_query_ms:
+            text = query.decode('utf-8', 'replace') if isinstance(query, bytes) else str(query)
+            text = ' '.join(text.split())[:200]
+            self.slow_queries.append({'tag': tag, 'ms': elapsed_ms, 'query': text, 'at': time.time()})
+            print(f"⚠ Slow query in {tag}: {elapsed_ms:.1f} ms - {text}")
+
+    @staticmethod
+    def percentile(buckets, fraction):
+        """Оценка перцентиля по гистограмме (верхняя граница корзины)"""
+        total = sum(buckets)
+        if not total:
+            return 0.0
+        threshold = total * fraction
+        seen = 0
+        for index, count in enumerate(buckets):
+            seen += count
+            if seen >= threshold:
+                return float(LATENCY_BUCKETS_MS[index]) if index < len(LATENCY_BUCKETS_MS) else float('inf')
+        return float('inf')
+
+    def snapshot(self):
+        """Копия метрик: по каждому методу calls, rows, avg/max, p50/p95/p99, гистограмма"""
+        with self.lock:
+            result = {}
+            for tag, metrics in self.tags.items():
+                buckets = list(metrics['buckets'])
+                result[tag] = {
+                    'calls': metrics['calls'],
+                    'errors': metrics['errors'],
+                    'rows': metrics['rows'],
+                    'avg_ms': metrics['total_ms'] / metrics['calls'] if metrics['calls'] else 0.0,
+                    'max_ms': metrics['max_ms'],
+                    'p50_ms': self.percentile(buckets, 0.50),
+                    'p95_ms': self.percentile(buckets, 0.95),
+                    'p99_ms': self.percentile(buckets, 0.99),
+                    'histogram': dict(zip([f"<={b}ms" for b in LATENCY_BUCKETS_MS] + ['>5000ms'], buckets))
+                }
+            return {'methods': result, 'slow_queries': list(self.slow_queries)}
+
+    def reset(self):
+        """Обнулить метрики"""
+        with self.lock:
+            self.tags = {}
+            self.slow_queries.clear()
+
+    def _make_connection_class(self):
+        """Класс соединения psycopg2, чьи курсоры замеряют запросы в этот реестр"""
+        metrics = self
+        cursor_classes = {}
+
+        def instrumented(factory):
+            cls = cursor_classes.get(factory)
+            if cls is None:
+                cls = type(f"Instrumented{factory.__name__}", (InstrumentedCursorMixin, factory),
+                           {'metrics': metrics})
+                cursor_classes[factory] = cls
+            return cls
+
+        class InstrumentedConnection(extensions.connection):
+            def cursor(self, *args, **kwargs):
+                factory = kwargs.get('cursor_factory') or self.cursor_factory or extensions.cursor
+                if not issubclass(factory, InstrumentedCursorMixin):
+                    kwargs['cursor_factory'] = instrumented(factory)
+                return super().cursor(*args, **kwargs)
+
+        return InstrumentedConnection
+
+
+class InstrumentedCursorMixin:
+    """Замер execute/executemany курсора psycopg2"""
+
+    metrics = None
+
+    def _timed(self, method, query, args):
+        tag = caller_tag()
+        if self.metrics.on_query is not None:
+            self.metrics.on_query(tag, self, query, args)
+        start = time.perf_counter()
+        try:
+            result = method(query, args)
+        except Exception:
+            self.metrics.record(tag, query, (time.perf_counter() - start) * 1000, 0, failed=True)
+            raise
+        self.metrics.record(tag, query, (time.perf_counter() - start) * 1000, self.rowcount)
+        return result
+
+    def execute(self, query, vars=None):
+        return self._timed(super().execute, query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._timed(super().executemany, query, vars_list)
@@ -0,0 +1,109 @@
+-- Mario Clash: таблицы
+-- Все файлы schema/ идемпотентны (IF NOT EXISTS) и применяются по порядку
+-- через apply_schema.py; применённые версии записываются в schema_migrations.
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id        SERIAL PRIMARY KEY,
+    username       VARCHAR(50) NOT NULL UNIQUE,
+    password       VARCHAR(255) NOT NULL,
+    role           VARCHAR(20) NOT NULL DEFAULT 'player' CHECK (role IN ('player', 'admin')),
+    total_score    INTEGER NOT NULL DEFAULT 0,
+    current_level  INTEGER NOT NULL DEFAULT 1,
+    banned         BOOLEAN NOT NULL DEFAULT FALSE,
+    created_at     TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at     TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Базы, созданные до появления инкрементальных копий (backup_engine.py)
+ALTER TABLE users ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+CREATE TABLE IF NOT EXISTS levels (
+    level_id    INTEGER PRIMARY KEY,
+    title       VARCHAR(100) NOT NULL,
+    max_score   INTEGER NOT NULL DEFAULT 0,
+    difficulty  VARCHAR(20)
+);
+
+-- Базы, где уровни создавались без сложности (DatabaseManager.get_levels её читает)
+ALTER TABLE levels ADD COLUMN IF NOT EXISTS difficulty VARCHAR(20);
+
+CREATE TABLE IF NOT EXISTS achievements (
+    achievement_id  INTEGER PRIMARY KEY,
+    title           VARCHAR(100) NOT NULL,
+    description     TEXT NOT NULL DEFAULT '',
+    icon            VARCHAR(16) NOT NULL DEFAULT '',
+    points          INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS user_progress (
+    progress_id   SERIAL PRIMARY KEY,
+    user_id       INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    level_id      INTEGER NOT NULL REFERENCES levels(level_id),
+    score         INTEGER NOT NULL DEFAULT 0,
+    completed     BOOLEAN NOT NULL DEFAULT FALSE,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    time_spent    INTEGER NOT NULL DEFAULT 0,
+    best_time     INTEGER,
+    completed_at  TIMESTAMP,
+    updated_at    TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS user_achievements (
+    user_achievement_id  SERIAL PRIMARY KEY,
+    user_id              INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    achievement_id       INTEGER NOT NULL REFERENCES achievements(achievement_id),
+    earned_at            TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Каждая сыгранная попытка уровня (только добавление, пишет save_level_progress).
+-- user_progress хранит одну строку на игрока и уровень и перезаписывается,
+-- поэтому дневная статистика (daily_stats.py) считается отсюда
+CREATE TABLE IF NOT EXISTS level_plays (
+    play_id     BIGSERIAL PRIMARY KEY,
+    user_id     INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    level_id    INTEGER NOT NULL REFERENCES levels(level_id),
+    score       INTEGER NOT NULL DEFAULT 0,
+    completed   BOOLEAN NOT NULL DEFAULT FALSE,
+    time_spent  INTEGER NOT NULL DEFAULT 0,
+    played_at   TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Номера событий локального журнала, уже применённых в БД (local_store.py)
+CREATE TABLE IF NOT EXISTS applied_events (
+    event_id    VARCHAR(32) PRIMARY KEY,
+    kind        VARCHAR(40) NOT NULL,
+    applied_at  TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS game_sessions (
+    session_id        VARCHAR(32) PRIMARY KEY,
+    user_id           INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    started_at        TIMESTAMP NOT NULL,
+    ended_at          TIMESTAMP,
+    levels_completed  INTEGER NOT NULL DEFAULT 0,
+    recorded_at       TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Время записи на сервере: сессия пишется в конце игры, офлайн-сессия - ещё позже
+-- (SyncEngine), поэтому инкрементальные копии не могут опираться на started_at
+ALTER TABLE game_sessions ADD COLUMN IF NOT EXISTS recorded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+-- Дневные агрегаты для отчётов (daily_stats.py)
+CREATE TABLE IF NOT EXISTS daily_stats (
+    day                    DATE PRIMARY KEY,
+    new_users              INTEGER NOT NULL DEFAULT 0,
+    active_users           INTEGER NOT NULL DEFAULT 0,
+    scores_earned          BIGINT NOT NULL DEFAULT 0,
+    levels_completed       INTEGER NOT NULL DEFAULT 0,
+    achievements_unlocked  INTEGER NOT NULL DEFAULT 0,
+    refreshed_at           TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Журнал серверных копий create_backup() (клиентские - backup_engine.py)
+CREATE TABLE IF NOT EXISTS backups (
+    backup_id    SERIAL PRIMARY KEY,
+    backup_type  VARCHAR(20) NOT NULL,
+    created_at   TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    users_count  INTEGER NOT NULL,
+    data         JSONB NOT NULL
+);
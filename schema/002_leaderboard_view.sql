@@ -0,0 +1,15 @@
+-- Mario Clash: лидерборд по уровням (get_leaderboard(level_id))
+-- Забаненные игроки не показываются; порядок задаёт запрос:
+-- ORDER BY score DESC, time_spent ASC по индексу user_progress_level_rank_idx.
+
+CREATE OR REPLACE VIEW leaderboard AS
+SELECT
+    up.level_id,
+    up.user_id,
+    u.username,
+    up.score,
+    up.time_spent,
+    up.completed
+FROM user_progress up
+JOIN users u ON u.user_id = up.user_id
+WHERE u.banned = FALSE;
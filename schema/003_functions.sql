@@ -0,0 +1,90 @@
+-- Mario Clash: триггеры и серверные функции
+
+-- users.total_score - сумма лучших результатов по уровням. Триггеры уровня
+-- оператора: один пересчёт на затронутых игроков за оператор (COPY в seed_data.py
+-- и пачки не платят за каждую строку отдельно)
+CREATE OR REPLACE FUNCTION refresh_total_score() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        UPDATE users u
+        SET total_score = COALESCE((SELECT SUM(up.score) FROM user_progress up
+                                    WHERE up.user_id = u.user_id), 0)
+        WHERE u.user_id IN (SELECT DISTINCT user_id FROM changed_old);
+    ELSE
+        UPDATE users u
+        SET total_score = COALESCE((SELECT SUM(up.score) FROM user_progress up
+                                    WHERE up.user_id = u.user_id), 0)
+        WHERE u.user_id IN (SELECT DISTINCT user_id FROM changed_new);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS user_progress_total_score ON user_progress;
+DROP TRIGGER IF EXISTS user_progress_total_score_insert ON user_progress;
+DROP TRIGGER IF EXISTS user_progress_total_score_update ON user_progress;
+DROP TRIGGER IF EXISTS user_progress_total_score_delete ON user_progress;
+
+CREATE TRIGGER user_progress_total_score_insert
+    AFTER INSERT ON user_progress
+    REFERENCING NEW TABLE AS changed_new
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_total_score();
+
+CREATE TRIGGER user_progress_total_score_update
+    AFTER UPDATE ON user_progress
+    REFERENCING NEW TABLE AS changed_new
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_total_score();
+
+CREATE TRIGGER user_progress_total_score_delete
+    AFTER DELETE ON user_progress
+    REFERENCING OLD TABLE AS changed_old
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_total_score();
+
+-- users.updated_at для инкрементальных копий
+CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_touch_updated_at ON users;
+CREATE TRIGGER users_touch_updated_at
+    BEFORE UPDATE ON users
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
+-- Неактивные аккаунты: игроки старше 7 дней, ни разу не сыгравшие.
+-- Условие совпадает с INACTIVE_ACCOUNT_CONDITION в database_manager.py;
+-- DatabaseManager.delete_inactive_accounts удаляет их пачками, эта функция -
+-- одной транзакцией (для ручного запуска на небольшой базе)
+CREATE OR REPLACE FUNCTION delete_inactive_accounts() RETURNS INTEGER AS $$
+DECLARE
+    deleted INTEGER;
+BEGIN
+    DELETE FROM users u
+    WHERE u.role = 'player'
+      AND u.created_at < CURRENT_TIMESTAMP - INTERVAL '7 days'
+      AND NOT EXISTS (SELECT 1 FROM user_progress up WHERE up.user_id = u.user_id);
+    GET DIAGNOSTICS deleted = ROW_COUNT;
+    RETURN deleted;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Серверная копия игровых данных в JSONB (для небольших баз; основной
+-- механизм - потоковые копии backup_engine.py). Возвращает backup_id
+CREATE OR REPLACE FUNCTION create_backup(p_backup_type VARCHAR) RETURNS INTEGER AS $$
+DECLARE
+    new_id INTEGER;
+BEGIN
+    INSERT INTO backups (backup_type, users_count, data)
+    SELECT p_backup_type,
+           (SELECT COUNT(*) FROM users),
+           jsonb_build_object(
+               'users', (SELECT COALESCE(jsonb_agg(u), '[]') FROM users u),
+               'user_progress', (SELECT COALESCE(jsonb_agg(up), '[]') FROM user_progress up),
+               'user_achievements', (SELECT COALESCE(jsonb_agg(ua), '[]') FROM user_achievements ua)
+           )
+    RETURNING backup_id INTO new_id;
+    RETURN new_id;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,64 @@
+-- Mario Clash: индексы под горячие запросы DatabaseManager
+-- check_query_plans.py проверяет, что планы этих запросов на больших таблицах
+-- не содержат Seq Scan.
+
+-- Прогресс: одна строка на (игрок, уровень) - для ON CONFLICT в save_level_progress.
+-- В старых базах сначала схлопываем дубликаты (оставляем лучшую запись)
+DELETE FROM user_progress up
+USING user_progress dup
+WHERE up.user_id = dup.user_id
+  AND up.level_id = dup.level_id
+  AND (up.score, up.progress_id) < (dup.score, dup.progress_id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS user_progress_user_level_key
+    ON user_progress (user_id, level_id);
+
+-- Лидерборд уровня: ORDER BY score DESC, time_spent ASC LIMIT n
+CREATE INDEX IF NOT EXISTS user_progress_level_rank_idx
+    ON user_progress (level_id, score DESC, time_spent);
+
+-- Общий лидерборд, get_user_rank и get_rank_window
+CREATE INDEX IF NOT EXISTS users_leaderboard_rank_idx
+    ON users (banned, total_score DESC, user_id DESC);
+
+-- Достижения: одна строка на (игрок, достижение) - для ON CONFLICT
+CREATE UNIQUE INDEX IF NOT EXISTS user_achievements_user_achievement_key
+    ON user_achievements (user_id, achievement_id);
+
+-- Сессии игрока, последние сначала
+CREATE INDEX IF NOT EXISTS game_sessions_user_idx
+    ON game_sessions (user_id, started_at DESC);
+
+-- Каскадное удаление игрока (delete_inactive_accounts)
+CREATE INDEX IF NOT EXISTS level_plays_user_idx
+    ON level_plays (user_id);
+
+-- Очистка старых записей applied_events
+CREATE INDEX IF NOT EXISTS applied_events_applied_at_idx
+    ON applied_events (applied_at);
+
+-- Пересчёт свежих дней daily_stats и инкрементальные копии - диапазоны по времени
+CREATE INDEX IF NOT EXISTS users_created_at_idx
+    ON users (created_at);
+
+CREATE INDEX IF NOT EXISTS users_updated_at_idx
+    ON users (updated_at);
+
+CREATE INDEX IF NOT EXISTS user_progress_updated_at_idx
+    ON user_progress (updated_at);
+
+CREATE INDEX IF NOT EXISTS level_plays_played_at_idx
+    ON level_plays (played_at);
+
+CREATE INDEX IF NOT EXISTS game_sessions_recorded_at_idx
+    ON game_sessions (recorded_at);
+
+CREATE INDEX IF NOT EXISTS user_achievements_earned_at_idx
+    ON user_achievements (earned_at);
+
+-- Прохождения за день теперь считаются по level_plays
+DROP INDEX IF EXISTS user_progress_completed_at_idx;
+
+ANALYZE users;
+ANALYZE user_progress;
+ANALYZE user_achievements;
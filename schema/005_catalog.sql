@@ -0,0 +1,27 @@
+-- Mario Clash: каталог уровней и достижений
+-- Номера достижений совпадают с Game.check_achievements (MAIN.py)
+-- и правилами DatabaseManager._check_achievements.
+
+INSERT INTO levels (level_id, title, max_score, difficulty) VALUES
+    (1, 'Level 1', 5000, 'easy'),
+    (2, 'Level 2', 5000, 'easy'),
+    (3, 'Level 3', 5000, 'medium'),
+    (4, 'Level 4', 5000, 'hard'),
+    (5, 'Level 5', 5000, 'hard')
+ON CONFLICT (level_id) DO NOTHING;
+
+-- Уровни, созданные до появления столбца difficulty
+UPDATE levels l
+SET difficulty = v.difficulty
+FROM (VALUES (1, 'easy'), (2, 'easy'), (3, 'medium'), (4, 'hard'), (5, 'hard')) AS v (level_id, difficulty)
+WHERE l.level_id = v.level_id AND l.difficulty IS NULL;
+
+INSERT INTO achievements (achievement_id, title, description, icon, points) VALUES
+    (1, 'First Steps', 'Complete Level 1', '🎯', 10),
+    (2, 'Turtle Slayer', 'Kill 50 turtles', 'T', 20),
+    (3, 'Spike Master', 'Kill 20 spike turtles', 'S', 30),
+    (4, 'Speed Runner', 'Complete level in under 60 seconds', '⚡', 30),
+    (5, 'Ghost Hunter', 'Complete Level 3', '👻', 20),
+    (6, 'Perfect Score', 'Get max score on any level', '⭐', 50),
+    (7, 'Completionist', 'Complete all levels', '*', 100)
+ON CONFLICT (achievement_id) DO NOTHING;
@@ -0,0 +1,272 @@
+"""
+Seed Data для Mario Clash
+Генератор синтетических данных: пользователи, прогресс по уровням и достижения
+в масштабе миллионов строк. Данные загружаются через COPY потоком (без сборки
+всего набора в памяти), у всех игроков один заранее посчитанный bcrypt-хеш
+(пароль SEED_PASSWORD), результат воспроизводим по --seed.
+
+Игроки создаются с префиксом имени (по умолчанию seed_), --clear удаляет прошлый набор
+
+Запуск:
+    python seed_data.py --users 1000000 --seed 42
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from database_manager import DatabaseManager
+
+
+SEED_PASSWORD = "seed-password"
+
+# Правила check_achievements: такие достижения выдаются только тем, кто их заслужил
+RULE_ACHIEVEMENTS = (1, 4, 5, 7)
+
+# Доля игроков, которые зарегистрировались и ни разу не сыграли
+IDLE_SHARE = 0.15
+
+# Доля забаненных
+BANNED_SHARE = 0.01
+
+# Как давно зарегистрированы игроки: экспонента со средним в днях, не старше года
+SIGNUP_MEAN_DAYS = 60
+SIGNUP_MAX_DAYS = 365
+
+
+class CopyStream:
+    """
+    Файлоподобный объект для copy_expert: строки генерируются по мере чтения,
+    в памяти - только текущий кусок. Поэтому модели игроков для каждой таблицы
+    строятся заново (они детерминированы), а не хранятся для всех игроков
+    """
+
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.buffer = ''
+        self.rows = 0
+
+    def read(self, size=-1):
+        size = size if size and size > 0 else 1 << 16
+        parts = [self.buffer]
+        length = len(self.buffer)
+        while length < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            parts.append(line)
+            length += len(line)
+            self.rows += 1
+        data = ''.join(parts)
+        self.buffer = data[size:]
+        return data[:size]
+
+
+def copy_value(value):
+    """Значение в текстовом формате COPY"""
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    return str(value)
+
+
+def copy_line(*values):
+    return '\t'.join(copy_value(value) for value in values) + '\n'
+
+
+class PlayerModel:
+    """Детерминированная модель игрока по его номеру и общему seed"""
+
+    def __init__(self, seed, index, levels, achievement_ids, now):
+        rng = random.Random(seed * 1000003 + index)
+        self.index = index
+        self.skill = rng.betavariate(2, 5)  # Много средних игроков, мало сильных
+        self.banned = rng.random() < BANNED_SHARE
+        days = min(rng.expovariate(1.0 / SIGNUP_MEAN_DAYS), SIGNUP_MAX_DAYS)
+        self.created_at = now - timedelta(days=days)
+
+        self.progress = []  # (level_id, score, completed, attempts, time_spent, best_time, completed_at, updated_at)
+        if rng.random() >= IDLE_SHARE:
+            self._play(rng, levels, now)
+        self.total_score = sum(row[1] for row in self.progress)
+        completed = [row for row in self.progress if row[2]]
+        self.current_level = max([row[0] for row in completed], default=0) + 1
+        self.achievements = self._earn(rng, achievement_ids, completed, now)
+
+    def _play(self, rng, levels, now):
+        """Уровни проходятся по порядку; дальше уходят только те, кто прошёл предыдущий"""
+        span = max((now - self.created_at).total_seconds(), 60.0)
+        for level_id, max_score in levels:
+            attempts = 1 + int(rng.expovariate(0.6))
+            time_spent = max(10, int(rng.gauss(200 - 140 * self.skill, 35)))
+            best_time = max(10, min(time_spent, int(time_spent * rng.uniform(0.7, 1.0))))
+            quality = min(1.0, max(0.02, rng.gauss(0.25 + 0.7 * self.skill, 0.15)))
+            score = int(max_score * quality) if max_score else int(5000 * quality)
+            completed = rng.random() < 0.35 + 0.6 * self.skill
+            updated_at = self.created_at + timedelta(seconds=rng.uniform(0, span))
+            self.progress.append((level_id, score, completed, attempts, time_spent, best_time,
+                                  updated_at if completed else None, updated_at))
+            if not completed:
+                break
+
+    def _earn(self, rng, achievement_ids, completed, now):
+        levels_done = {row[0] for row in completed}
+        best_time = min([row[5] for row in completed], default=None)
+        earned_rules = {
+            1: 1 in levels_done,
+            5: 3 in levels_done,
+            4: best_time is not None and best_time < 60,
+            7: len(levels_done) >= 3
+        }
+        result = []
+        for rarity, achievement_id in enumerate(achievement_ids):
+            if achievement_id in RULE_ACHIEVEMENTS:
+                earned = earned_rules[achievement_id]
+            else:
+                # Прочие достижения: чем дальше в списке, тем реже
+                earned = bool(self.progress) and rng.random() < (0.2 + 0.6 * self.skill) * 0.75 ** rarity
+            if earned:
+                result.append((achievement_id, self.created_at + timedelta(
+                    seconds=rng.uniform(0, max((now - self.created_at).total_seconds(), 60.0)))))
+        return result
+
+
+def players(args, levels, achievement_ids, now):
+    for index in range(args.users):
+        yield PlayerModel(args.seed, index, levels, achievement_ids, now)
+
+
+def copy_rows(db, table, columns, lines):
+    """COPY потока строк в таблицу, вернуть (строк, секунд)"""
+    start = time.perf_counter()
+    stream = CopyStream(lines)
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute("SET LOCAL synchronous_commit = off")
+        cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", stream)
+        conn.commit()
+    return stream.rows, time.perf_counter() - start
+
+
+def copy_rows_by_username(db, table, columns, lines):
+    """
+    COPY строк (username, *columns) во временную таблицу и INSERT ... SELECT
+    с user_id из users: user_id находит сервер, клиент не держит словарь игроков.
+    Вернуть (строк, секунд)
+    """
+    start = time.perf_counter()
+    stream = CopyStream(lines)
+    staging = f"seed_{table}"
+    column_list = ', '.join(columns)
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute("SET LOCAL synchronous_commit = off")
+        # Типы столбцов - как в целевой таблице, username - как в users
+        cur.execute(f"""
+            CREATE TEMP TABLE {staging} ON COMMIT DROP AS
+            SELECT u.username, {', '.join(f't.{column}' for column in columns)}
+            FROM {table} t JOIN users u USING (user_id)
+            WITH NO DATA
+        """)
+        cur.copy_expert(f"COPY {staging} (username, {column_list}) FROM STDIN", stream)
+        cur.execute(f"""
+            INSERT INTO {table} (user_id, {column_list})
+            SELECT u.user_id, {', '.join(f's.{column}' for column in columns)}
+            FROM {staging} s JOIN users u USING (username)
+        """)
+        conn.commit()
+    return stream.rows, time.perf_counter() - start
+
+
+def clear(db, prefix):
+    """Удалить игроков прошлого запуска с тем же префиксом"""
+    pattern = prefix.replace('_', '\\_') + '%'
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            DELETE FROM user_achievements
+            WHERE user_id IN (SELECT user_id FROM users WHERE username LIKE %s)
+        """, (pattern,))
+        cur.execute("""
+            DELETE FROM user_progress
+            WHERE user_id IN (SELECT user_id FROM users WHERE username LIKE %s)
+        """, (pattern,))
+        cur.execute("DELETE FROM users WHERE username LIKE %s", (pattern,))
+        print(f"Cleared {cur.rowcount} previously seeded users")
+        conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed Mario Clash with synthetic players")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--prefix", default="seed_", help="username prefix of seeded players")
+    parser.add_argument("--clear", action="store_true", help="delete players seeded with this prefix first")
+    args = parser.parse_args()
+
+    db = DatabaseManager(prepare_statements=False)
+    try:
+        if args.clear:
+            clear(db, args.prefix)
+
+        with db.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT level_id, COALESCE(max_score, 0) FROM levels ORDER BY level_id")
+            levels = cur.fetchall()
+            cur.execute("SELECT achievement_id FROM achievements ORDER BY achievement_id")
+            achievement_ids = [row[0] for row in cur.fetchall()]
+        if not levels:
+            print("✗ The levels table is empty - create levels first")
+            return
+
+        # Один bcrypt на весь набор вместо миллиона
+        password_hash = db.hash_password(SEED_PASSWORD)
+        now = datetime.now()
+        digits = len(str(max(args.users - 1, 0)))
+        started = time.perf_counter()
+
+        def username(player):
+            return f"{args.prefix}{player.index:0{digits}d}"
+
+        rows, seconds = copy_rows(
+            db, "users",
+            ("username", "password", "role", "total_score", "current_level", "banned", "created_at"),
+            (copy_line(username(p), password_hash, 'player', p.total_score,
+                       p.current_level, p.banned, p.created_at.isoformat(sep=' '))
+             for p in players(args, levels, achievement_ids, now)))
+        print(f"✓ users: {rows} rows in {seconds:.1f}s")
+
+        rows, seconds = copy_rows_by_username(
+            db, "user_progress",
+            ("level_id", "score", "completed", "attempts", "time_spent",
+             "best_time", "completed_at", "updated_at"),
+            (copy_line(username(p), level_id, score, completed, attempts, time_spent,
+                       best_time, completed_at.isoformat(sep=' ') if completed_at else None,
+                       updated_at.isoformat(sep=' '))
+             for p in players(args, levels, achievement_ids, now)
+             for level_id, score, completed, attempts, time_spent, best_time, completed_at, updated_at
+             in p.progress))
+        print(f"✓ user_progress: {rows} rows in {seconds:.1f}s")
+
+        rows, seconds = copy_rows_by_username(
+            db, "user_achievements",
+            ("achievement_id", "earned_at"),
+            (copy_line(username(p), achievement_id, earned_at.isoformat(sep=' '))
+             for p in players(args, levels, achievement_ids, now)
+             for achievement_id, earned_at in p.achievements))
+        print(f"✓ user_achievements: {rows} rows in {seconds:.1f}s")
+
+        with db.connection() as conn, conn.cursor() as cur:
+            for table in ("users", "user_progress", "user_achievements"):
+                cur.execute(f"ANALYZE {table}")
+            conn.commit()
+        db.invalidate_queries()
+
+        print(f"Seeded {args.users} players in {time.perf_counter() - started:.1f}s "
+              f"(password for all: {SEED_PASSWORD})")
+    finally:
+        db.close_all_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Spatial Hash для Mario Clash
+Равномерная сетка по слоям глубины для быстрого поиска коллизий
+"""
+
+
+class SpatialHash:
+    """
+    Пространственный индекс: отдельная сетка для каждого слоя и вида объектов.
+    Статичные объекты (платформы, трубы) добавляются один раз на уровень,
+    движущиеся (враги, панцири, снаряды) перераскладываются каждый тик
+    """
+
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.static_cells = {}  # (слой, вид, cx, cy) -> [(порядковый номер, объект)]
+        self.dynamic_cells = {}
+        self.static_kinds = set()  # Виды объектов, лежащие в статичной сетке
+        self.sequence = 0  # Сохраняет порядок добавления для детерминированных результатов
+
+    def cell_range(self, rect):
+        """Диапазоны клеток, которые перекрывает rect"""
+        size = self.cell_size
+        return (range(rect.left // size, (rect.right - 1) // size + 1),
+                range(rect.top // size, (rect.bottom - 1) // size + 1))
+
+    def _insert(self, cells, obj, kind):
+        """Добавить объект во все клетки под его rect"""
+        self.sequence += 1
+        entry = (self.sequence, obj)
+        columns, rows = self.cell_range(obj.rect)
+        layer = obj.depth_layer
+        for cx in columns:
+            for cy in rows:
+                key = (layer, kind, cx, cy)
+                bucket = cells.get(key)
+                if bucket is None:
+                    cells[key] = [entry]
+                else:
+                    bucket.append(entry)
+
+    def insert_static(self, obj, kind):
+        """Добавить неподвижный объект (платформу или трубу)"""
+        self.static_kinds.add(kind)
+        self._insert(self.static_cells, obj, kind)
+
+    def clear_static(self):
+        """Удалить всю статичную геометрию (при смене уровня)"""
+        self.static_cells = {}
+        self.static_kinds = set()
+
+    def rebuild_dynamic(self, groups):
+        """Перераскладывание движущихся объектов: groups = {вид: итерируемое спрайтов}"""
+        self.dynamic_cells = {}
+        for kind, sprites in groups.items():
+            for obj in sprites:
+                self._insert(self.dynamic_cells, obj, kind)
+
+    def query(self, rect, depth_layer, kind):
+        """Объекты вида kind в слое depth_layer, чьи клетки пересекаются с rect"""
+        cells = self.static_cells if kind in self.static_kinds else self.dynamic_cells
+        columns, rows = self.cell_range(rect)
+        found = {}
+        for cx in columns:
+            for cy in rows:
+                bucket = cells.get((depth_layer, kind, cx, cy))
+                if bucket:
+                    for seq, obj in bucket:
+                        found[seq] = obj
+
+        # В порядке добавления, как при переборе группы спрайтов
+        return [found[seq] for seq in sorted(found)]
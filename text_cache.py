@@ -0,0 +1,90 @@
+"""
+Text Cache для Mario Clash
+Общий реестр шрифтов и кэш отрендеренного текста
+"""
+
+import pygame
+from collections import OrderedDict
+
+
+# Реестр шрифтов: (имя файла, размер) -> Font
+_fonts = {}
+
+
+def get_font(size, name=None):
+    """Общий шрифт заданного размера (создаётся один раз на процесс)"""
+    key = (name, size)
+    font = _fonts.get(key)
+    if font is None:
+        font = pygame.font.Font(name, size)
+        _fonts[key] = font
+    return font
+
+
+class TextCache:
+    """LRU-кэш поверхностей текста по ключу (шрифт, текст, цвет, сглаживание)"""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def render(self, font, text, color, antialias=True):
+        """
+        Отрендерить текст или взять готовую поверхность из кэша.
+        Поверхность общая - не изменяйте её (set_alpha и т.п. делайте на copy())
+        """
+        key = (font, text, tuple(color), antialias)
+        surface = self.entries.get(key)
+        if surface is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self.entries[key] = surface
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return surface
+
+    def stats(self):
+        """Статистика кэша"""
+        total = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+
+# Единый кэш текста для игры, меню и экрана авторизации
+text_cache = TextCache()
+
+
+def render_text(font, text, color, antialias=True):
+    """Отрендерить текст через общий кэш"""
+    return text_cache.render(font, text, color, antialias)
+
+
+class CachedLabel:
+    """Надпись, которая перерисовывается только при изменении текста (счётчики HUD)"""
+
+    def __init__(self, font, color, antialias=True):
+        self.font = font
+        self.color = color
+        self.antialias = antialias
+        self.text = None
+        self.surface = None
+
+    def render(self, text):
+        """Поверхность для текста (новая только если текст изменился)"""
+        if text != self.text:
+            self.text = text
+            self.surface = self.font.render(text, self.antialias, self.color)
+        return self.surface